@@ -5,7 +5,7 @@ Class to audit the state of models retained
 import pandas as pd
 import numpy as np
 import pathlib
-import matplotlib.pyplot as plt
+from core.model_log import ModelLog
 
 
 class Audit(object):
@@ -13,8 +13,7 @@ class Audit(object):
     def __init__(self):
         path = str(pathlib.Path().absolute())
         saved_models_dir = path + "/saved_models/"
-        log_loc = saved_models_dir + "model_log.csv"
-        log = pd.read_csv(log_loc)
+        log = ModelLog(saved_models_dir = saved_models_dir).to_frame()
 
         # some metrics on overal performance, based on model_log.csv
         acc_means = []
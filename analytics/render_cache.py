@@ -0,0 +1,101 @@
+"""
+In-process cache of rendered visualisations and the summary frames they are made from, keyed by a hash of the
+aggregated results, so repeated requests for the same results don't recompute or re-render anything
+"""
+
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import os
+import pandas as pd
+from pandas import DataFrame
+
+
+def frame_hash(df: DataFrame) -> str:
+    """
+    Def to hash the contents of a DataFrame, including its column names and index
+    :param df: DataFrame
+    :return: str
+            sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(list(df.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index = True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _size_of(value) -> int:
+    if isinstance(value, DataFrame):
+        return int(value.memory_usage(index = True, deep = True).sum())
+    return len(value)
+
+
+class RenderCache(object):
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20):
+        """
+        LRU cache of summary frames and rendered html
+        :param max_bytes: int
+                OPTIONAL - approximate maximum size of the cached values, once exceeded the least recently used values
+                are evicted
+        """
+        if max_bytes < 0:
+            raise ValueError("ValueError: render cache size can not be negative")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._values = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key: tuple):
+        """
+        Method to get a cached value
+        :param key: tuple
+                e.g. (frame_hash of the aggregated results, name of the figure, figure parameters)
+        :return: DataFrame or str
+                a copy of the cached summary frame, the cached html, or None if it isn't cached
+        """
+        with self._lock:
+            if key not in self._values:
+                return None
+            self._values.move_to_end(key)
+            value = self._values[key][0]
+        return value.copy() if isinstance(value, DataFrame) else value
+
+    def set(self, key: tuple, value) -> None:
+        """
+        Method to cache a value, values bigger than the cache are not cached
+        :param key: tuple
+                e.g. (frame_hash of the aggregated results, name of the figure, figure parameters)
+        :param value: DataFrame or str
+                summary frame or rendered html
+        :return: nothing
+        """
+        size = _size_of(value)
+        if isinstance(value, DataFrame):
+            # callers may go on to change their frame
+            value = value.copy()
+        with self._lock:
+            if key in self._values:
+                self.size -= self._values.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._values[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self._values.popitem(last = False)[1][1]
+
+    def clear(self) -> None:
+        """
+        Method to remove everything from the cache
+        :return: nothing
+        """
+        with self._lock:
+            self._values.clear()
+            self.size = 0
+
+
+# shared cache, size in MB can be configured with the APPLE_RENDER_CACHE_MB environment variable
+render_cache = RenderCache(max_bytes = int(float(os.environ.get("APPLE_RENDER_CACHE_MB", 64)) * 2 ** 20))
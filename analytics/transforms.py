@@ -4,43 +4,38 @@ Def used to transform data for various analytics outputs
 
 from pandas import DataFrame
 import pandas as pd
+import numpy as np
+
+
+def correct_predictions(df: DataFrame, user_prediction_cols: list) -> DataFrame:
+    """
+    Def used to calculate if each predictor made a correct or incorrect prediction by comparing every user prediction
+    column to FTR at once
+    :param df: DataFrame
+            DataFrame of predictions and full time results
+    :param user_prediction_cols: list
+            Names of the user prediction columns e.g. "AB Prediction"
+    :return: DataFrame
+            a column for each predictor (e.g. "AB"), 1 where the prediction is correct, 0 if not
+    """
+    predictors = [col.replace(" Prediction", "") for col in user_prediction_cols]
+    correct = df[user_prediction_cols].to_numpy() == df["FTR"].to_numpy()[:, np.newaxis]
+    return DataFrame(correct.astype(np.int64), columns = predictors, index = df.index)
 
 
 def calculate_accuracy(df: DataFrame, user_prediction_cols: list, week: str = None) -> DataFrame:
     """
-    Def used to calculate the accuracyt
+    Def used to calculate the accuracy
     :param df: DataFrame to calculate accuracy for
-    :param user_prediction_cols:
+    :param user_prediction_cols: list
+            Names of the user prediction columns e.g. "AB Prediction"
     :param week: str Optional
     :return: DataFrame
             Accuracy of user predictions
     """
-
-    def correct_pred(col1: str, col2: str) -> int:
-        """
-        Def used to calculate if a predictor made a correct or incoorect prediction by comparing user
-        predictions to FTR row by row.
-        :param col1: str
-                Name of user column for calculate if the prediction is correct
-        :param col2: str
-                Name of the FTR column used to calculate if prediction is correct
-        :return: int
-                1 if prediction is correct, 0 if not
-        """
-        if col1 == col2:
-            return 1
-        else:
-            return 0
-
-    # find the number of matches that were predicted that week
+    # find the number of matches that were predicted
     no_matches = df.shape[0]
-    # get the name of the predictors
-    predictors = [col.replace(" Prediction", "") for col in user_prediction_cols]
-    df.to_csv("~/Desktop/intermediate_check.csv")
-    for i in range(0,len(predictors)):
-        df[predictors[i]] = df.apply(lambda x: correct_pred(x[user_prediction_cols[i]], x['FTR']), axis = 1)
-    summed_filtered_df = df.sum()
-    summed_filtered_df = summed_filtered_df[predictors]
+    summed_filtered_df = correct_predictions(df, user_prediction_cols).sum()
     summed_results_df = pd.DataFrame(
         {'Predictor': summed_filtered_df.index, 'Correct Predictions': summed_filtered_df.values})
     if week:
@@ -65,24 +60,21 @@ def calculate_accuracy_transform(df: DataFrame, mode: str) -> DataFrame:
     user_prediction_cols = [column for column in input_df_columns if "Prediction" in column]
 
     if mode == "weekly":
-        # define the empty transformed (and output) df
+        # sum the correct predictions of every predictor for every week in one groupby
+        grouped = correct_predictions(df, user_prediction_cols).groupby(df["Week"], sort = True)
+        summed = grouped.sum()
+        # the number of matches that were predicted each week
+        no_matches = grouped.size()
+        weeks = np.repeat(summed.index.to_numpy(), summed.shape[1])
+        correct = summed.to_numpy().ravel()
         accuracy_transform_df = pd.DataFrame(
-            columns = ['Predictor', 'Correct Predictions', 'Week', 'Accuracy of Predictions (%)'])
-
-        weeks_present = set(df["Week"].to_list())
-
-        #  filter for each week
-        for week in weeks_present:
-            # filter to only show one week
-            filtered_df = df[df["Week"] == week].reset_index()
-            summed_results_df = calculate_accuracy(filtered_df, user_prediction_cols, week = week)
-            accuracy_transform_df = pd.concat([accuracy_transform_df, summed_results_df], ignore_index = True)
+            {'Predictor': np.tile(summed.columns.to_numpy(dtype = object), summed.shape[0]),
+             'Correct Predictions': correct,
+             'Week': weeks,
+             'Accuracy of Predictions (%)': (correct / np.repeat(no_matches.to_numpy(), summed.shape[1])) * 100})
 
     elif mode == "overall":
-        accuracy_transform_df = pd.DataFrame(
-            columns = ['Predictor', 'Correct Predictions', 'Accuracy of Predictions (%)'])
-        summed_results_df = calculate_accuracy(df, user_prediction_cols)
-        accuracy_transform_df = pd.concat([accuracy_transform_df, summed_results_df], ignore_index = True)
+        accuracy_transform_df = calculate_accuracy(df, user_prediction_cols)
 
     else:
         raise Exception
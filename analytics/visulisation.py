@@ -1,31 +1,74 @@
+"""
+Plotly visualisations of predictor performance, plotly and IPython are imported on first use as they are slow to
+import. Summary frames and rendered html are kept in a render cache keyed by a hash of the aggregated results
+"""
+
 from pathlib import Path
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+from pandas import DataFrame
 from analytics.transforms import calculate_accuracy_transform, winners_from_dataframe
+from analytics.render_cache import RenderCache, render_cache, frame_hash
 from core.loaders import load_json_or_csv
-from IPython.display import display
 
 pd.options.mode.chained_assignment = None
 
 
 class Visualisation(object):
 
-    def __init__(self, show_visualisations: bool, aggregated_data_filepath: str):
+    def __init__(self, show_visualisations: bool, aggregated_data_filepath: str = None,
+                 aggregated_data: DataFrame = None, cache: RenderCache = render_cache):
         """
         :param show_visualisations: bool
         :param aggregated_data_filepath: str
-                Relative filepath of aggregated results file to load
+                OPTIONAL - Relative filepath of aggregated results file to load, required if aggregated_data isn't
+                passed
+        :param aggregated_data: DataFrame
+                OPTIONAL - aggregated results, e.g. from StrudelInterface.get_predictions_and_ftrs
+        :param cache: RenderCache
+                OPTIONAL - cache of summary frames and rendered html, defaults to the cache shared by the process
         """
         self.show_visualisations = show_visualisations
         # define path
         self.path = str(Path().absolute())
-        # user loader to load aggregated results file
-        self.aggregated_results = load_json_or_csv(self.path + "/" + aggregated_data_filepath)
+        if aggregated_data is not None:
+            self.aggregated_results = aggregated_data
+        elif aggregated_data_filepath is not None:
+            # user loader to load aggregated results file
+            self.aggregated_results = load_json_or_csv(self.path + "/" + aggregated_data_filepath)
+        else:
+            raise ValueError("ValueError: Either aggregated_data_filepath or aggregated_data must be passed")
+        self.cache = cache
+        self.aggregated_results_hash = frame_hash(self.aggregated_results)
         # use calculate_accuracy_transform def to create the weekly summed
-        self.weekly_summed = calculate_accuracy_transform(self.aggregated_results, mode = "weekly")
+        self.weekly_summed = self._summary(self.aggregated_results, mode = "weekly")
         self.total_summed = None
 
+    def _summary(self, df: DataFrame, mode: str, metric: str = None) -> DataFrame:
+        # calculate_accuracy_transform of the aggregated results (or the results filtered by metric), from the cache
+        # if it has already been calculated
+        key = (self.aggregated_results_hash, "summary", mode, metric)
+        summary = self.cache.get(key)
+        if summary is None:
+            summary = calculate_accuracy_transform(df, mode = mode)
+            self.cache.set(key, summary)
+        return summary
+
+    def _render(self, build_figure, output_filepath: str, figure_name: str, **params) -> None:
+        # only build the figure if it needs showing or its html isn't cached, the cached html is reused as is so
+        # uploads of unchanged visualisations can be skipped
+        key = (self.aggregated_results_hash, figure_name, tuple(sorted(params.items())))
+        html = self.cache.get(key)
+        if html is None or self.show_visualisations:
+            fig = build_figure()
+            if self.show_visualisations:
+                fig.show()
+            if html is None:
+                html = fig.to_html(include_plotlyjs = "cdn", full_html = False)
+                self.cache.set(key, html)
+        if output_filepath:
+            with open(output_filepath, "w", encoding = "utf-8") as html_file:
+                html_file.write(html)
+
     def predictor_team_history(self, predictor: str, team: str) -> None:
         """
         Showss a user's predictions involving a given team in tabular format
@@ -39,6 +82,7 @@ class Visualisation(object):
             self.aggregated_results["HomeTeam"] == team)]
         cols_to_display = ["Date", "Time", "Week", "HomeTeam", "AwayTeam", predictor + " Prediction"]
         df_to_display = f_df[cols_to_display]
+        from IPython.display import display
         display(df_to_display)
 
     def volatility(self, output_filepath: str = None) -> None:
@@ -51,18 +95,19 @@ class Visualisation(object):
                 can be specified
         :return: nothing
         """
-        fig_violin = px.violin(self.weekly_summed,
-                               y = "Accuracy of Predictions (%)",
-                               x = "Predictor", points = "all",
-                               box = True,
-                               hover_data = self.weekly_summed.columns,
-                               template = "simple_white")
-        # set range of axes
-        fig_violin.update_yaxes(range = [0, 100])
-        if self.show_visualisations:
-            fig_violin.show()
-        if output_filepath:
-            fig_violin.write_html(output_filepath, include_plotlyjs= "cdn", full_html = False)
+        def build_figure():
+            import plotly.express as px
+            fig_violin = px.violin(self.weekly_summed,
+                                   y = "Accuracy of Predictions (%)",
+                                   x = "Predictor", points = "all",
+                                   box = True,
+                                   hover_data = self.weekly_summed.columns,
+                                   template = "simple_white")
+            # set range of axes
+            fig_violin.update_yaxes(range = [0, 100])
+            return fig_violin
+
+        self._render(build_figure, output_filepath, "volatility")
 
     def time_series(self, output_filepath: str = None) -> None:
         """
@@ -72,15 +117,15 @@ class Visualisation(object):
                 Absolute filepath that output will be saved to.
         :return: nothing
         """
-        fig_ts = px.line(self.weekly_summed,
-                         x = "Week",
-                         y = "Accuracy of Predictions (%)",
-                         color = "Predictor",
-                         hover_name = "Predictor")
-        if self.show_visualisations:
-            fig_ts.show()
-        if output_filepath:
-            fig_ts.write_html(output_filepath, include_plotlyjs= "cdn", full_html = False)
+        def build_figure():
+            import plotly.express as px
+            return px.line(self.weekly_summed,
+                           x = "Week",
+                           y = "Accuracy of Predictions (%)",
+                           color = "Predictor",
+                           hover_name = "Predictor")
+
+        self._render(build_figure, output_filepath, "time_series")
 
     def stratified_performance(self, metric: str, output_filepath: str = None) -> None:
         """
@@ -101,16 +146,17 @@ class Visualisation(object):
         f_df = self.aggregated_results[(self.aggregated_results["AwayTeam"].isin(sp_filter)) | (
             self.aggregated_results["HomeTeam"].isin(sp_filter))]
         # calculate the accuracy transform
-        f_df_accuracy_transform = calculate_accuracy_transform(f_df, mode = "overall")
-        fig_sp = px.bar_polar(f_df_accuracy_transform,
-                              r = "Accuracy of Predictions (%)",
-                              theta = "Predictor",
-                              color = "Predictor",
-                              template = "simple_white")
-        if self.show_visualisations:
-            fig_sp.show()
-        if output_filepath:
-            fig_sp.write_html(output_filepath, include_plotlyjs= "cdn", full_html = False)
+        f_df_accuracy_transform = self._summary(f_df, mode = "overall", metric = metric)
+
+        def build_figure():
+            import plotly.express as px
+            return px.bar_polar(f_df_accuracy_transform,
+                                r = "Accuracy of Predictions (%)",
+                                theta = "Predictor",
+                                color = "Predictor",
+                                template = "simple_white")
+
+        self._render(build_figure, output_filepath, "stratified_performance", metric = metric)
 
     def weekly_winner(self, output_filepath: str = None) -> None:
         """
@@ -128,17 +174,18 @@ class Visualisation(object):
         this_week_summed["Accuracy of Predictions (%)"] = this_week_summed["Accuracy of Predictions (%)"].apply(
             lambda x: round(x, decimals))
         this_week_summed = this_week_summed.sort_values(by = "Accuracy of Predictions (%)", ascending = False)
-        fig = go.Figure(data = [go.Table(
-            header = dict(values = list(this_week_summed.columns),
-                          align = 'left'),
-            cells = dict(values = [this_week_summed["Predictor"], this_week_summed["Correct Predictions"], this_week_summed["Week"], this_week_summed["Accuracy of Predictions (%)"]],
-                         align = 'left'))
-        ])
+
+        def build_figure():
+            import plotly.graph_objects as go
+            return go.Figure(data = [go.Table(
+                header = dict(values = list(this_week_summed.columns),
+                              align = 'left'),
+                cells = dict(values = [this_week_summed["Predictor"], this_week_summed["Correct Predictions"], this_week_summed["Week"], this_week_summed["Accuracy of Predictions (%)"]],
+                             align = 'left'))
+            ])
+
         winner = winners_from_dataframe(this_week_summed, find_max_of = "Accuracy of Predictions (%)", get_winners_from = "Predictor")
-        if self.show_visualisations:
-            fig.show()
-        if output_filepath:
-            fig.write_html(output_filepath, include_plotlyjs= "cdn", full_html = False)
+        self._render(build_figure, output_filepath, "weekly_winner")
 
     def total_winner(self, output_filepath: str = None) -> None:
         """
@@ -148,20 +195,21 @@ class Visualisation(object):
                 Absolute filepath that output will be saved to.
         :return: nothing
         """
-        self.total_summed = calculate_accuracy_transform(self.aggregated_results, mode = "overall")
+        self.total_summed = self._summary(self.aggregated_results, mode = "overall")
         self.total_summed = self.total_summed.sort_values(by = "Accuracy of Predictions (%)", ascending = False)
         decimals = 1
         self.total_summed["Accuracy of Predictions (%)"] = self.total_summed["Accuracy of Predictions (%)"].apply(lambda x: round(x, decimals))
-        fig = go.Figure(data = [go.Table(
-            header = dict(values = list(self.total_summed.columns),
-                          align = 'left'),
-            cells = dict(values = [self.total_summed["Predictor"],
-                                   self.total_summed["Correct Predictions"],
-                                   self.total_summed["Accuracy of Predictions (%)"]],
-                         align = 'left'))
-        ])
+
+        def build_figure():
+            import plotly.graph_objects as go
+            return go.Figure(data = [go.Table(
+                header = dict(values = list(self.total_summed.columns),
+                              align = 'left'),
+                cells = dict(values = [self.total_summed["Predictor"],
+                                       self.total_summed["Correct Predictions"],
+                                       self.total_summed["Accuracy of Predictions (%)"]],
+                             align = 'left'))
+            ])
+
         winner = winners_from_dataframe(self.total_summed, find_max_of = "Accuracy of Predictions (%)", get_winners_from = "Predictor")
-        if self.show_visualisations:
-            fig.show()
-        if output_filepath:
-            fig.write_html(output_filepath, include_plotlyjs = "cdn", full_html = False)
+        self._render(build_figure, output_filepath, "total_winner")
@@ -0,0 +1,65 @@
+"""
+Benchmark of the import time and resident memory of the service (main.py) and the modules it uses, each module is
+imported in a fresh interpreter. Exits with an error if importing main takes longer than the startup budget
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# modules that are slow to import, none should be imported by main at startup
+heavy_modules = ["torch", "sklearn", "selenium", "fuzzywuzzy", "plotly", "IPython", "matplotlib"]
+
+_probe = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - start
+print(json.dumps({{"import_time": import_time,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "heavy_modules": [m for m in {heavy_modules!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str) -> dict:
+    """
+    Def to import a module in a fresh interpreter and measure it
+    :param module: str
+            dotted name of the module to import
+    :return: dict
+            "import_time" in seconds, peak resident memory "max_rss_mb" and the "heavy_modules" that were imported
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH = repo_dir + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    # run from a temporary directory so any files created on import (e.g. the users db) don't touch the repo
+    with tempfile.TemporaryDirectory() as working_dir:
+        output = subprocess.run([sys.executable, "-c", _probe.format(module = module, heavy_modules = heavy_modules)],
+                                cwd = working_dir, env = env, stdout = subprocess.PIPE, check = True).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--modules", nargs = "+",
+                        default = ["main", "core.APPLE", "analytics.visulisation", "core.numpy_predict",
+                                   "core.predict"])
+    parser.add_argument("--repeats", type = int, default = 3, help = "imports of each module, the best is reported")
+    parser.add_argument("--budget", type = float, default = 2.0, help = "seconds importing main may take")
+    args = parser.parse_args()
+
+    print("{:>24} {:>12} {:>12}  {}".format("module", "import (s)", "rss (MB)", "heavy modules imported"))
+    main_import_time = None
+    for module in args.modules:
+        results = [measure(module) for _ in range(args.repeats)]
+        best = min(results, key = lambda result: result["import_time"])
+        print("{:>24} {:>12.3f} {:>12.1f}  {}".format(module, best["import_time"], best["max_rss_mb"],
+                                                      ", ".join(best["heavy_modules"]) or "-"))
+        if module == "main":
+            main_import_time = best["import_time"]
+
+    if main_import_time is not None and main_import_time > args.budget:
+        sys.exit("Importing main took {:.3f}s, over the startup budget of {:.1f}s".format(main_import_time,
+                                                                                         args.budget))
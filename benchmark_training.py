@@ -0,0 +1,75 @@
+"""
+Benchmark of training throughput (samples/sec) of the DataLoader and the pre-tensorized data paths
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from torch import nn
+import torch.optim as optim
+import core.data_processing as dp
+from core.nnet import NNet, train
+
+feature_cols = ["B365A", "B365D", "B365H", "BWA", "BWD", "BWH", "PSA", "PSD", "PSH", "WHA", "WHD", "WHH"]
+
+
+def synthetic_data(rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Def to create synthetic raw data with the same columns as the preprocessed football-data.co.uk data
+    :param rows: int
+            number of rows (games) to create
+    :param seed: int
+            random seed
+    :return: DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(data = rng.uniform(1.01, 15, size = (rows, len(feature_cols))), columns = feature_cols)
+    df.insert(0, "FTR", rng.choice([0, 1, 2], size = rows, p = [0.45, 0.3, 0.25]))
+    return df
+
+
+def throughput(raw_data: pd.DataFrame, batch_size: int, tensorized: bool, balancing: str, epochs: int) -> float:
+    """
+    Def to measure the training throughput of one data path
+    :return: float
+            training samples per second
+    """
+    train_dataloader, test_dataloader, _, _ = dp.processing(input_df = raw_data.copy(),
+                                                            test_size = 0.2,
+                                                            train_batch_size = batch_size,
+                                                            balancing = balancing,
+                                                            tensorized = tensorized)
+    samples = sum(len(labels) for _, labels in train_dataloader) * epochs
+    net = NNet()
+    optimiser = optim.AdamW(net.parameters(), lr = 0.001, weight_decay = 0.001)
+    lr_scheduler = optim.lr_scheduler.OneCycleLR(optimizer = optimiser, max_lr = 0.001, epochs = epochs,
+                                                 steps_per_epoch = len(train_dataloader))
+    start = time.perf_counter()
+    train(nn = net,
+          train_dataloder = train_dataloader,
+          test_dataloder = test_dataloader,
+          epochs = epochs,
+          criterion = nn.CrossEntropyLoss(),
+          optimiser = optimiser,
+          lr_scheduler = lr_scheduler,
+          verbose = False)
+    return samples / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--rows", type = int, default = 1140, help = "rows of synthetic raw data, default 3 seasons")
+    parser.add_argument("--epochs", type = int, default = 1)
+    parser.add_argument("--balancing", default = "weighted_sampler")
+    parser.add_argument("--batch-sizes", type = int, nargs = "+", default = [5, 256, 4096])
+    args = parser.parse_args()
+
+    raw_data = synthetic_data(rows = args.rows)
+    print("{:>12} {:>12} {:>16}".format("path", "batch size", "samples/sec"))
+    # the DataLoader path is only run with the batch size currently used by Train
+    print("{:>12} {:>12} {:>16.0f}".format("dataloader", 5, throughput(raw_data, 5, False, args.balancing,
+                                                                          args.epochs)))
+    for batch_size in args.batch_sizes:
+        print("{:>12} {:>12} {:>16.0f}".format("tensorized", batch_size,
+                                               throughput(raw_data, batch_size, True, args.balancing, args.epochs)))
@@ -1,16 +1,16 @@
 """
-APPLE API
+APPLE API. Modules that import torch or sklearn are imported by the methods that use them, so importing APPLE (e.g.
+when the REST API starts) stays cheap
 """
 
-from core.train import Train
-from core.predict import Predict
+from core.numpy_predict import NumpyPredict, fused_model_path
 from core.data_mining import user_file_overwrite_check
 from core.cleanup import cleanup
-from core.backtest import Backtest
+from core.model_log import ModelLog
 from core.loaders import load_json_or_csv
 from core.strudel_interface import StrudelInterface
-from core.data_processing import team_name_standardisation, clean_mined_data
 import pandas as pd
+from pandas import DataFrame
 import os
 from termcolor import colored
 from pathlib import Path
@@ -19,8 +19,8 @@ from pathlib import Path
 class APPLE(object):
 
     def __init__(self, use_strudel: bool,
-                 fixtures_to_predict: str,
-                 data_for_predictions: str,
+                 fixtures_to_predict,
+                 data_for_predictions,
                  job_name: str,
                  start_date: str = None,
                  end_date: str = None):
@@ -28,12 +28,12 @@ class APPLE(object):
         Constructor loads file into memory, creates file paths, results directories and merges data and fixtures file
         :param use_strudel: bool
                 whether to get fixtures to predict from STRUDEL or not
-        :param fixtures_to_predict: str Optional
-                filepath of the file that contains the fixtures to predict, or if using STRUDEL the filepath where
-                obtained user predictions are saved. Only needs to be passed if fixtures to predict file needs to be saved
-                locally
-        :param data_for_predictions: str
-                filepath for the data a model will use for predictions, file should be json or csv
+        :param fixtures_to_predict: str or DataFrame Optional
+                filepath of the file that contains the fixtures to predict, or the fixtures themselves, or if using
+                STRUDEL the filepath where obtained user predictions are saved. Only needs to be passed if fixtures to
+                predict file needs to be saved locally, pass None otherwise
+        :param data_for_predictions: str or DataFrame
+                filepath for the data a model will use for predictions, file should be json or csv, or the data itself
                 or id for the mined_data object stored in STRUDEL if use_strudel is True
         :param job_name: str
                 name / ID of the job, this will determine the name of the output directory
@@ -46,7 +46,8 @@ class APPLE(object):
         """
         # define path for making dirs and navigating
         self.path = str(Path().absolute())
-        fixtures_to_predict = self.path + "/" + fixtures_to_predict
+        if isinstance(fixtures_to_predict, str):
+            fixtures_to_predict = self.path + "/" + fixtures_to_predict
 
         # set credentials
         if os.system("echo ${}".format("GCP_PROJECT")):
@@ -63,25 +64,33 @@ class APPLE(object):
                                  "specified")
             else:
                 strudel_connection = StrudelInterface(credentials_filepath = credentials)
-                strudel_connection.get_fixtures_and_user_predictions(start_date = start_date,
-                                                                     end_date = end_date,
-                                                                     output_loc = fixtures_to_predict)
-                if data_for_predictions.isnumeric():
+                # the fixtures to predict, these are also user predictions. They are only saved if a filepath is given
+                self.fixtures_to_predict = strudel_connection.get_fixtures_and_user_predictions(
+                    start_date = start_date,
+                    end_date = end_date,
+                    output_loc = fixtures_to_predict if isinstance(fixtures_to_predict, str) else None)
+                if isinstance(data_for_predictions, DataFrame):
+                    data_for_predictions_to_merge = data_for_predictions
+                elif data_for_predictions.isnumeric():
                     # if data_for_predictions is a number this means it's an ID that can be used to grab the data from
                     # STRUDEL so do so
-                    output_filepath_for_mined_data = self.path + "/temporary_data/" + job_name + "/mined_data_id_" + data_for_predictions + ".json"
-                    strudel_connection.get_mined_data(mined_data_id = data_for_predictions, output_filepath = output_filepath_for_mined_data)
-                    data_for_predictions = output_filepath_for_mined_data
+                    data_for_predictions_to_merge = strudel_connection.get_mined_data(
+                        mined_data_id = data_for_predictions)
                 else:
                     raise Exception("Got filepath not id, cannot query mined_data from Strudel")
         else:
-            data_for_predictions = self.path + "/" + data_for_predictions
-
-        # load in the fixtures to predict, these are also user predictions
-        self.fixtures_to_predict = load_json_or_csv(filepath = fixtures_to_predict)
+            # load in the fixtures to predict, these are also user predictions
+            if isinstance(fixtures_to_predict, DataFrame):
+                self.fixtures_to_predict = fixtures_to_predict
+            else:
+                self.fixtures_to_predict = load_json_or_csv(filepath = fixtures_to_predict)
+            # load in the data to use to make predictions (the features to give to the model)
+            if isinstance(data_for_predictions, DataFrame):
+                data_for_predictions_to_merge = data_for_predictions
+            else:
+                data_for_predictions_to_merge = load_json_or_csv(filepath = self.path + "/" + data_for_predictions)
 
-        # load in the data to use to make predictions (the features to give to the model)
-        data_for_predictions_to_merge = load_json_or_csv(filepath = data_for_predictions)
+        from core.data_processing import team_names_standardisation, clean_mined_data
 
         # clean data_for_predictions_to_merge (mined data) - this is conversion from british style odds
         # to european ones
@@ -91,10 +100,8 @@ class APPLE(object):
         # to predict
         fixtures_to_predict = self.fixtures_to_predict[["HomeTeam", "AwayTeam", "Week", "FixtureID"]]
         # standardise team names to make sure merge happens correctly
-        fixtures_to_predict["HomeTeam"] = fixtures_to_predict.apply(lambda x: team_name_standardisation(x["HomeTeam"]),
-                                                                    axis = 1)
-        fixtures_to_predict["AwayTeam"] = fixtures_to_predict.apply(lambda x: team_name_standardisation(x["AwayTeam"]),
-                                                                    axis = 1)
+        fixtures_to_predict["HomeTeam"] = team_names_standardisation(fixtures_to_predict["HomeTeam"])
+        fixtures_to_predict["AwayTeam"] = team_names_standardisation(fixtures_to_predict["AwayTeam"])
         # merge the fixtures and data
         self.fixtures_and_data_for_prediction = fixtures_to_predict.merge(data_for_predictions_to_merge,
                                                                           how = "outer",
@@ -115,33 +122,80 @@ class APPLE(object):
         self._upper_limit = None
         self._prct_to_remove = None
 
-    def run(self, return_results: bool = False):
+    def run(self, return_results: bool = False, ensemble_size: int = 1, models_to_train: int = 1,
+            training_time_budget: float = None, backend: str = "torch"):
         """
         Method to make predictions on passed data
+        :param return_results: bool
+                OPTIONAL - return the predictions rather than outputting them to file
+        :param ensemble_size: int
+                OPTIONAL - number of top performing models to use for predictions, default is 1. If greater than 1
+                the probabilities of all the models are averaged
+        :param models_to_train: int
+                OPTIONAL - number of models to train on the latest data before predicting, default is 1. If greater
+                than 1 the models are trained in parallel, one process per cpu
+        :param training_time_budget: float
+                OPTIONAL - seconds training may take, the best weights seen within the budget are saved
+        :param backend: str
+                OPTIONAL - "torch" (default) or "numpy" to predict with the fused NumPy artifact of the model, only
+                used when ensemble_size is 1
         :return: Nothing, produces predictions and outputs them to file
         """
 
+        if backend not in ("torch", "numpy"):
+            raise ValueError("Prediction backend not recognised: " + str(backend))
+
+        from core.train import Train
+
         # train a model of all three 3 model types  on the latest data
         print(colored("Training model on new data....", "green"))
-        Train().train(epochs = 3, verbose = True)
+        if models_to_train > 1:
+            Train().train_many(n_models = models_to_train, epochs = 3, time_budget = training_time_budget)
+        else:
+            Train().train(epochs = 3, verbose = True, time_budget = training_time_budget)
         print(colored("Training completed", "green"))
 
         # interrogate the model log to pick the best models compiled thus far
-        log_loc = self.path + "/saved_models/"
-        log = pd.read_csv(log_loc + "model_log.csv")
+        log = ModelLog(saved_models_dir = self.path + "/saved_models/")
 
-        # sort, descending on test acc and grab the top performing model
-        log = log.sort_values(by = "Test Acc", ascending = False)
-        top = log[:1]
+        # grab the top performing model(s), ranked descending on test acc
+        top = log.top(ensemble_size, by = "Test Acc")
 
         # then grab model id
         models = top['Model ID'].to_list()
 
+        if len(models) > 1:
+            # use the top performing saved models to predict the fixtures in a single stacked forward pass
+            print(colored("Using an ensemble of the top " + str(len(models)) + " models for prediction", "yellow"))
+            from core.predict import EnsemblePredict
+            predicted_results, per_model_results = EnsemblePredict(model_ids = models).predict(
+                data_and_fixtures = self.fixtures_and_data_for_prediction)
+            print(colored(predicted_results, "blue"))
+            if return_results:
+                return predicted_results
+            else:
+                predictions_file_output_loc = self.job_result_dir + "ensemble_predicted_results.csv"
+                if user_file_overwrite_check(predictions_file_output_loc):
+                    predicted_results.to_csv(predictions_file_output_loc, index_label = False, index = False)
+                per_model_file_output_loc = self.job_result_dir + "ensemble_per_model_predicted_results.csv"
+                if user_file_overwrite_check(per_model_file_output_loc):
+                    per_model_results.to_csv(per_model_file_output_loc, index_label = False, index = False)
+            return
+
         # use the top performing saved model to predict the fixtures
         for model in models:
             print(colored("Using model No. " + str(model) + " for prediction", "yellow"))
-            predicted_results = Predict(model_id = model).predict(
-                data_and_fixtures = self.fixtures_and_data_for_prediction)
+            if backend == "numpy":
+                # models saved before artifacts were exported on save are exported the first time they are used,
+                # exporting loads the torch model so core.export is only imported when the artifact is missing
+                if not os.path.exists(fused_model_path(self.path + "/saved_models/", model)):
+                    from core.export import export_model
+                    export_model(model_id = model, saved_models_dir = self.path + "/saved_models/")
+                predictor = NumpyPredict(model_id = model)
+            else:
+                from core.predict import Predict
+                predictor = Predict(model_id = model)
+            predicted_results = predictor.predict(data_and_fixtures = self.fixtures_and_data_for_prediction)
             print(colored(predicted_results, "blue"))
             if return_results:
                 return predicted_results
@@ -150,7 +204,7 @@ class APPLE(object):
                 if user_file_overwrite_check(predictions_file_output_loc):
                     predicted_results.to_csv(predictions_file_output_loc, index_label = False, index = False)
 
-    def backtest(self, data_to_backtest_on: list, ftrs: str = None):
+    def backtest(self, data_to_backtest_on: list, ftrs: str = None, workers: int = None):
         """
         Method to backtest all models on specified data
         :param data_to_backtest_on: list of str or str
@@ -158,13 +212,16 @@ class APPLE(object):
         :param ftrs: str
                 OPTIONAL - required if FTRs are not present in data_to_backtest_on
                 Filepath to full time results file, used to evaluate predictions
+        :param workers: int
+                OPTIONAL - number of processes to shard backtesting across
         :return: nothing
         """
         self._data_to_backtest_on = data_to_backtest_on
         self._ftrs = ftrs
 
+        from core.backtest import Backtest
         back_tester = Backtest(data_to_backtest_on = data_to_backtest_on, ftrs = ftrs)
-        back_tester.all()
+        back_tester.all(workers = workers)
         back_tester.commit_log_updates()
 
     def cleanup(self, upper_limit: int = None, prct_to_remove: int = None):
@@ -3,12 +3,18 @@ Backtest is a class used to backtest and thus evaluate saved models on data (min
 The class then updates the model log with the backtesing results
 """
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import torch
 from pandas import DataFrame
-from core.scaler import scale_df_with_params
-from core.loaders import load_json_or_csv, load_and_aggregate
-from core.data_processing import formatting_for_passing_to_model
+from termcolor import colored
+from core.registry import model_registry
+from core.ensemble import stack_models, with_team_dummies
+from core.nnet import confusion_matrices, accuracy_and_weighted_f1
+from core.loaders import load_and_aggregate
+from core.model_log import ModelLog
 
 
 pd.options.mode.chained_assignment = None  # default='warn'
@@ -26,11 +32,99 @@ def log_update(model_id: str, results: tuple, model_log: DataFrame) -> None:
             the model log as a dataframe to update
     :return: nothing
     """
-    # get the row number for the model
-    row = model_log[model_log['Model ID'] == model_id].index
-    # update test log
-    model_log.at[row, "Test Loss"] = results[0]
-    model_log.at[row, "Test Acc"] = results[1]
+    results = pd.DataFrame(data = {"Model ID": [model_id], "Test Loss": [results[0]], "Test Acc": [results[1]]})
+    log_updates(results = results, model_log = model_log)
+
+
+def log_updates(results: DataFrame, model_log: DataFrame) -> None:
+    """
+    Def used to update the model log entries of many models at once once they have been backtested against new data
+    :param results: dataframe
+            dataframe with a "Model ID" column and a column for each log column to update, e.g. "Test Loss"
+    :param model_log: dataframe
+            the model log as a dataframe to update
+    :return: nothing
+    """
+    results = results.set_index("Model ID")
+    # align the results with the rows of the log, models not in results are left untouched
+    aligned = results.reindex(model_log["Model ID"])
+    matched = aligned.notna().any(axis = 1).to_numpy()
+    for col in results.columns:
+        if col not in model_log.columns:
+            model_log[col] = np.nan
+        model_log.loc[matched, col] = aligned[col].to_numpy()[matched]
+
+
+def backtesting_frame(raw_backtesting_data: DataFrame) -> DataFrame:
+    """
+    Def used to build the frame that every model is backtested on, this is only done once per backtest
+    :param raw_backtesting_data: dataframe
+            aggregated mined data with full time results
+    :return: dataframe
+            backtesting data with categorical FTRs and one hot encoded teams
+    """
+    rawdata = raw_backtesting_data.copy()
+    # categorical encoding for FTR col
+    result_cleanup = {"FTR": {"H": 0, "A": 1, "D": 2}}
+    rawdata.replace(result_cleanup, inplace = True)
+
+    # one hot encoding of the teams, for models that use teams as features
+    if "HomeTeam" in rawdata.columns and "AwayTeam" in rawdata.columns:
+        ats = pd.get_dummies(rawdata["AwayTeam"], prefix = "at")
+        hts = pd.get_dummies(rawdata["HomeTeam"], prefix = "ht")
+        rawdata = pd.concat([rawdata, ats, hts], axis = 1, sort = False)
+    return rawdata
+
+
+def evaluate_models(model_ids: list, backtesting_data: DataFrame, saved_models_dir: str) -> DataFrame:
+    """
+    Def used to evaluate many models on the same backtesting data, models that expect the same features and have
+    the same shape are evaluated together in a single stacked forward pass
+    :param model_ids: list of str
+            unique model ids of the models to evaluate
+    :param backtesting_data: dataframe
+            dataframe as created by backtesting_frame
+    :param saved_models_dir: str
+            directory models are saved in
+    :return: dataframe
+            dataframe with the "Model ID", "Test Loss", "Test Acc" and "Test F1" of each model, models that expect
+            features missing from the backtesting data (other than team columns, which are filled with 0) are skipped
+    """
+    loaded_models = [model_registry.get(model_id = model_id, saved_models_dir = saved_models_dir)
+                     for model_id in model_ids]
+
+    results = []
+    # models that expect the same features and have the same shape are evaluated together
+    for stacked_net in stack_models(loaded_models):
+        # teams without a fixture in the backtesting data have no column, they are filled with 0
+        group_data = with_team_dummies(backtesting_data, stacked_net.exp_cols)
+        missing_features = [col for col in stacked_net.exp_cols if col not in group_data.columns]
+        if missing_features:
+            print(colored("WARNING: Backtesting data is missing features expected by model(s) {}: {}, not "
+                          "backtesting them".format(stacked_net.model_ids, missing_features), "red"))
+            continue
+        # only use fixtures with a result and every expected feature
+        group_data = group_data.dropna(subset = stacked_net.exp_cols + ["FTR"])
+        labels = torch.from_numpy(group_data["FTR"].to_numpy(dtype = np.int64))
+
+        # (models, fixtures, 3)
+        logits = stacked_net.forward(stacked_net.features_tensor(group_data))
+        models, fixtures, classes = logits.shape
+
+        losses = torch.nn.functional.cross_entropy(logits.reshape(models * fixtures, classes),
+                                                   labels.repeat(models), reduction = "none")
+        losses = losses.reshape(models, fixtures).mean(dim = 1)
+        predicted = torch.argmax(logits, dim = 2)
+        accuracy, weighted_f1 = accuracy_and_weighted_f1(confusion_matrices(labels, predicted, classes))
+
+        results.append(pd.DataFrame(data = {"Model ID": stacked_net.model_ids,
+                                            "Test Loss": losses.numpy(),
+                                            "Test Acc": accuracy.numpy(),
+                                            "Test F1": weighted_f1.numpy()}))
+
+    if not results:
+        return pd.DataFrame(columns = ["Model ID", "Test Loss", "Test Acc", "Test F1"])
+    return pd.concat(results, ignore_index = True)
 
 
 class Backtest(object):
@@ -47,8 +141,8 @@ class Backtest(object):
         self.path = str(Path().absolute())
         # location of saved models
         self.saved_models_dir = self.path + "/saved_models/"
-        self.model_log_loc = self.saved_models_dir + "model_log.csv"
-        self.model_log = load_json_or_csv(self.model_log_loc)
+        self.model_log_store = ModelLog(saved_models_dir = self.saved_models_dir)
+        self.model_log = self.model_log_store.to_frame()
 
         # load and aggregate all backtesting data to be used
         mined_data_aggregated = load_and_aggregate(data_to_backtest_on)
@@ -60,6 +154,22 @@ class Backtest(object):
         else:
             self.raw_backtesting_data = mined_data_aggregated
         # check here if the FTRs are provided
+        if "FTR" not in self.raw_backtesting_data.columns:
+            raise ValueError("Backtesting requires full time results, either in data_to_backtest_on or in ftrs")
+
+        # shared feature matrix, built on first use
+        self._backtesting_data = None
+        # results not yet committed to the model log
+        self._pending_results = []
+
+    @property
+    def backtesting_data(self) -> DataFrame:
+        """
+        Feature matrix shared by every model that is backtested, built once on first use
+        """
+        if self._backtesting_data is None:
+            self._backtesting_data = backtesting_frame(self.raw_backtesting_data)
+        return self._backtesting_data
 
     def model(self, model_id: str) -> None:
         """
@@ -68,77 +178,54 @@ class Backtest(object):
                 uniqe model id of the model to backtest
         :return: nothing
         """
-        print("Backtesting model " + str(model_id))
-        # grab entry for requested model
-        model_details = self.model_log[self.model_log["Model ID"] == model_id]
-        # get model type for requested model
-        model_type = int(model_details["Model type"].iloc[0])
-
-        # load scaled
-        sclaer_coeffs_loc = self.saved_models_dir + model_id + "/" + model_id + "_coeffs.csv"
-        # grab the model
-        #loaded_model = tf.keras.models.load_model(self.saved_models_dir + model_id + "/" + model_id + ".h5")
-        exp_features_df = pd.read_csv(self.saved_models_dir + model_id + "/" + model_id + ".csv")
-        exp_features = exp_features_df["columns"].to_list()
-
-        # add FTR to the list of expected features
-        exp_features.append("FTR")
-        rawdata = self.raw_backtesting_data
-
-        # if model is type 2 or 3 use one hot encoding
-        if model_type == 2 or model_type == 3:
-            ats = pd.get_dummies(rawdata["AwayTeam"], prefix = "at")
-            hts = pd.get_dummies(rawdata["HomeTeam"], prefix = "ht")
-            rawdata = pd.concat([rawdata, ats], axis = 1, sort = False)
-            rawdata = pd.concat([rawdata, hts], axis = 1, sort = False)
-            rawdata.pop("AwayTeam")
-            rawdata.pop("HomeTeam")
-
-        # process data for passing to models
-        backtesting_data = formatting_for_passing_to_model(rawdata = rawdata, exp_features = exp_features, model_id = model_id)
-
-        # categorical encoding for FTR col
-        result_cleanup = {"FTR": {"H": 0, "A": 1, "D": 2}}
-        backtesting_data.replace(result_cleanup, inplace = True)
-
-        # remove labels
-        backtesting_data_labels = backtesting_data.pop("FTR")
-
-        # scale the features
-        backtesting_data = scale_df_with_params(backtesting_data, sclaer_coeffs_loc)
-
-        # turn labels and features in numpy arrays for passing to model
-        backtesting_data_labels = backtesting_data_labels.to_numpy()
-        backtesting_data = backtesting_data.to_numpy()
-        # use model to evaluate
-        results = loaded_model.evaluate(backtesting_data, backtesting_data_labels, batch_size = 50)
-        # now update the log with the results
-        log_update(model_id = model_id, results = results, model_log = self.model_log)
-
-    def models(self, models: list) -> None:
+        self.models(models = [model_id])
+
+    def models(self, models: list, workers: int = None) -> None:
         """
         Method to backtest one of more models
         :param models: list of str
                 list of models ids to backtest
+        :param workers: int
+                OPTIONAL - number of processes to shard the models across, by default all models are backtested
+                in this process
         :return: nothing
         """
-        for model in models:
-            self.model(model_id = model)
-
-    def all(self) -> None:
+        print("Backtesting " + str(len(models)) + " model(s)")
+        if len(models) == 0:
+            return
+        if workers is None or workers <= 1 or len(models) == 1:
+            results = evaluate_models(model_ids = models, backtesting_data = self.backtesting_data,
+                                      saved_models_dir = self.saved_models_dir)
+        else:
+            shards = [list(shard) for shard in np.array_split(models, min(workers, len(models)))]
+            with ProcessPoolExecutor(max_workers = len(shards)) as executor:
+                futures = [executor.submit(evaluate_models, shard, self.backtesting_data, self.saved_models_dir)
+                           for shard in shards]
+                results = pd.concat([future.result() for future in futures], ignore_index = True)
+        # now update the log with the results, in bulk
+        log_updates(results = results, model_log = self.model_log)
+        self._pending_results.append(results)
+
+    def all(self, workers: int = None) -> None:
         """
         Method to backtest all saved models
+        :param workers: int
+                OPTIONAL - number of processes to shard the models across
         :return: nothing
         """
         # get all the mode ids as a list
         models = self.model_log["Model ID"].to_list()
         # perform back testing on all models
-        for model in models:
-            self.model(model_id = model)
+        self.models(models = models, workers = workers)
 
     def commit_log_updates(self) -> None:
         """
-        Method to commit log updates made by any instance to file
+        Method to commit log updates made by any instance to the model log, in one transaction
         :return: nothing
         """
-        self.model_log.to_csv(self.model_log_loc, index_label = False, index = False)
+        if len(self._pending_results) == 0:
+            return
+        results = pd.concat(self._pending_results, ignore_index = True).drop_duplicates(subset = "Model ID",
+                                                                                       keep = "last")
+        self.model_log_store.update(results)
+        self._pending_results = []
@@ -2,11 +2,12 @@
 Script used to clean the saved_models direcotry by deleteing low perfomring models
 """
 
-import pandas as pd
 from termcolor import colored
 import shutil
 from tqdm import tqdm
 import pathlib
+from core.registry import model_registry
+from core.model_log import ModelLog
 
 
 def cleanup(upper_limit: int = None, prct_to_remove: int = None) -> None:
@@ -41,25 +42,21 @@ def cleanup(upper_limit: int = None, prct_to_remove: int = None) -> None:
 
     # load in the log of models
     saved_models_dir = path + "/saved_models/"
-    log_loc = saved_models_dir + "model_log.csv"
-    log = pd.read_csv(log_loc)
+    log = ModelLog(saved_models_dir=saved_models_dir)
 
-    # find the worst performing models
-    log = log.sort_values(by="Test Acc", ascending=True)
-    dimen = log.shape
-    no_models_stored = dimen[0]
+    no_models_stored = len(log)
     number_to_remove = round((prct_to_remove / 100) * no_models_stored)
 
     # if meets requirements delete models and remove from the model log
     if number_to_remove >= 1 and no_models_stored > 15:
-        df_lowest_perf_models = log[0:number_to_remove]
+        # find the worst performing models
+        df_lowest_perf_models = log.top(number_to_remove, by="Test Acc", ascending=True)
         models_to_remove = df_lowest_perf_models['Model ID'].to_list()
         print(colored("Cleaning starting, " + str(len(models_to_remove)) + " model(s) to remove...", "red"))
         for model_id in tqdm(models_to_remove):
             shutil.rmtree(saved_models_dir + model_id)
-            log = log[log["Model ID"] != model_id]
-        log = log.reset_index(drop=True)
-        log.to_csv(log_loc, index_label=False, index=False)
+            model_registry.evict(model_id = model_id, saved_models_dir = saved_models_dir)
+        log.remove(models_to_remove)
         print(colored("Cleaning completed, " + str(len(models_to_remove)) + " model(s) removed", "green"))
     else:
         print(colored("No cleaning required, 0 models deleted", "green"))
@@ -2,16 +2,12 @@
 Class used to mine features (odds) required to make predictions
 """
 
-from selenium import webdriver
 import pandas as pd
 from pandas import DataFrame
 import numpy as np
 from pathlib import Path
 from termcolor import colored
-from core.data_processing import team_name_standardisation
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
+from core.teams import team_registry
 import re
 from datetime import datetime
 from datetime import timedelta
@@ -107,6 +103,8 @@ class MineOdds(object):
 
         print(colored(
             "WARNING: Mine is currently undergoing development an cannot be relied upon for data mining at present. Please do not use"), "red")
+        # selenium is only imported when mining, it is slow to import
+        from selenium import webdriver
         self.driver = webdriver.Safari()
         self.path = str(Path().absolute())
 
@@ -119,9 +117,9 @@ class MineOdds(object):
             raise FileNotFoundError("User predictions file {} not found".format(fixtures_file))
 
         # we need to check that each of the HomeTeam and AwayTeam entries match the schema from raw data
-        # use the team_cleaner def and a lambda function to do this
-        self.fixtures["HomeTeam"] = self.fixtures.apply(lambda x: team_name_standardisation(x["HomeTeam"]), axis = 1)
-        self.fixtures["AwayTeam"] = self.fixtures.apply(lambda x: team_name_standardisation(x["AwayTeam"]), axis = 1)
+        # use the vectorized team name standardisation to do this
+        self.fixtures["HomeTeam"] = team_registry.resolve_series(self.fixtures["HomeTeam"])
+        self.fixtures["AwayTeam"] = team_registry.resolve_series(self.fixtures["AwayTeam"])
 
         self.WH = None
         self.B365 = None
@@ -129,12 +127,29 @@ class MineOdds(object):
         self.BWIN = None
         self.PINACLE = None
 
+    def _wait_until_visible(self, by: str, selector: str, timeout: int = 30):
+        """
+        Method to wait until an element of the loaded page is visible
+        :param by: str
+                name of the selenium By locator strategy e.g. "CSS_SELECTOR" or "TAG_NAME"
+        :param selector: str
+                selector of the element
+        :param timeout: int
+                OPTIONAL - seconds to wait, default is 30
+        :return: nothing
+        """
+        # selenium is only imported when mining, it is slow to import
+        from selenium.webdriver.support.wait import WebDriverWait
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        wait = WebDriverWait(self.driver, timeout)
+        wait.until(EC.visibility_of_element_located((getattr(By, by), selector)))
+
     def pinacle(self):
         url = "https://www.pinnacle.com/en/soccer/england-premier-league/matchups"
         self.driver.get(url)
         # wait until he css elements to scrape have loaded
-        wait = WebDriverWait(self.driver, 30)
-        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "span.style_participantName__vRjBw.ellipsis")))
+        self._wait_until_visible("CSS_SELECTOR", "span.style_participantName__vRjBw.ellipsis")
         # grab the tags which the teams are in
         teams_tags = self.driver.find_elements_by_css_selector("span.style_participantName__vRjBw.ellipsis")
         # create list of the teams
@@ -146,7 +161,7 @@ class MineOdds(object):
             if ph_test:
                 pass
             else:
-                teams.append(team_name_standardisation(team))
+                teams.append(team_registry.resolve(team))
 
         # grab the tags which the odds are in
         odds = self.driver.find_elements_by_css_selector("span.price")
@@ -180,14 +195,13 @@ class MineOdds(object):
         self.driver.get(url)
 
         # wait until web page has loaded
-        wait = WebDriverWait(self.driver, 30)
-        wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "div.participant")))
+        self._wait_until_visible("CSS_SELECTOR", "div.participant")
 
         # grab teams and clean names
         teams_tags = self.driver.find_elements_by_css_selector("div.participant")
         teams = []
         for t in teams_tags:
-            teams.append(team_name_standardisation(t.text))
+            teams.append(team_registry.resolve(t.text))
 
         # grab odds and clean names
         odds = self.driver.find_elements_by_css_selector("div.option.option-indicator")
@@ -213,14 +227,13 @@ class MineOdds(object):
     def williamhill(self):
         url = "https://sports.williamhill.com/betting/en-gb/football/competitions/OB_TY295/English-Premier-League/matches/OB_MGMB/Match-Betting"
         self.driver.get(url)
-        wait = WebDriverWait(self.driver, 30)
-        wait.until(EC.visibility_of_element_located((By.TAG_NAME, "main")))
+        self._wait_until_visible("TAG_NAME", "main")
         fixtures_tags = self.driver.find_elements_by_css_selector("main.sp-o-market__title")
         teams = []
         for f in fixtures_tags:
             home, away = f.text.split(" v ")
-            home = team_name_standardisation(team = home)
-            away = team_name_standardisation(team = away)
+            home = team_registry.resolve(home)
+            away = team_registry.resolve(away)
             teams.append(home)
             teams.append(away)
 
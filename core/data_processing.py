@@ -1,14 +1,13 @@
 """
 Def used across APPLE for data processing
 """
-from torch.utils.data import Dataset, DataLoader
+import torch
+from torch.utils.data import Dataset, DataLoader, WeightedRandomSampler, RandomSampler
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from core.scaler import scale_df
+from core.scaler import scale_df, load_scaler
 import numpy as np
-from core.scaler import scale_df_with_params
-from fuzzywuzzy import process
-from pandas import DataFrame
+from core.teams import team_registry
+from pandas import DataFrame, Series
 from math import ceil
 from torch import Tensor
 from numpy import array
@@ -30,6 +29,60 @@ class AppleDataset(Dataset):
         return item_features, item_labels
 
 
+class TensorBatchLoader(object):
+
+    def __init__(self, features: array, labels: array, batch_size: int, shuffle: bool = False,
+                 weights: Tensor = None, num_samples: int = None):
+        """
+        Loader that holds features and labels as contiguous tensors and yields minibatches by slicing / indexing
+        them, used instead of a DataLoader to avoid per item collation
+        :param features: array
+                features of every sample
+        :param labels: array
+                label of every sample
+        :param batch_size: int
+                number of samples per minibatch
+        :param shuffle: bool
+                OPTIONAL - whether to shuffle the samples each epoch
+        :param weights: Tensor
+                OPTIONAL - weight of each sample, if passed each epoch draws num_samples samples with replacement
+                with probability proportional to their weight
+        :param num_samples: int
+                OPTIONAL - number of samples per epoch, defaults to the number of samples
+        """
+        self.features = torch.from_numpy(np.ascontiguousarray(features, dtype = np.float32))
+        self.labels = torch.from_numpy(np.asarray(labels).astype(np.int64))
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.weights = weights
+        self.num_samples = num_samples or len(self.labels)
+        # mirrors DataLoader.dataset so either loader can be used by Train
+        self.dataset = self
+
+    def __len__(self):
+        return ceil(self.num_samples / self.batch_size)
+
+    def _epoch_indices(self):
+        if self.weights is not None:
+            return torch.multinomial(self.weights, self.num_samples, replacement = True)
+        if self.num_samples != len(self.labels):
+            return torch.randint(len(self.labels), (self.num_samples,))
+        if self.shuffle:
+            return torch.randperm(len(self.labels))
+        return None
+
+    def __iter__(self):
+        indices = self._epoch_indices()
+        for start in range(0, self.num_samples, self.batch_size):
+            end = min(start + self.batch_size, self.num_samples)
+            if indices is None:
+                # in order, slices are views so no data is copied
+                yield self.features[start:end], self.labels[start:end]
+            else:
+                batch_indices = indices[start:end]
+                yield self.features[batch_indices], self.labels[batch_indices]
+
+
 def correct_class_imbalance(train_dataset: DataFrame, final_multiplier: int) -> DataFrame:
     """
     Def to over-sample classes underrepresented in training dataset
@@ -70,6 +123,49 @@ def correct_class_imbalance(train_dataset: DataFrame, final_multiplier: int) ->
     return train_dataset
 
 
+def class_weights(labels: array, num_classes: int = 3) -> Tensor:
+    """
+    Def to calculate class weights, inversely proportional to class frequency, for use with a weighted loss
+    :param labels: array
+            labels of the training data
+    :param num_classes: int
+            number of classes
+    :return: Tensor
+            weight of each class, classes that don't appear in labels have a weight of 0
+    """
+    labels = np.asarray(labels).astype(np.int64)
+    counts = np.bincount(labels, minlength = num_classes).astype(np.float64)
+    weights = np.divide(len(labels), num_classes * counts, out = np.zeros_like(counts), where = counts > 0)
+    return Tensor(weights.astype('float32'))
+
+
+def oversampled_size(labels: array, final_multiplier: int = 50) -> int:
+    """
+    Def to calculate the number of samples correct_class_imbalance would produce, every class as frequent as the
+    most frequent class and the dataset replicated final_multiplier times
+    :param labels: array
+            labels of the training data
+    :param final_multiplier: int
+            OPTIONAL - replication of the dataset, default is 50 as in processing
+    :return: int
+    """
+    counts = np.bincount(np.asarray(labels).astype(np.int64))
+    return int(np.count_nonzero(counts) * counts.max() * final_multiplier)
+
+
+def sample_weights(labels: array) -> Tensor:
+    """
+    Def to calculate the weight of each sample so that every class is sampled equally often
+    :param labels: array
+            labels of the training data
+    :return: Tensor
+            weight of each sample
+    """
+    labels = np.asarray(labels).astype(np.int64)
+    counts = np.bincount(labels)
+    return torch.from_numpy(1.0 / counts[labels])
+
+
 def convert_oods(x: str) -> float:
     """
     def used to convert British Style odds to European style
@@ -108,10 +204,8 @@ def clean_mined_data(dataframe: DataFrame):
             dataframe.to_csv("~/Desktop/nan_df.csv")
             dataframe[odd_col] = dataframe.apply(lambda x: convert_oods(x[odd_col]), axis = 1)
     # standardise team names
-    dataframe["HomeTeam"] = dataframe.apply(lambda x: team_name_standardisation(x["HomeTeam"]),
-                                            axis = 1)
-    dataframe["AwayTeam"] = dataframe.apply(lambda x: team_name_standardisation(x["AwayTeam"]),
-                                            axis = 1)
+    dataframe["HomeTeam"] = team_names_standardisation(dataframe["HomeTeam"])
+    dataframe["AwayTeam"] = team_names_standardisation(dataframe["AwayTeam"])
     return dataframe
 
 
@@ -134,13 +228,27 @@ def preprocessing(df1: DataFrame, df2: DataFrame, df3: DataFrame) -> DataFrame:
     return raw_data_combined
 
 
-def processing(input_df: DataFrame, test_size: float, train_batch_size: int):
+def processing(input_df: DataFrame, test_size: float, train_batch_size: int, balancing: str = "weighted_sampler",
+               samples_per_epoch: int = None, tensorized: bool = False):
     """
     :param input_df: dataframe
             dataframe to process
     :param train_batch_size:
     :param test_size: float
             percentage of data to be used as train data
+    :param balancing: str
+            OPTIONAL - how to correct class imbalance in the training data, one of
+            "weighted_sampler" - each epoch samples the training data with probability inversely proportional to
+            class frequency (default)
+            "oversample" - copies of minority classes are added and the dataset is replicated 50 times
+            "class_weights" - the training data is used as is, the loss should be weighted with class_weights
+    :param samples_per_epoch: int
+            OPTIONAL - number of training samples per epoch when balancing is "weighted_sampler" or
+            "class_weights". Defaults to as many samples as "oversample" trains on per epoch for "weighted_sampler",
+            so epochs are comparable, and to the size of the training data for "class_weights"
+    :param tensorized: bool
+            OPTIONAL - if True the data is held in contiguous tensors and batched with TensorBatchLoader rather
+            than a DataLoader, which is much faster for large batch sizes
     :return:
     train_raw: dataframe
             dataframe of the raw data to be used for training
@@ -173,19 +281,49 @@ def processing(input_df: DataFrame, test_size: float, train_batch_size: int):
 
     # split into test and train
     raw_data_combined_scaled = raw_data_combined_scaled.sample(frac = 1).reset_index(drop = True)
+    from sklearn.model_selection import train_test_split
     train_raw, test_raw = train_test_split(raw_data_combined_scaled, test_size = test_size)
-    # address class imbalance and increase size of training dataset
-    train_raw = correct_class_imbalance(train_raw, final_multiplier = 50)
+    if balancing == "oversample":
+        # address class imbalance and increase size of training dataset
+        train_raw = correct_class_imbalance(train_raw, final_multiplier = 50)
+    elif balancing == "weighted_sampler":
+        samples_per_epoch = samples_per_epoch or oversampled_size(train_raw["FTR"].to_numpy())
+    elif balancing != "class_weights":
+        raise ValueError("Balancing method not recognised: " + str(balancing))
     # turn dataframes in np arrays
     train_labels = train_raw.pop("FTR").to_numpy()
     train_features = train_raw.to_numpy()
     test_labels = test_raw.pop("FTR").to_numpy()
     test_features = test_raw.to_numpy()
+    if tensorized:
+        # keep the data as tensors and batch by slicing them
+        train_dataloder = TensorBatchLoader(features = train_features,
+                                            labels = train_labels,
+                                            batch_size = train_batch_size,
+                                            shuffle = balancing == "class_weights",
+                                            weights = sample_weights(train_labels) if balancing == "weighted_sampler"
+                                            else None,
+                                            num_samples = None if balancing == "oversample" else samples_per_epoch)
+        test_dataloder = TensorBatchLoader(features = test_features,
+                                           labels = test_labels,
+                                           batch_size = len(test_labels))
+        return train_dataloder, test_dataloder, ord_cols_df, coeffs
     # turn arrays into datasets, then create dataloaders
     train_dataset = AppleDataset(features = train_features, labels = train_labels)
     test_dataset = AppleDataset(features = test_features, labels = test_labels)
+    if balancing == "weighted_sampler":
+        # draw each class equally often, without holding copies of the data in memory
+        sampler = WeightedRandomSampler(weights = sample_weights(train_labels),
+                                        num_samples = samples_per_epoch,
+                                        replacement = True)
+    elif balancing == "class_weights":
+        sampler = RandomSampler(data_source = train_dataset, replacement = samples_per_epoch is not None,
+                                num_samples = samples_per_epoch)
+    else:
+        sampler = None
     train_dataloder = DataLoader(dataset = train_dataset,
-                                 batch_size = train_batch_size)
+                                 batch_size = train_batch_size,
+                                 sampler = sampler)
     test_dataloder = DataLoader(dataset = test_dataset,
                                 batch_size = len(test_dataset))
     return train_dataloder, test_dataloder, ord_cols_df, coeffs
@@ -198,33 +336,39 @@ def formatting_for_passing_to_model(rawdata: DataFrame, exp_features, saved_mode
                     dataframe containing raw data
     :param exp_features: list
                         list of expected feature column names
+    :param saved_models_dir: str
+                    directory models are saved in
     :param model_id: str
                     model id to create raw data for
     :return: wragnled dataframe
     """
+    scaler = load_scaler(saved_models_dir, model_id)
     data_with_expected_features = rawdata[exp_features]
-    data_in_sclaed = scale_df_with_params(data_with_expected_features,
-                                          saved_models_dir + model_id + "/" + model_id + "_coeffs.csv")
-    features_tensor = Tensor(data_in_sclaed.to_numpy())
+    features_tensor = Tensor(scaler.transform_array(data_with_expected_features).astype('float32'))
     return features_tensor
 
 
 def team_name_standardisation(team: str) -> str:
     """
-    Returns a standardised name of the passed team using fuzzy string matching. Train data (also called raw) uses abbreviations or contractions for team
-    name, some models use team name as a feature for prediction. Thus when mining data for weekly predictions the team
-    name needs to be cleaned to match the team name in the train data. The team names in
+    Returns a standardised name of the passed team. Train data (also called raw) uses abbreviations or contractions for
+    team name, some models use team name as a feature for prediction. Thus when mining data for weekly predictions the
+    team name needs to be cleaned to match the team name in the train data. Known spellings are resolved with an exact
+    lookup, anything else falls back to (memoized) fuzzy string matching.
 
     :param team: str
             name of a team
     :return: str
             cleaned name consistent with data used to train models.
     """
-    teams_19_20 = ["Arsenal", "Aston Villa", "Bournemouth", "Brighton", "Burnley", "Chelsea", "Crystal Palace",
-                   "Everton",
-                   "Leicester", "Liverpool", "Leeds", "Man City", "Man United", "Newcastle", "Norwich",
-                   "Sheffield United",
-                   "Southampton",
-                   "Tottenham", "Watford", "West Ham", "Wolves", "Fulham", "West Brom"]
+    return team_registry.resolve(team)
+
 
-    return process.extractOne(team, teams_19_20)[0]
+def team_names_standardisation(teams: Series) -> Series:
+    """
+    Vectorized version of team_name_standardisation, each distinct team name in the Series is only resolved once
+    :param teams: Series
+            Series of team names
+    :return: Series
+            Series of cleaned names consistent with data used to train models.
+    """
+    return team_registry.resolve_series(teams)
@@ -0,0 +1,116 @@
+"""
+Stacks the weights of several NNet models into batched tensors so that all of them can be evaluated in a single
+forward pass
+"""
+
+import numpy as np
+import torch
+from pandas import DataFrame
+
+
+# prefixes of the one hot encoded team columns, see core.backtest.backtesting_frame
+team_dummy_prefixes = ("ht_", "at_")
+
+
+def with_team_dummies(rawdata: DataFrame, exp_cols: list) -> DataFrame:
+    """
+    Def to add the expected one hot encoded team columns that are missing from rawdata, filled with 0. Team columns
+    are built from the fixtures in the data, so a team with no home (or away) fixture has no column
+    :param rawdata: DataFrame
+            raw data
+    :param exp_cols: list of str
+            list of the features a model expects
+    :return: DataFrame
+            rawdata, with any missing team columns added
+    """
+    missing_dummies = [col for col in exp_cols if col not in rawdata.columns and col.startswith(team_dummy_prefixes)]
+    if not missing_dummies:
+        return rawdata
+    return rawdata.reindex(columns = list(rawdata.columns) + missing_dummies, fill_value = 0)
+
+
+def _net_shape(loaded_model) -> tuple:
+    return tuple(loaded_model.net.lin1.weight.shape) + tuple(loaded_model.net.lin2.weight.shape)
+
+
+def stack_models(loaded_models: list) -> list:
+    """
+    Def to stack models, models are grouped so that each group expects the same features and has the same shape
+    :param loaded_models: list of LoadedModel
+            models to stack
+    :return: list of StackedNNet
+            one StackedNNet per group, in the order each group first appears in loaded_models
+    """
+    groups = {}
+    for loaded_model in loaded_models:
+        groups.setdefault((tuple(loaded_model.exp_cols), _net_shape(loaded_model)), []).append(loaded_model)
+    return [StackedNNet(group) for group in groups.values()]
+
+
+class StackedNNet(object):
+
+    def __init__(self, loaded_models: list):
+        """
+        :param loaded_models: list of LoadedModel
+                models to stack, all models must expect the same features and have the same shape
+        """
+        if len(loaded_models) == 0:
+            raise ValueError("At least one model is required to create a StackedNNet")
+        self.model_ids = [loaded_model.model_id for loaded_model in loaded_models]
+        self.exp_cols = list(loaded_models[0].exp_cols)
+        for loaded_model in loaded_models:
+            if list(loaded_model.exp_cols) != self.exp_cols:
+                raise ValueError("Model {} expects different features to model {}, models with different features "
+                                 "cannot be stacked".format(loaded_model.model_id, self.model_ids[0]))
+            if _net_shape(loaded_model) != _net_shape(loaded_models[0]):
+                raise ValueError("Model {} has a different shape to model {}, models with different shapes cannot "
+                                 "be stacked".format(loaded_model.model_id, self.model_ids[0]))
+
+        with torch.no_grad():
+            # weights are (K, out, in), biases are (K, 1, out) so they broadcast over the fixtures
+            self.lin1_weight = torch.stack([m.net.lin1.weight.detach().cpu() for m in loaded_models])
+            self.lin1_bias = torch.stack([m.net.lin1.bias.detach().cpu() for m in loaded_models]).unsqueeze(1)
+            self.lin2_weight = torch.stack([m.net.lin2.weight.detach().cpu() for m in loaded_models])
+            self.lin2_bias = torch.stack([m.net.lin2.bias.detach().cpu() for m in loaded_models]).unsqueeze(1)
+
+        # scaler coeffs of every model, (K, 1, features)
+        self.mins = np.stack([m.scaler.mins for m in loaded_models])[:, np.newaxis, :]
+        self.ranges = np.stack([m.scaler.ranges for m in loaded_models])[:, np.newaxis, :]
+
+    def __len__(self):
+        return len(self.model_ids)
+
+    def features_tensor(self, rawdata: DataFrame) -> torch.Tensor:
+        """
+        Method to scale raw data with the scaler of every stacked model
+        :param rawdata: DataFrame
+                dataframe containing (at least) the expected features
+        :return: Tensor
+                scaled features of shape (models, fixtures, features)
+        """
+        raw_features = with_team_dummies(rawdata, self.exp_cols)[self.exp_cols].to_numpy(
+            dtype = np.float64)[np.newaxis, :, :]
+        return torch.from_numpy(((raw_features - self.mins) / self.ranges).astype('float32'))
+
+    def forward(self, features: torch.Tensor) -> torch.Tensor:
+        """
+        Method to run all stacked models on their scaled features
+        :param features: Tensor
+                scaled features of shape (models, fixtures, features)
+        :return: Tensor
+                logits of shape (models, fixtures, 3)
+        """
+        with torch.no_grad():
+            hidden = torch.baddbmm(self.lin1_bias, features, self.lin1_weight.transpose(1, 2))
+            return torch.baddbmm(self.lin2_bias, hidden, self.lin2_weight.transpose(1, 2))
+
+    def probabilities(self, rawdata: DataFrame) -> np.ndarray:
+        """
+        Method to get the probabilities of each result for every fixture and every stacked model
+        :param rawdata: DataFrame
+                dataframe containing (at least) the expected features
+        :return: np.ndarray
+                probabilities of shape (models, fixtures, 3), classes in the order H, A, D
+        """
+        logits = self.forward(self.features_tensor(rawdata))
+        return torch.softmax(logits, dim = 2).numpy()
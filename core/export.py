@@ -0,0 +1,76 @@
+"""
+Exports saved models to the fused NumPy artifacts used by core.numpy_predict, so predicting does not require torch
+"""
+
+import os
+from pathlib import Path
+import numpy as np
+from core.nnet import NNet
+from core.scaler import MinMaxScaler
+from core.registry import model_registry
+from core.numpy_predict import FusedModel, fused_model_path
+
+
+def fuse(model_id: str, net: NNet, exp_cols: list, scaler: MinMaxScaler) -> FusedModel:
+    """
+    Def to fold a model's scaler and linear layers into a single affine map. With scaled features
+    x_s = (x - mins) / ranges the logits W2 (W1 x_s + b1) + b2 are x @ (W2 W1 / ranges).T + W2 b1 + b2 - W2 W1 (mins /
+    ranges), computed in float64
+    :param model_id: str
+            unique model id
+    :param net: NNet
+            trained network
+    :param exp_cols: list of str
+            list of the features the model expects, in order
+    :param scaler: MinMaxScaler
+            scaler fit on the data the model was trained on
+    :return: FusedModel
+    """
+    state_dict = net.state_dict()
+    lin1_weight, lin1_bias, lin2_weight, lin2_bias = [state_dict[name].detach().cpu().numpy().astype(np.float64)
+                                                      for name in ("lin1.weight", "lin1.bias",
+                                                                   "lin2.weight", "lin2.bias")]
+    combined_weight = lin2_weight @ lin1_weight
+    weight = (combined_weight / scaler.ranges).T
+    bias = lin2_weight @ lin1_bias + lin2_bias - combined_weight @ (scaler.mins / scaler.ranges)
+    return FusedModel(model_id = model_id, exp_cols = exp_cols, weight = weight, bias = bias)
+
+
+def export_model(model_id: str, saved_models_dir: str = None, overwrite: bool = False) -> str:
+    """
+    Def to export a saved model to its fused NumPy artifact, written alongside the model
+    :param model_id: str
+            unique model id
+    :param saved_models_dir: str
+            OPTIONAL - directory models are saved in, defaults to saved_models/ in the working directory
+    :param overwrite: bool
+            OPTIONAL - export the model even if the artifact already exists
+    :return: str
+            filepath of the artifact
+    """
+    if saved_models_dir is None:
+        saved_models_dir = str(Path().absolute()) + "/saved_models/"
+    npz_path = fused_model_path(saved_models_dir, model_id)
+    if overwrite or not os.path.exists(npz_path):
+        loaded_model = model_registry.get(model_id = model_id, saved_models_dir = saved_models_dir)
+        fuse(model_id = model_id, net = loaded_model.net, exp_cols = loaded_model.exp_cols,
+             scaler = loaded_model.scaler).save(npz_path)
+    return npz_path
+
+
+def export_all(saved_models_dir: str = None, overwrite: bool = False) -> list:
+    """
+    Def to export every saved model, e.g. models saved before artifacts were exported on save
+    :param saved_models_dir: str
+            OPTIONAL - directory models are saved in, defaults to saved_models/ in the working directory
+    :param overwrite: bool
+            OPTIONAL - export models even if their artifact already exists
+    :return: list of str
+            filepaths of the artifacts
+    """
+    if saved_models_dir is None:
+        saved_models_dir = str(Path().absolute()) + "/saved_models/"
+    model_ids = sorted(entry for entry in os.listdir(saved_models_dir)
+                       if os.path.exists(saved_models_dir + entry + "/" + entry + ".pth"))
+    return [export_model(model_id, saved_models_dir = saved_models_dir, overwrite = overwrite)
+            for model_id in model_ids]
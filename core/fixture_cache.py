@@ -0,0 +1,124 @@
+"""
+Incremental local cache of STRUDEL fixtures, user predictions and full-time results, keyed by FixtureID and date.
+Each sync only fetches the dates after the last sync, plus a window of recent days to pick up late result changes.
+The cache can be shared by several processes, syncs hold a lock on the cache directory and read the latest cache
+written by any of them
+"""
+
+from datetime import datetime, timedelta
+from termcolor import colored
+import pandas as pd
+from pandas import DataFrame
+import threading
+import json
+import os
+import uuid
+from utils.file_utils import atomic_path, write_atomic, file_lock
+
+_date_format = "%Y-%m-%d"
+
+
+def _shift_date(date: str, days: int) -> str:
+    return (datetime.strptime(date, _date_format) + timedelta(days = days)).strftime(_date_format)
+
+
+def _fixture_dates(fixtures: DataFrame) -> pd.Series:
+    # dates as YYYY-MM-DD strings, so they can be compared with the requested date range
+    return fixtures["Date"].astype(str).str[:10]
+
+
+class FixtureCache(object):
+
+    def __init__(self, cache_dir: str, refresh_days: int = 3):
+        """
+        :param cache_dir: str
+                directory to keep the cache in, e.g. data/strudel_cache/
+        :param refresh_days: int
+                OPTIONAL - days before the last sync that are fetched again on each sync, so results that are entered
+                or corrected late are picked up
+        """
+        self.cache_dir = cache_dir
+        self.fixtures_loc = os.path.join(cache_dir, "fixtures.pkl")
+        self.manifest_loc = os.path.join(cache_dir, "manifest.json")
+        self.lock_loc = os.path.join(cache_dir, ".lock")
+        self.refresh_days = refresh_days
+        self._lock = threading.Lock()
+        # the cache is read from disk by the first sync, not when it is created
+        self.manifest = {}
+        self.fixtures = None
+        self._loaded_manifest = None
+
+    def _load(self) -> None:
+        # (re)load the cache if another process (or none yet) has saved a different one since it was last loaded
+        if not (os.path.exists(self.manifest_loc) and os.path.exists(self.fixtures_loc)):
+            self.manifest = {}
+            self.fixtures = None
+            return
+        with open(self.manifest_loc) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest != self._loaded_manifest:
+            self.fixtures = pd.read_pickle(self.fixtures_loc)
+            self.manifest = manifest
+            self._loaded_manifest = manifest
+
+    def _save(self) -> None:
+        # unique to each save, so a process can tell whether the cache on disk is the one it last loaded
+        self.manifest["snapshot"] = uuid.uuid4().hex
+        with atomic_path(self.fixtures_loc) as tmp_fixtures_loc:
+            self.fixtures.to_pickle(tmp_fixtures_loc)
+        write_atomic(self.manifest_loc, json.dumps(self.manifest, indent = 2).encode("utf-8"))
+        self._loaded_manifest = dict(self.manifest)
+
+    def _merge(self, fetched: DataFrame, fetch_start: str, fetch_end: str) -> None:
+        if self.fixtures is None:
+            self.fixtures = fetched
+        else:
+            # fetched rows replace cached rows for the same fixture, and cached fixtures in the fetched date range
+            # that STRUDEL no longer returns (e.g. postponed) are dropped
+            dates = _fixture_dates(self.fixtures)
+            stale = (self.fixtures["FixtureID"].isin(fetched["FixtureID"])) | (
+                (dates >= fetch_start) & (dates <= fetch_end))
+            self.fixtures = pd.concat([self.fixtures[~stale], fetched], ignore_index = True)
+        self.fixtures = self.fixtures.sort_values(by = ["Date", "Time"]).reset_index(drop = True)
+
+    def sync(self, strudel_interface, start_date: str, end_date: str) -> DataFrame:
+        """
+        Def to bring the cache up to date with STRUDEL and return the fixtures, predictions and results between two
+        dates
+        :param strudel_interface: StrudelInterface
+                connection to fetch missing fixtures with
+        :param start_date: str
+                Date, format YYYY-MM-DD, for the start date of fixtures window
+        :param end_date: str
+                Date, format YYYY-MM-DD, for the end date of fixtures window
+        :return: DataFrame
+                fixtures between start_date and end_date inclusive, in the format of
+                StrudelInterface.get_predictions_and_ftrs
+        """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok = True)
+        with self._lock, file_lock(self.lock_loc):
+            self._load()
+            today = datetime.today().strftime(_date_format)
+            if self.fixtures is None or start_date < self.manifest["start_date"]:
+                # nothing cached from this far back, fetch the whole range
+                fetch_start = start_date
+                self.fixtures = None
+                self.manifest = {}
+            else:
+                # refetch from before the last sync rather than from start_date, so no gap is left in the cache
+                fetch_start = max(self.manifest["start_date"],
+                                  _shift_date(self.manifest["synced_to"], -self.refresh_days))
+            if self.fixtures is None or fetch_start <= end_date:
+                print(colored("Fetching fixtures from STRUDEL between {} and {}".format(fetch_start, end_date),
+                              "cyan"))
+                fetched = strudel_interface.get_predictions_and_ftrs(start_date = fetch_start, end_date = end_date)
+                self._merge(fetched, fetch_start, end_date)
+                # results after today can still change, so never count them as synced
+                synced_to = min(end_date, today)
+                self.manifest = {"start_date": self.manifest.get("start_date", start_date),
+                                 "synced_to": max(self.manifest.get("synced_to", synced_to), synced_to),
+                                 "synced_at": datetime.now().isoformat(timespec = "seconds")}
+                self._save()
+            dates = _fixture_dates(self.fixtures)
+            return self.fixtures[(dates >= start_date) & (dates <= end_date)].reset_index(drop = True)
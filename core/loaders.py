@@ -16,6 +16,47 @@ def load_json_or_csv(filepath):
         raise ValueError("Mined data file type not recognised: " + str(filepath))
 
 
+def _is_date_column(col) -> bool:
+    # the columns pd.read_json converts to dates by default
+    if not isinstance(col, str):
+        return False
+    col = col.lower()
+    return col.endswith("_at") or col.endswith("_time") or col.startswith("timestamp") or \
+        col in ("modified", "date", "datetime")
+
+
+def frame_from_json(data) -> pd.DataFrame:
+    """
+    Def to create a dataframe from already parsed json, e.g. a response body, as pd.read_json would parse it when it
+    is saved to file and loaded with load_json_or_csv, without serialising and parsing it again
+    :param data: dict or list
+            parsed json, a dict of columns or a list of records
+    :return: dataframe
+    """
+    df = pd.DataFrame(data)
+    # axis labels and columns that are numbers or dates stored as strings are converted, as by pd.read_json
+    for axis in ("index", "columns"):
+        labels = getattr(df, axis)
+        if labels.dtype == object or pd.api.types.is_string_dtype(labels):
+            try:
+                setattr(df, axis, pd.Index(pd.to_numeric(labels)))
+            except (ValueError, TypeError):
+                pass
+    for col in df.columns:
+        if _is_date_column(col):
+            try:
+                df[col] = pd.to_datetime(df[col])
+                continue
+            except (ValueError, TypeError):
+                pass
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
 def load_and_aggregate(backtesting_data):
 
     """
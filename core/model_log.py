@@ -0,0 +1,247 @@
+"""
+Model log backed by SQLite, used to record the performance of every saved model. Replaces saved_models/model_log.csv,
+which is migrated the first time the log is opened
+"""
+
+from contextlib import closing
+from pathlib import Path
+import os
+import sqlite3
+import pandas as pd
+from pandas import DataFrame
+
+
+# model log column name to SQLite column name
+log_columns = {"Model ID": "model_id",
+               "Date": "date",
+               "Model type": "model_type",
+               "Test Acc": "test_acc",
+               "Test F1": "test_f1",
+               "Test Loss": "test_loss",
+               "Params": "params",
+               "Seed": "seed"}
+
+_schema = """
+CREATE TABLE IF NOT EXISTS model_log (
+    model_id TEXT PRIMARY KEY,
+    date TEXT,
+    model_type INTEGER,
+    test_acc REAL,
+    test_f1 REAL,
+    test_loss REAL,
+    params TEXT,
+    seed INTEGER
+);
+CREATE INDEX IF NOT EXISTS model_log_test_acc ON model_log (test_acc);
+CREATE INDEX IF NOT EXISTS model_log_test_f1 ON model_log (test_f1);
+CREATE INDEX IF NOT EXISTS model_log_test_loss ON model_log (test_loss);
+CREATE INDEX IF NOT EXISTS model_log_date ON model_log (date);
+CREATE INDEX IF NOT EXISTS model_log_model_type ON model_log (model_type, test_acc);
+CREATE INDEX IF NOT EXISTS model_log_model_type_test_f1 ON model_log (model_type, test_f1);
+CREATE INDEX IF NOT EXISTS model_log_model_type_test_loss ON model_log (model_type, test_loss);
+CREATE INDEX IF NOT EXISTS model_log_model_type_date ON model_log (model_type, date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _to_sql_value(value):
+    """
+    Def used to convert pandas / numpy values to values SQLite can store
+    """
+    if value is None or (not isinstance(value, str) and pd.isnull(value)):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class ModelLog(object):
+
+    def __init__(self, saved_models_dir: str = None, timeout: float = 30.0):
+        """
+        Constructor creates the model log database if required and migrates model_log.csv into it the first time
+        it is opened
+        :param saved_models_dir: str
+                OPTIONAL - directory models are saved in, defaults to saved_models/ in the working directory
+        :param timeout: float
+                OPTIONAL - seconds to wait for other processes writing to the log
+        """
+        if saved_models_dir is None:
+            saved_models_dir = str(Path().absolute()) + "/saved_models/"
+        if not os.path.exists(saved_models_dir):
+            os.makedirs(saved_models_dir)
+        self.saved_models_dir = saved_models_dir
+        self.db_loc = saved_models_dir + "model_log.db"
+        self.csv_loc = saved_models_dir + "model_log.csv"
+        self.timeout = timeout
+
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_schema)
+            # add any columns missing from logs created by older versions
+            existing_columns = [row[1] for row in connection.execute("PRAGMA table_info(model_log)")]
+            for sql_column in log_columns.values():
+                if sql_column not in existing_columns:
+                    connection.execute("ALTER TABLE model_log ADD COLUMN {}".format(sql_column))
+        self.migrate_from_csv()
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode, transactions are opened explicitly so writes are atomic
+        return sqlite3.connect(self.db_loc, timeout = self.timeout, isolation_level = None)
+
+    def _query(self, sql: str, params: tuple = ()) -> DataFrame:
+        with closing(self._connect()) as connection:
+            df = pd.read_sql_query(sql, connection, params = params)
+        return df.rename(columns = {v: k for k, v in log_columns.items()})
+
+    def _write(self, sql: str, rows: list) -> None:
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(sql, rows)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _columns(entries: DataFrame) -> list:
+        unknown_columns = [col for col in entries.columns if col not in log_columns]
+        if unknown_columns:
+            raise ValueError("Columns not recognised by the model log: " + str(unknown_columns))
+        return list(entries.columns)
+
+    def migrate_from_csv(self, csv_loc: str = None) -> int:
+        """
+        Method to import the entries of a csv model log, each csv is only imported once
+        :param csv_loc: str
+                OPTIONAL - filepath of csv model log, defaults to saved_models/model_log.csv
+        :return: int
+                number of entries imported
+        """
+        csv_loc = csv_loc or self.csv_loc
+        if not os.path.exists(csv_loc) or os.path.getsize(csv_loc) == 0:
+            return 0
+        migration_key = "migrated:" + os.path.abspath(csv_loc)
+        with closing(self._connect()) as connection:
+            already_migrated = connection.execute("SELECT 1 FROM meta WHERE key = ?", (migration_key,)).fetchone()
+        if already_migrated:
+            return 0
+
+        csv_log = pd.read_csv(csv_loc, dtype = {"Model ID": str, "Date": str})
+        csv_log = csv_log[[col for col in csv_log.columns if col in log_columns]]
+        columns = self._columns(csv_log)
+        rows = [tuple(_to_sql_value(v) for v in row) for row in csv_log.itertuples(index = False)]
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany("INSERT OR IGNORE INTO model_log ({}) VALUES ({})".format(
+                    ", ".join(log_columns[col] for col in columns), ", ".join("?" for _ in columns)), rows)
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (migration_key, "1"))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def __len__(self):
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM model_log").fetchone()[0]
+
+    def append(self, entries) -> None:
+        """
+        Method to add entries to the log, all entries are added in one transaction
+        :param entries: DataFrame or dict
+                entries to add, columns / keys are model log column names e.g. "Model ID", "Test Acc"
+        :return: nothing
+        """
+        entries = pd.DataFrame(data = entries)
+        columns = self._columns(entries)
+        rows = [tuple(_to_sql_value(v) for v in row) for row in entries.itertuples(index = False)]
+        self._write("INSERT INTO model_log ({}) VALUES ({})".format(
+            ", ".join(log_columns[col] for col in columns), ", ".join("?" for _ in columns)), rows)
+
+    def update(self, results: DataFrame) -> None:
+        """
+        Method to update the entries of many models in one transaction
+        :param results: DataFrame
+                dataframe with a "Model ID" column and a column for each log column to update, e.g. "Test Loss"
+        :return: nothing
+        """
+        columns = [col for col in self._columns(results) if col != "Model ID"]
+        rows = [tuple(_to_sql_value(v) for v in row)
+                for row in results[columns + ["Model ID"]].itertuples(index = False)]
+        self._write("UPDATE model_log SET {} WHERE model_id = ?".format(
+            ", ".join(log_columns[col] + " = ?" for col in columns)), rows)
+
+    def remove(self, model_ids: list) -> None:
+        """
+        Method to remove models from the log
+        :param model_ids: list of str
+                unique model ids of the models to remove
+        :return: nothing
+        """
+        self._write("DELETE FROM model_log WHERE model_id = ?", [(model_id,) for model_id in model_ids])
+
+    @staticmethod
+    def _top_sql(k: int, by: str, ascending: bool, model_type: int = None) -> tuple:
+        if by not in log_columns:
+            raise ValueError("Column not recognised by the model log: " + str(by))
+        where = "WHERE {} IS NOT NULL ".format(log_columns[by])
+        params = ()
+        if model_type is not None:
+            where += "AND model_type = ? "
+            params = (model_type,)
+        sql = "SELECT * FROM model_log {}ORDER BY {} {} LIMIT ?".format(where, log_columns[by],
+                                                                       "ASC" if ascending else "DESC")
+        return sql, params + (int(k),)
+
+    def query_plan(self, sql: str, params: tuple = ()) -> list:
+        """
+        Method to get the plan SQLite uses for a query, e.g. to check that it uses an index
+        :param sql: str
+                query to plan
+        :param params: tuple
+                OPTIONAL - parameters of the query
+        :return: list of str
+                detail of each step of the plan
+        """
+        with closing(self._connect()) as connection:
+            return [row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+    def top(self, k: int, by: str = "Test Acc", ascending: bool = False, model_type: int = None) -> DataFrame:
+        """
+        Method to get the k best (or worst) performing models, uses the index on by (and model_type) so only k rows
+        are read. Models without a value for by are not returned
+        :param k: int
+                number of models to return
+        :param by: str
+                OPTIONAL - model log column to rank models by, default is "Test Acc"
+        :param ascending: bool
+                OPTIONAL - if True return the k lowest ranked models instead
+        :param model_type: int
+                OPTIONAL - only consider models of this type
+        :return: DataFrame
+                model log entries of the selected models, in rank order
+        """
+        sql, params = self._top_sql(k = k, by = by, ascending = ascending, model_type = model_type)
+        return self._query(sql, params)
+
+    def to_frame(self) -> DataFrame:
+        """
+        :return: DataFrame
+                the full model log
+        """
+        return self._query("SELECT * FROM model_log ORDER BY date, model_id")
+
+    def to_csv(self, csv_loc: str) -> None:
+        """
+        Method to export the full model log to csv
+        :param csv_loc: str
+                filepath to export to
+        :return: nothing
+        """
+        self.to_frame().to_csv(csv_loc, index_label = False, index = False)
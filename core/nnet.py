@@ -1,20 +1,34 @@
 """
 Class to create and def to train PyTorch NeuralNetwork
 """
+import time
 import torch
 from torch import nn
 from tqdm import tqdm
-from sklearn.metrics import classification_report, confusion_matrix, f1_score, accuracy_score
 
 seed = 42
 torch.manual_seed(seed)
 
 
 class NNet(nn.Module):
-    def __init__(self):
+    def __init__(self, input_size: int = 12, hidden_size: int = 10, output_size: int = 3):
         super(NNet, self).__init__()
-        self.lin1 = nn.Linear(12, 10)
-        self.lin2 = nn.Linear(10, 3)
+        self.lin1 = nn.Linear(input_size, hidden_size)
+        self.lin2 = nn.Linear(hidden_size, output_size)
+
+    @classmethod
+    def from_state_dict(cls, state_dict: dict):
+        """
+        Method to create a network shaped to fit a saved state dict and load it
+        :param state_dict: dict
+                state dict of a saved NNet
+        :return: NNet
+        """
+        hidden_size, input_size = state_dict["lin1.weight"].shape
+        output_size = state_dict["lin2.weight"].shape[0]
+        net = cls(input_size = input_size, hidden_size = hidden_size, output_size = output_size)
+        net.load_state_dict(state_dict)
+        return net
 
     def forward(self, x):
         x = self.lin1(x)
@@ -22,6 +36,69 @@ class NNet(nn.Module):
         return x
 
 
+def confusion_matrices(labels: torch.Tensor, predicted: torch.Tensor, num_classes: int = 3) -> torch.Tensor:
+    """
+    Def to build a confusion matrix for each of a batch of models in one bincount
+    :param labels: Tensor
+            true labels of shape (fixtures,)
+    :param predicted: Tensor
+            predicted labels of shape (models, fixtures)
+    :param num_classes: int
+            number of classes
+    :return: Tensor
+            confusion matrices of shape (models, num_classes, num_classes), rows are true labels and columns are
+            predicted labels
+    """
+    models = predicted.shape[0]
+    offsets = torch.arange(models, device = predicted.device).unsqueeze(1) * num_classes * num_classes
+    flat_index = offsets + labels.unsqueeze(0).long() * num_classes + predicted.long()
+    counts = torch.bincount(flat_index.flatten(), minlength = models * num_classes * num_classes)
+    return counts.reshape(models, num_classes, num_classes)
+
+
+def accuracy_and_weighted_f1(confusion: torch.Tensor) -> tuple:
+    """
+    Def to calculate accuracy and support weighted F1 score from confusion matrices
+    :param confusion: Tensor
+            confusion matrices of shape (models, classes, classes), as returned by confusion_matrices
+    :return: tuple
+            Tensor of accuracy (%) and Tensor of weighted F1 score for each model
+    """
+    confusion = confusion.double()
+    true_positives = torch.diagonal(confusion, dim1 = 1, dim2 = 2)
+    support = confusion.sum(dim = 2)
+    predicted_counts = confusion.sum(dim = 1)
+    total = support.sum(dim = 1)
+
+    # classes that are never predicted or never present have a precision / recall of 0, as in sklearn
+    precision = torch.where(predicted_counts > 0, true_positives / predicted_counts.clamp(min = 1),
+                            torch.zeros_like(true_positives))
+    recall = torch.where(support > 0, true_positives / support.clamp(min = 1), torch.zeros_like(true_positives))
+    denominator = precision + recall
+    f1 = torch.where(denominator > 0, 2 * precision * recall / denominator.clamp(min = 1e-12),
+                     torch.zeros_like(denominator))
+
+    accuracy = 100 * true_positives.sum(dim = 1) / total.clamp(min = 1)
+    weighted_f1 = (f1 * support).sum(dim = 1) / total.clamp(min = 1)
+    return accuracy, weighted_f1
+
+
+def batch_weight(criterion, labels: torch.Tensor) -> torch.Tensor:
+    """
+    Def to get the total weight a loss with mean reduction divides a batch's summed loss by, the batch size or, for
+    a class weighted loss (e.g. CrossEntropyLoss(weight = ...)), the sum of the weights of the batch's labels
+    :param criterion:
+            a torch loss function with mean reduction
+    :param labels: Tensor
+            labels of the batch
+    :return: Tensor
+    """
+    weight = getattr(criterion, "weight", None)
+    if weight is None:
+        return torch.tensor(float(labels.shape[0]), device = labels.device)
+    return weight.to(labels.device)[labels].sum()
+
+
 def train(nn: nn.Module,
           train_dataloder: list,
           test_dataloder: list,
@@ -29,7 +106,12 @@ def train(nn: nn.Module,
           criterion,
           optimiser,
           lr_scheduler,
-          verbose: bool
+          verbose: bool,
+          patience: int = None,
+          time_budget: float = None,
+          deadline: float = None,
+          restore_best: bool = False,
+          callbacks: list = None
           ) -> tuple:
     """
     Training loop
@@ -48,8 +130,24 @@ def train(nn: nn.Module,
     :param optimiser:
             a torch optimiser
     :param verbose:
-    :param lr_scheduler:
+    :param patience: int
+            OPTIONAL - stop training once test loss hasn't improved for this many epochs
+    :param time_budget: float
+            OPTIONAL - seconds training may take, training stops once the budget is spent (or the next epoch would
+            not fit in it)
+    :param deadline: float
+            OPTIONAL - time.monotonic() time by which training must stop, e.g. shared by every model trained in
+            parallel. If time_budget is also passed training stops at whichever comes first
+    :param restore_best: bool
+            OPTIONAL - once training stops, load the weights of the epoch with the lowest test loss
+    :param callbacks: list
+            OPTIONAL - callables called after each epoch with a dict of the epoch's metrics: "epoch", "train_loss",
+            "test_loss", "test_accuracy", "test_f1" and "confusion" (confusion matrix of the full test set, rows are
+            true labels and columns are predicted labels)
     :return: history
+            tuple of lists of the epoch number, test accuracy, test F1 score and test loss of each epoch (the mean
+            loss over the test samples, weighted by class if the criterion is), and the
+            index of the epoch whose weights the network has once training stops
     """
 
     device = ("cuda" if torch.cuda.is_available() else "cpu")
@@ -58,17 +156,28 @@ def train(nn: nn.Module,
     epoch_counter = []
     test_accuracy = []
     test_f1_score = []
+    test_losses = []
+
+    start_time = time.monotonic()
+    if time_budget is not None:
+        deadline = start_time + time_budget if deadline is None else min(deadline, start_time + time_budget)
+    best_epoch = None
+    best_state = None
+    epochs_without_improvement = 0
+    out_of_time = False
 
     for epoch in range(epochs):
 
         epoch_counter.append(epoch + 1)
         running_loss = 0.0
-
-        train_dataloder = tqdm(train_dataloder)
+        train_weight = 0.0
 
         nn.train()
 
-        for data in train_dataloder:
+        # only show a progress bar when verbose, updating it is expensive when there are many small batches
+        train_batches = tqdm(train_dataloder) if verbose else train_dataloder
+
+        for data in train_batches:
             inputs, labels = data
             inputs = inputs.to(device)
             labels = labels.to(device)
@@ -80,30 +189,46 @@ def train(nn: nn.Module,
             loss.backward()
             optimiser.step()
             lr_scheduler.step()
-            running_loss += loss.item()
-
-        # calcuate test accuracy
-        correct = 0
-        total = 0
+            # undo each batch's mean reduction, so the epoch loss is the (weighted) mean over samples
+            weight = batch_weight(criterion, labels).item()
+            running_loss += loss.item() * weight
+            train_weight += weight
+            if deadline is not None and time.monotonic() > deadline:
+                # evaluate the weights so far, then stop
+                out_of_time = True
+                break
 
+        # evaluate on the full test set, predictions stay on the device until the epoch's confusion matrix is built
         with torch.no_grad():
-            test_loss = 0
             nn.eval()
+            test_loss = torch.zeros((), device = device)
+            test_weight = torch.zeros((), device = device)
+            all_labels = []
+            all_predicted = []
             for data in test_dataloder:
                 test_inputs, test_labels = data
 
                 test_inputs = test_inputs.to(device)
                 test_labels = test_labels.to(device)
 
-                test_outputs = nn(test_inputs)
-                test_loss += criterion(test_outputs, test_labels).item()
+                test_outputs = nn(test_inputs.float())
+                weight = batch_weight(criterion, test_labels)
+                test_loss += criterion(test_outputs, test_labels) * weight
+                test_weight += weight
+
+                all_labels.append(test_labels)
+                all_predicted.append(test_outputs.argmax(dim = 1))
 
-                _, predicted = torch.max(test_outputs.data, 1)
-                total += test_labels.size(0)
-                correct += (predicted == test_labels).sum().item()
+            confusion = confusion_matrices(labels = torch.cat(all_labels),
+                                           predicted = torch.cat(all_predicted).unsqueeze(0),
+                                           num_classes = test_outputs.shape[1])
+            accuracy, weighted_f1 = accuracy_and_weighted_f1(confusion)
 
-        test_accuracy_item = 100 * (correct / total)
-        test_f1_score_item = f1_score(test_labels, predicted, average = 'weighted')
+        # mean loss over the samples, comparable between batch sizes and samples_per_epoch settings
+        running_loss = running_loss / train_weight if train_weight > 0 else 0.0
+        test_loss = (test_loss / test_weight).item() if test_weight.item() > 0 else 0.0
+        test_accuracy_item = accuracy.item()
+        test_f1_score_item = weighted_f1.item()
         if verbose:
             print(
                 '\nEpoch [{}/{}] | Train Loss: {:.2f} | Test Loss {:.2f} | Test Accuracy: {:.2f}% | Test F1 Score: {:.2f}'.format(
@@ -115,7 +240,42 @@ def train(nn: nn.Module,
                     test_f1_score_item))
         test_accuracy.append(test_accuracy_item)
         test_f1_score.append(test_f1_score_item)
+        test_losses.append(test_loss)
+
+        for callback in callbacks or []:
+            callback({"epoch": epoch + 1,
+                      "train_loss": running_loss,
+                      "test_loss": test_loss,
+                      "test_accuracy": test_accuracy_item,
+                      "test_f1": test_f1_score_item,
+                      "confusion": confusion[0].cpu()})
+
+        # keep a copy of the best weights seen so far
+        if best_epoch is None or test_loss < test_losses[best_epoch]:
+            best_epoch = epoch
+            epochs_without_improvement = 0
+            if restore_best:
+                best_state = {k: v.detach().clone() for k, v in nn.state_dict().items()}
+        else:
+            epochs_without_improvement += 1
+
+        now = time.monotonic()
+        if patience is not None and epochs_without_improvement >= patience:
+            if verbose:
+                print("\nEarly stopping, test loss hasn't improved for {} epoch(s)".format(patience))
+            break
+        # stop if the next epoch, taking as long as the average epoch so far, would not finish by the deadline
+        if deadline is not None and (out_of_time or now + (now - start_time) / (epoch + 1) > deadline):
+            if verbose:
+                print("\nStopping, time budget spent")
+            break
+
+    if restore_best and best_state is not None:
+        nn.load_state_dict(best_state)
+        final_epoch = best_epoch
+    else:
+        final_epoch = len(epoch_counter) - 1
 
-    history = (epoch_counter, test_accuracy, test_f1_score)
+    history = (epoch_counter, test_accuracy, test_f1_score, test_losses, final_epoch)
 
     return history
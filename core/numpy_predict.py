@@ -0,0 +1,138 @@
+"""
+Torch free backend used to predict results utilising the fused NumPy artifacts exported by core.export. NNet has no
+activation between its layers so the scaler and both linear layers fold into a single affine map, nothing here
+imports torch. Probabilities match the torch backend (core.predict) within 1e-7, computed in float64 rather than
+float32
+"""
+
+from functools import lru_cache
+import pathlib
+import numpy as np
+import pandas as pd
+
+
+class FusedModel(object):
+
+    def __init__(self, model_id: str, exp_cols: list, weight, bias):
+        """
+        Saved model with its scaler and layers folded into logits = features @ weight + bias, where features are
+        the raw (unscaled) expected features
+        :param model_id: str
+                unique model id
+        :param exp_cols: list of str
+                list of the features the model expects, in order
+        :param weight: array like
+                fused weight of shape (features, 3)
+        :param bias: array like
+                fused bias of shape (3,)
+        """
+        self.model_id = model_id
+        self.exp_cols = list(exp_cols)
+        self.weight = np.asarray(weight, dtype = np.float64)
+        self.bias = np.asarray(bias, dtype = np.float64)
+
+    @classmethod
+    def from_npz(cls, npz_path: str):
+        """
+        Method to load a fused model written by save
+        :param npz_path: str
+                filepath of the npz artifact
+        :return: FusedModel
+        """
+        with np.load(npz_path, allow_pickle = False) as artifact:
+            return cls(model_id = str(artifact["model_id"]), exp_cols = artifact["exp_cols"].tolist(),
+                       weight = artifact["weight"], bias = artifact["bias"])
+
+    def save(self, npz_path: str) -> None:
+        """
+        Method to write the fused model to file
+        :param npz_path: str
+                filepath to write the npz artifact to
+        :return: nothing
+        """
+        np.savez(npz_path, model_id = np.array(self.model_id), exp_cols = np.array(self.exp_cols),
+                 weight = self.weight, bias = self.bias)
+
+    def probabilities(self, rawdata) -> np.ndarray:
+        """
+        Method to get the probabilities of each result for every fixture
+        :param rawdata: DataFrame
+                dataframe containing (at least) the expected features
+        :return: np.ndarray
+                probabilities of shape (fixtures, 3), classes in the order H, A, D
+        """
+        logits = rawdata[self.exp_cols].to_numpy(dtype = np.float64) @ self.weight + self.bias
+        # softmax, shifted by the max logit for numerical stability
+        exp_logits = np.exp(logits - logits.max(axis = 1, keepdims = True))
+        return exp_logits / exp_logits.sum(axis = 1, keepdims = True)
+
+
+def fused_model_path(saved_models_dir: str, model_id: str) -> str:
+    return saved_models_dir + model_id + "/" + model_id + "_fused.npz"
+
+
+@lru_cache(maxsize = 64)
+def load_fused_model(saved_models_dir: str, model_id: str) -> FusedModel:
+    """
+    Def to load the fused artifact of a saved model, cached so each model is only read from disk once
+    :param saved_models_dir: str
+            directory models are saved in
+    :param model_id: str
+            unique model id
+    :return: FusedModel
+    """
+    npz_path = fused_model_path(saved_models_dir, model_id)
+    try:
+        return FusedModel.from_npz(npz_path)
+    except FileNotFoundError:
+        raise FileNotFoundError("No fused NumPy artifact for model {}, export it with "
+                                "core.export.export_model".format(model_id)) from None
+
+
+class NumpyPredict(object):
+
+    def __init__(self, model_id):
+        """
+        :param model_id: str
+                unique model id
+        """
+
+        self.path = str(pathlib.Path().absolute())
+        self.model_id = model_id
+        self.saved_models_dir = self.path + "/saved_models/"
+        self.model = load_fused_model(self.saved_models_dir, model_id)
+        self.exp_cols = self.model.exp_cols
+
+    def predict(self, data_and_fixtures):
+        """
+        :param data_and_fixtures: dataframe
+                dataframe of the fixtures to predict and the data to predict them with
+        :return: dataframe
+                dataframe of probabilities
+        """
+        missing_features = [col for col in self.exp_cols if col not in data_and_fixtures.columns]
+        if missing_features:
+            raise ValueError("Passed data is missing features expected by model {}: {}".format(
+                self.model_id, missing_features))
+
+        return predictions_frame(data_and_fixtures = data_and_fixtures,
+                                 probabilities = self.model.probabilities(data_and_fixtures))
+
+
+def predictions_frame(data_and_fixtures, probabilities) -> pd.DataFrame:
+    """
+    def used to create the prediction output dataframe from the probabilities of each result
+    :param data_and_fixtures: dataframe
+            dataframe of the fixtures that were predicted
+    :param probabilities: np.ndarray
+            array of shape (fixtures, 3) of the probability of each result, in the order H, A, D
+    :return: dataframe
+            dataframe of probabilities and APPLE's prediction for each fixture
+    """
+    final_prediction = np.array(["H", "A", "D"])[np.argmax(probabilities, axis = 1)]
+
+    predicted_result = pd.DataFrame(
+        {'HomeTeam': data_and_fixtures["HomeTeam"].to_list(), "AwayTeam": data_and_fixtures["AwayTeam"].to_list(),
+         "FixtureID": data_and_fixtures["FixtureID"].to_list(), 'p(H)': probabilities[:, 0],
+         'p(A)': probabilities[:, 1], 'p(D)': probabilities[:, 2], "APPLE Prediction": final_prediction})
+    return predicted_result
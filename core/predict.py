@@ -2,11 +2,14 @@
 Class used to predict results utilising saved models generated by train.py
 """
 
-from core.nnet import NNet
+from core.registry import model_registry
+from core.ensemble import stack_models
 import torch
 import torch.nn as nn
 import pandas as pd
+import numpy as np
 from core.data_processing import formatting_for_passing_to_model
+from core.numpy_predict import predictions_frame
 import pathlib
 
 pd.options.mode.chained_assignment = None  # default='warn'
@@ -23,12 +26,11 @@ class Predict(object):
         self.path = str(pathlib.Path().absolute())
         self.model_id = model_id
         self.saved_models_dir = self.path + "/saved_models/"
-        # load the selected trained model
-        self.net = NNet()
-        self.net.load_state_dict(torch.load(self.saved_models_dir + model_id + "/" + model_id + ".pth"))
-        # load the list of expected features for the chosen model
-        exp_cols_df = pd.read_csv(self.saved_models_dir + model_id + "/" + model_id + ".csv")
-        self.exp_cols = exp_cols_df["columns"].to_list()
+        # get the selected trained model and the list of expected features for it, only loaded from disk the first
+        # time the model is used
+        loaded_model = model_registry.get(model_id = model_id, saved_models_dir = self.saved_models_dir)
+        self.net = loaded_model.net
+        self.exp_cols = loaded_model.exp_cols
 
     def predict(self, data_and_fixtures):
         """
@@ -37,34 +39,61 @@ class Predict(object):
         :return: dataframe
                 dataframe of probabilities
         """
-
-        home_teams_to_predict = data_and_fixtures["HomeTeam"].to_list()
-        away_teams_to_predict = data_and_fixtures["AwayTeam"].to_list()
-        fixture_ids = data_and_fixtures["FixtureID"].to_list()
-
         # try and format the data so that it can be passed to specified model
         features_tensor = formatting_for_passing_to_model(rawdata = data_and_fixtures,
                                                   exp_features = self.exp_cols,
                                                   saved_models_dir = self.saved_models_dir,
                                                   model_id = self.model_id)
 
-        result = self.net(features_tensor)
+        with torch.no_grad():
+            result = self.net(features_tensor)
         sm = nn.Softmax(dim = 1)
         result = sm(result)
-        _, predicted = torch.max(result.data, 1)
         result = result.detach().numpy()
 
-        final_prediction = []
+        return predictions_frame(data_and_fixtures = data_and_fixtures, probabilities = result)
+
+
+class EnsemblePredict(object):
+
+    def __init__(self, model_ids: list):
+        """
+        :param model_ids: list of str
+                unique model ids of the models in the ensemble
+        """
+
+        self.path = str(pathlib.Path().absolute())
+        self.model_ids = list(model_ids)
+        self.saved_models_dir = self.path + "/saved_models/"
+        # get the selected trained models and stack their weights so all of them (or all of them with the same
+        # shape) are evaluated in one forward pass
+        loaded_models = [model_registry.get(model_id = model_id, saved_models_dir = self.saved_models_dir)
+                         for model_id in self.model_ids]
+        self.stacked_nets = stack_models(loaded_models)
+
+    def predict(self, data_and_fixtures) -> tuple:
+        """
+        :param data_and_fixtures: dataframe
+                dataframe of the fixtures to predict and the data to predict them with
+        :return: tuple
+                dataframe of probabilities averaged over all models in the ensemble and
+                dataframe of the probabilities of each model, with a "Model ID" column
+        """
+        # (models, fixtures, 3), in the order of model_ids
+        model_probabilities = {}
+        for stacked_net in self.stacked_nets:
+            model_probabilities.update(zip(stacked_net.model_ids, stacked_net.probabilities(data_and_fixtures)))
+        probabilities = np.stack([model_probabilities[model_id] for model_id in self.model_ids])
+
+        averaged_result = predictions_frame(data_and_fixtures = data_and_fixtures,
+                                            probabilities = probabilities.mean(axis = 0))
+
+        per_model_results = []
+        for i in range(0, len(self.model_ids)):
+            model_result = predictions_frame(data_and_fixtures = data_and_fixtures, probabilities = probabilities[i])
+            model_result.insert(0, "Model ID", self.model_ids[i])
+            per_model_results.append(model_result)
+        per_model_result = pd.concat(per_model_results, ignore_index = True)
 
-        for i in range(0, len(predicted)):
-            if predicted[i] == 0:
-                final_prediction.append("H")
-            elif predicted[i] == 1:
-                final_prediction.append("A")
-            elif predicted[i] == 2:
-                final_prediction.append("D")
+        return averaged_result, per_model_result
 
-        predicted_result = pd.DataFrame(
-            {'HomeTeam': home_teams_to_predict, "AwayTeam": away_teams_to_predict, "FixtureID": fixture_ids, 'p(H)': result[:, 0], 'p(A)': result[:, 1], 'p(D)': result[:, 2],
-             "APPLE Prediction": final_prediction})
-        return predicted_result
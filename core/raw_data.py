@@ -0,0 +1,177 @@
+"""
+Content-addressed local cache of the raw football-data.co.uk data models are trained on. Downloads are conditional
+(ETag / Last-Modified) and the preprocessed combined data is kept as a binary snapshot keyed by the hashes of the
+raw files it was made from and of the preprocessing code
+"""
+
+from http.client import RemoteDisconnected
+from urllib.error import HTTPError, URLError
+from termcolor import colored
+import urllib.request
+import pandas as pd
+from pandas import DataFrame
+import hashlib
+import inspect
+import json
+import os
+import time
+from utils.file_utils import atomic_path, write_atomic
+
+
+# (name, url) of each season of raw data, in the order they are passed to preprocessing
+season_sources = [("1920", "https://www.football-data.co.uk/mmz4281/1920/E0.csv"),
+                  ("2021", "http://www.football-data.co.uk/mmz4281/2021/E0.csv"),
+                  ("1819", "https://www.football-data.co.uk/mmz4281/1819/E0.csv")]
+
+
+def _code_hash(preprocess) -> str:
+    # hash of the source of the module preprocess is defined in, so changing the preprocessing code (including the
+    # helpers it calls from the same module) invalidates the snapshots it made
+    try:
+        with open(inspect.getsourcefile(preprocess), "rb") as source_file:
+            source = source_file.read()
+    except (TypeError, OSError):
+        source = preprocess.__code__.co_code
+    name = (preprocess.__module__ + "." + preprocess.__qualname__).encode("utf-8")
+    return hashlib.sha256(name + b";" + source).hexdigest()
+
+
+class RawDataCache(object):
+
+    def __init__(self, cache_dir: str, timeout: float = 30, prune_grace: float = 3600):
+        """
+        :param cache_dir: str
+                directory to keep the cache in, e.g. data/raw/
+        :param timeout: float
+                OPTIONAL - seconds to wait for football-data.co.uk to respond
+        :param prune_grace: float
+                OPTIONAL - seconds unreferenced snapshots and raw data files are kept for, so files another process
+                is about to read (or is still writing) aren't removed
+        """
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.snapshots_dir = os.path.join(cache_dir, "snapshots")
+        self.manifest_loc = os.path.join(cache_dir, "manifest.json")
+        self.timeout = timeout
+        self.prune_grace = prune_grace
+        for directory in [self.objects_dir, self.snapshots_dir]:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        if os.path.exists(self.manifest_loc):
+            with open(self.manifest_loc) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        else:
+            self.manifest = {}
+
+    def _save_manifest(self) -> None:
+        write_atomic(self.manifest_loc, json.dumps(self.manifest, indent = 2).encode("utf-8"))
+
+    def object_loc(self, sha256: str) -> str:
+        """
+        :param sha256: str
+                hash of the contents of a raw data file
+        :return: str
+                filepath of the cached raw data file
+        """
+        return os.path.join(self.objects_dir, sha256 + ".csv")
+
+    def _store(self, contents: bytes) -> str:
+        sha256 = hashlib.sha256(contents).hexdigest()
+        if not os.path.exists(self.object_loc(sha256)):
+            write_atomic(self.object_loc(sha256), contents)
+        return sha256
+
+    def _legacy_entry(self, name: str) -> dict:
+        # raw data downloaded before the cache existed was saved as <name>.csv, adopt it so it can be used offline
+        legacy_loc = os.path.join(self.cache_dir, name + ".csv")
+        if not os.path.exists(legacy_loc):
+            return {}
+        with open(legacy_loc, "rb") as legacy_file:
+            return {"sha256": self._store(legacy_file.read())}
+
+    def fetch(self, name: str, url: str) -> str:
+        """
+        Method to get a raw data file, only downloaded if it has changed since it was last fetched
+        :param name: str
+                name of the raw data file, e.g. the season
+        :param url: str
+                url to download the raw data file from
+        :return: str
+                sha256 hash of the contents of the raw data file
+        """
+        entry = self.manifest.get(name) or self._legacy_entry(name)
+        request = urllib.request.Request(url)
+        if entry.get("url") == url and "sha256" in entry and os.path.exists(self.object_loc(entry["sha256"])):
+            if entry.get("etag"):
+                request.add_header("If-None-Match", entry["etag"])
+            if entry.get("last_modified"):
+                request.add_header("If-Modified-Since", entry["last_modified"])
+        try:
+            with urllib.request.urlopen(request, timeout = self.timeout) as response:
+                contents = response.read()
+                entry = {"url": url,
+                         "etag": response.headers.get("ETag"),
+                         "last_modified": response.headers.get("Last-Modified"),
+                         "sha256": self._store(contents)}
+        except HTTPError as error:
+            if error.code != 304:
+                entry = self._fallback(name, entry)
+        except (RemoteDisconnected, URLError, OSError):
+            entry = self._fallback(name, entry)
+
+        self.manifest[name] = entry
+        self._save_manifest()
+        return entry["sha256"]
+
+    def _fallback(self, name: str, entry: dict) -> dict:
+        if "sha256" not in entry or not os.path.exists(self.object_loc(entry["sha256"])):
+            raise FileNotFoundError("Unable to download raw data for {} and no cached copy exists".format(name))
+        print(colored("Error connecting to remote when sourcing updated data, using data stored locally instead",
+                      "red"))
+        return entry
+
+    def combined(self, preprocess, sources: list = None) -> DataFrame:
+        """
+        Method to get the preprocessed combination of all raw data files, preprocessing is only re-run if one of the
+        raw data files has changed
+        :param preprocess: function
+                def that takes one dataframe per raw data file and returns the combined dataframe,
+                e.g. core.data_processing.preprocessing
+        :param sources: list of tuple
+                OPTIONAL - (name, url) of each raw data file, defaults to season_sources
+        :return: DataFrame
+                the preprocessed combined data
+        """
+        sources = season_sources if sources is None else sources
+        hashes = [self.fetch(name = name, url = url) for name, url in sources]
+
+        snapshot_key = hashlib.sha256((";".join(name + ":" + sha256 for (name, _), sha256 in zip(sources, hashes)) +
+                                       ";preprocess:" + _code_hash(preprocess)).encode("utf-8")).hexdigest()
+        snapshot_loc = os.path.join(self.snapshots_dir, snapshot_key + ".pkl")
+        if os.path.exists(snapshot_loc):
+            return pd.read_pickle(snapshot_loc)
+
+        combined = preprocess(*[pd.read_csv(self.object_loc(sha256)) for sha256 in hashes])
+        with atomic_path(snapshot_loc) as tmp_snapshot_loc:
+            combined.to_pickle(tmp_snapshot_loc)
+        self._prune(keep_snapshot = snapshot_loc)
+        return combined
+
+    def _remove_if_stale(self, filepath: str) -> None:
+        try:
+            if os.path.getmtime(filepath) < time.time() - self.prune_grace:
+                os.remove(filepath)
+        except FileNotFoundError:
+            # already removed by another process
+            pass
+
+    def _prune(self, keep_snapshot: str) -> None:
+        # remove snapshots and raw data files that are no longer referenced and haven't been written recently
+        for snapshot in os.listdir(self.snapshots_dir):
+            snapshot_loc = os.path.join(self.snapshots_dir, snapshot)
+            if snapshot_loc != keep_snapshot:
+                self._remove_if_stale(snapshot_loc)
+        referenced = set(entry.get("sha256") for entry in self.manifest.values())
+        for raw_data_file in os.listdir(self.objects_dir):
+            if raw_data_file[:-len(".csv")] not in referenced:
+                self._remove_if_stale(os.path.join(self.objects_dir, raw_data_file))
@@ -0,0 +1,131 @@
+"""
+In-process registry of loaded models, used so long running processes (e.g. the REST API) only go to disk the first
+time a saved model is used
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+import os
+import pandas as pd
+from core.scaler import load_scaler, MinMaxScaler
+
+
+class LoadedModel(object):
+
+    def __init__(self, model_id: str, net, exp_cols: list, scaler: MinMaxScaler):
+        """
+        Container for everything needed to make predictions with a saved model
+        :param model_id: str
+                unique model id
+        :param net: NNet
+                network with the saved weights loaded, in eval mode
+        :param exp_cols: list of str
+                list of the features the model expects, in order
+        :param scaler: MinMaxScaler
+                scaler fit on the data the model was trained on
+        """
+        self.model_id = model_id
+        self.net = net
+        self.exp_cols = exp_cols
+        self.scaler = scaler
+
+
+class ModelRegistry(object):
+
+    def __init__(self, max_size: int = 16):
+        """
+        LRU cache of loaded models
+        :param max_size: int
+                maximum number of models to keep in memory, once exceeded the least recently used model is evicted
+        """
+        if max_size < 1:
+            raise ValueError("ValueError: model registry size must be at least 1")
+        self.max_size = max_size
+        self._models = OrderedDict()
+        # guards _models and _loading only, models are loaded from disk outside it
+        self._lock = Lock()
+        # lock per model being loaded, so each model is only loaded once while other models are still served
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._models)
+
+    def __contains__(self, model_id: str):
+        return self._key(model_id) in self._models
+
+    @staticmethod
+    def _saved_models_dir() -> str:
+        return str(Path().absolute()) + "/saved_models/"
+
+    def _key(self, model_id: str, saved_models_dir: str = None) -> tuple:
+        return saved_models_dir or self._saved_models_dir(), model_id
+
+    @staticmethod
+    def _load(model_id: str, saved_models_dir: str) -> LoadedModel:
+        # torch is only imported once a model is loaded, so importing the registry is cheap
+        import torch
+        from core.nnet import NNet
+        model_dir = saved_models_dir + model_id + "/"
+        net = NNet.from_state_dict(torch.load(model_dir + model_id + ".pth"))
+        net.eval()
+        exp_cols = pd.read_csv(model_dir + model_id + ".csv")["columns"].to_list()
+        scaler = load_scaler(saved_models_dir, model_id)
+        return LoadedModel(model_id = model_id, net = net, exp_cols = exp_cols, scaler = scaler)
+
+    def get(self, model_id: str, saved_models_dir: str = None) -> LoadedModel:
+        """
+        Method to get a loaded model, loading it from disk if it is not already in the registry
+        :param model_id: str
+                unique model id
+        :param saved_models_dir: str
+                OPTIONAL - directory models are saved in, defaults to saved_models/ in the working directory
+        :return: LoadedModel
+        """
+        key = self._key(model_id, saved_models_dir)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            key_lock = self._loading.setdefault(key, Lock())
+        with key_lock:
+            # another thread may have loaded the model while this one waited
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+            try:
+                loaded_model = self._load(model_id = model_id, saved_models_dir = key[0])
+                with self._lock:
+                    self._models[key] = loaded_model
+                    while len(self._models) > self.max_size:
+                        self._models.popitem(last = False)
+            finally:
+                with self._lock:
+                    if self._loading.get(key) is key_lock:
+                        del self._loading[key]
+            return loaded_model
+
+    def evict(self, model_id: str, saved_models_dir: str = None) -> None:
+        """
+        Method to remove a model from the registry, e.g. once it has been deleted from disk
+        :param model_id: str
+                unique model id
+        :param saved_models_dir: str
+                OPTIONAL - directory models are saved in, defaults to saved_models/ in the working directory
+        :return: nothing
+        """
+        with self._lock:
+            self._models.pop(self._key(model_id, saved_models_dir), None)
+
+    def clear(self) -> None:
+        """
+        Method to remove all models from the registry
+        :return: nothing
+        """
+        with self._lock:
+            self._models.clear()
+
+
+# shared registry, size can be configured with the APPLE_MODEL_REGISTRY_SIZE environment variable
+model_registry = ModelRegistry(max_size = int(os.environ.get("APPLE_MODEL_REGISTRY_SIZE", 16)))
@@ -2,7 +2,129 @@
 Functions used to scale input data
 """
 
+from functools import lru_cache
+import os
+import numpy as np
 import pandas as pd
+from pandas import DataFrame
+
+
+class MinMaxScaler(object):
+
+    def __init__(self, columns: list, mins, maxes):
+        """
+        MinMax scaler artifact, holds the mins and ranges of each column as arrays so data can be scaled in one
+        broadcast operation
+        :param columns: list of str
+                names of the columns the scaler was fit on, in order
+        :param mins: array like
+                min of each column
+        :param maxes: array like
+                max of each column
+        """
+        self.columns = list(columns)
+        self.mins = np.asarray(mins, dtype = np.float64)
+        self.maxes = np.asarray(maxes, dtype = np.float64)
+        self.ranges = self.maxes - self.mins
+        if not len(self.columns) == len(self.mins) == len(self.maxes):
+            raise ValueError("Scaler expects one min and one max per column, got {} columns, {} mins and {} maxes"
+                             .format(len(self.columns), len(self.mins), len(self.maxes)))
+
+    @classmethod
+    def fit(cls, df: DataFrame):
+        """
+        Method to create a scaler from the mins and maxes of each column of df
+        :param df: DataFrame
+                dataframe to fit the scaler to
+        :return: MinMaxScaler
+        """
+        values = df.to_numpy(dtype = np.float64)
+        return cls(columns = df.columns, mins = np.nanmin(values, axis = 0), maxes = np.nanmax(values, axis = 0))
+
+    @classmethod
+    def from_csv(cls, parameters_path: str, columns: list):
+        """
+        Method to load a scaler from a coeffs csv written by to_csv
+        :param parameters_path: str
+                filepath of the coeffs csv
+        :param columns: list of str
+                names of the columns the coeffs apply to, in the order they appear in the csv
+        :return: MinMaxScaler
+        """
+        params = pd.read_csv(parameters_path)
+        return cls(columns = columns, mins = params["mins"].to_numpy(), maxes = params["maxes"].to_numpy())
+
+    def to_frame(self) -> DataFrame:
+        """
+        :return: DataFrame
+                the coeffs of scaling in the format saved alongside each model
+        """
+        return pd.DataFrame(data = {"maxes": self.maxes, "mins": self.mins})
+
+    def to_csv(self, parameters_path: str) -> None:
+        """
+        Method to write the coeffs of scaling to file
+        :param parameters_path: str
+                filepath to write coeffs to
+        :return: nothing
+        """
+        self.to_frame().to_csv(parameters_path, index_label = False, index = False)
+
+    def transform_array(self, df: DataFrame) -> np.ndarray:
+        """
+        Method to scale the scaler's columns of df
+        :param df: DataFrame
+                dataframe containing (at least) the columns the scaler was fit on
+        :return: np.ndarray
+                scaled values, columns in the order the scaler was fit on
+        """
+        return (df[self.columns].to_numpy(dtype = np.float64) - self.mins) / self.ranges
+
+    def transform(self, df: DataFrame) -> DataFrame:
+        """
+        Method to scale the scaler's columns of df
+        :param df: DataFrame
+                dataframe containing (at least) the columns the scaler was fit on
+        :return: DataFrame
+                scaled dataframe with the columns the scaler was fit on
+        """
+        return pd.DataFrame(data = self.transform_array(df), columns = self.columns, index = df.index)
+
+
+def _mtime(filepath: str) -> int:
+    # part of the cache keys below, so a model saved again under the same id isn't served its old coeffs
+    return os.stat(filepath).st_mtime_ns
+
+
+@lru_cache(maxsize = 256)
+def _read_coeffs_cached(parameters_path: str, mtime: int) -> tuple:
+    params = pd.read_csv(parameters_path)
+    return params["mins"].to_numpy(dtype = np.float64), params["maxes"].to_numpy(dtype = np.float64)
+
+
+def _read_coeffs(parameters_path: str) -> tuple:
+    return _read_coeffs_cached(parameters_path, _mtime(parameters_path))
+
+
+@lru_cache(maxsize = 256)
+def _load_scaler_cached(model_path: str, columns_mtime: int, coeffs_mtime: int) -> MinMaxScaler:
+    columns = pd.read_csv(model_path + ".csv")["columns"].to_list()
+    mins, maxes = _read_coeffs_cached(model_path + "_coeffs.csv", coeffs_mtime)
+    return MinMaxScaler(columns = columns, mins = mins, maxes = maxes)
+
+
+def load_scaler(saved_models_dir: str, model_id: str) -> MinMaxScaler:
+    """
+    Def to load the scaler of a saved model, scalers are cached per model (and modification time of its files) so
+    coeffs are only parsed once
+    :param saved_models_dir: str
+            directory models are saved in
+    :param model_id: str
+            unique model id
+    :return: MinMaxScaler
+    """
+    model_path = saved_models_dir + model_id + "/" + model_id
+    return _load_scaler_cached(model_path, _mtime(model_path + ".csv"), _mtime(model_path + "_coeffs.csv"))
 
 
 def scale_df(df):
@@ -10,17 +132,8 @@ def scale_df(df):
     :param df: dataframe to scale
     :return: the scaled dataframe and the coeffs of scaling
     """
-    maxes = []
-    mins = []
-    for col in df.columns:
-        a = df.min(axis = 0)[col]
-        mins.append(a)
-        b = df.max(axis = 0)[col]
-        maxes.append(b)
-        df[col] = (df[col] - a) / (b - a)
-    d = {"maxes": maxes, "mins": mins}
-    parameters = pd.DataFrame(data = d)
-    return df, parameters
+    scaler = MinMaxScaler.fit(df)
+    return scaler.transform(df), scaler.to_frame()
 
 
 def scale_df_with_params(df, parameters_path):
@@ -29,11 +142,6 @@ def scale_df_with_params(df, parameters_path):
     :param parameters_path: coeffs to use to scale
     :return: scaled dataframe
     """
-    params = pd.read_csv(parameters_path)
-    maxes = params["maxes"].to_list()
-    mins = params["mins"].to_list()
-    i = 0
-    for col in df.columns:
-        df[col] = (df[col] - mins[i]) / (maxes[i]-mins[i])
-        i += 1
-    return df
+    mins, maxes = _read_coeffs(parameters_path)
+    scaler = MinMaxScaler(columns = df.columns, mins = mins, maxes = maxes)
+    return scaler.transform(df)
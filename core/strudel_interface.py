@@ -2,18 +2,29 @@
 Class used to interface with STRUDEL to get fixtures with or without user predictions
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 import json
+import gzip
+import hashlib
 import datetime
-import io
+import os
+import re
+import time
 import pandas as pd
 from pathlib import Path
 from termcolor import colored
+from core.loaders import frame_from_json
 from datetime import datetime
-import codecs
 
 
 path = str(Path().absolute().parent)
 
+# STRUDEL can be swapped for e.g. a local stand-in server with the STRUDEL_BASE_URL environment variable
+default_base_url = os.environ.get("STRUDEL_BASE_URL", "https://beatthebot.co.uk")
+
 
 def validate_date(date: str) -> None:
     """
@@ -28,164 +39,405 @@ def validate_date(date: str) -> None:
         raise ValueError("Incorrect data format, should be YYYY-MM-DD")
 
 
-def query_fixtures_endpoint_csv(start_date: str, end_date: str, output_loc: str, include_user_predictions: bool,
-                                authentication: dict, include_apple_predictions: bool, include_ftrs: bool) -> None:
+class StrudelClient(object):
+
+    def __init__(self, credentials: dict, base_url: str = None, timeout: tuple = (5, 60), retries: int = 3,
+                 backoff_factor: float = 0.5, pool_size: int = 10, token_ttl: float = None,
+                 idempotent_puts: tuple = ("/iapi/predictions",)):
+        """
+        Client for the STRUDEL REST API. Requests share a pooled Session, are retried with exponential backoff
+        and reuse one login token until STRUDEL rejects it, at which point the client logs in again
+        :param credentials: dict
+                credentials to log in with
+        :param base_url: str
+                OPTIONAL - url of STRUDEL, defaults to the STRUDEL_BASE_URL environment variable or
+                https://beatthebot.co.uk
+        :param timeout: tuple
+                OPTIONAL - (connect, read) timeout of each request in seconds
+        :param retries: int
+                OPTIONAL - number of times a request that failed to connect is retried, GET requests (and PUT requests
+                to idempotent_puts) are also retried after a 429 / 5xx response or a failed read
+        :param backoff_factor: float
+                OPTIONAL - retries wait backoff_factor * 2 ** (retry - 1) seconds
+        :param pool_size: int
+                OPTIONAL - number of connections kept alive
+        :param token_ttl: float
+                OPTIONAL - seconds after which the token is refreshed before it is used, by default tokens are only
+                refreshed once rejected
+        :param idempotent_puts: tuple of str
+                OPTIONAL - endpoints a PUT can safely be sent to twice, e.g. predictions are upserted per fixture.
+                Other PUTs (mined data and visualisations) create a new record each time so are never resent
+        """
+        self.credentials = credentials
+        self.base_url = (base_url or default_base_url).rstrip("/")
+        self.timeout = timeout
+        self.token_ttl = token_ttl
+        self._token_header = None
+        self._token_time = None
+        self._login_lock = Lock()
+        # content hash and STRUDEL name of the last upload of each visualisation, so unchanged plots are not uploaded
+        # again
+        self.visualisation_hashes = {}
+        # set to False if STRUDEL rejects gzip compressed uploads, uploads are then sent uncompressed
+        self.accepts_gzip = True
+
+        def adapter(allowed_methods: list) -> HTTPAdapter:
+            retry = Retry(total = retries,
+                          backoff_factor = backoff_factor,
+                          status_forcelist = (429, 500, 502, 503, 504),
+                          allowed_methods = frozenset(allowed_methods),
+                          raise_on_status = False)
+            return HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter(["GET"]))
+        self.session.mount("https://", adapter(["GET"]))
+        # requests uses the adapter mounted at the longest matching prefix
+        for end_point in idempotent_puts:
+            self.session.mount(self.url(end_point), adapter(["GET", "PUT"]))
+
+    def url(self, end_point: str) -> str:
+        return self.base_url + end_point
+
+    def login(self) -> dict:
+        """
+        Method to log in to STRUDEL
+        :return: dict
+                auth header to send with requests
+        """
+        print(colored("Attempting to log into STRUDEL....", "red"))
+        login_response = self.session.post(self.url("/login"), json = self.credentials, timeout = self.timeout)
+        # check REST response
+        if login_response.status_code == 200:
+            print(colored("Successful log in", "green"))
+            self._token_header = {'Authorization': login_response.json()["token"]}
+            self._token_time = time.monotonic()
+            return self._token_header
+        else:
+            raise ValueError("Incorrect Log in details, log in unsuccessful")
+
+    def token_header(self, stale: dict = None) -> dict:
+        """
+        Method to get the auth header, logging in if there is no token yet or it has expired
+        :param stale: dict
+                OPTIONAL - header STRUDEL rejected, a new token is only requested if no other thread has already
+                replaced it
+        :return: dict
+        """
+        with self._login_lock:
+            expired = self.token_ttl is not None and self._token_time is not None and \
+                time.monotonic() - self._token_time > self.token_ttl
+            if self._token_header is None or expired or (stale is not None and self._token_header is stale):
+                return self.login()
+            return self._token_header
+
+    def request(self, method: str, end_point: str, **kwargs) -> requests.Response:
+        """
+        Method to send an authenticated request to STRUDEL, if the token is rejected the client logs in again and
+        the request is sent once more
+        :param method: str
+                HTTP method e.g. "GET"
+        :param end_point: str
+                path of the endpoint e.g. "/iapi/predictions"
+        :param kwargs:
+                passed to requests.Session.request e.g. json, params
+        :return: Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        extra_headers = kwargs.pop("headers", {})
+        token_header = self.token_header()
+        response = self.session.request(method, self.url(end_point), headers = dict(token_header, **extra_headers),
+                                        **kwargs)
+        if response.status_code in (401, 403):
+            # release the connection of the rejected response (it may have been streamed) before sending again
+            response.close()
+            response = self.session.request(method, self.url(end_point),
+                                            headers = dict(self.token_header(token_header), **extra_headers), **kwargs)
+        return response
+
+    def put_json(self, end_point: str, body: dict, compress: bool = False) -> requests.Response:
+        """
+        Method to PUT a json body, optionally gzip compressed. If STRUDEL doesn't support the gzip encoding (415, or
+        a 400 saying so) the body is sent again uncompressed and later uploads are not compressed, any other error is
+        returned as is
+        :param end_point: str
+                path of the endpoint e.g. "/iapi/analytics"
+        :param body: dict
+                json body
+        :param compress: bool
+                OPTIONAL - gzip the body
+        :return: Response
+        """
+        if compress and self.accepts_gzip:
+            response = self.request("PUT", end_point, data = gzip.compress(json.dumps(body).encode("utf-8")),
+                                    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"})
+            if not unsupported_encoding(response):
+                return response
+            response.close()
+            self.accepts_gzip = False
+        return self.request("PUT", end_point, json = body)
+
+
+def unsupported_encoding(response: requests.Response) -> bool:
+    """
+    Def to check whether STRUDEL rejected a request because of its Content-Encoding
+    :param response: Response
+    :return: bool
+    """
+    if response.status_code == 415:
+        return True
+    return response.status_code == 400 and re.search("encoding|gzip", response.text, re.IGNORECASE) is not None
+
+
+def visualisation_hash(html_contents: str, notes: str) -> str:
+    """
+    Def to hash the content of a plotly html visualisation. Plotly gives the plot's div a new random id every time a
+    figure is written, the ids are replaced before hashing so the same figure always has the same hash
+    :param html_contents: str
+            plotly html
+    :param notes: str
+            notes displayed along with the plot
+    :return: str
+    """
+    for div_id in set(re.findall('<div id="([^"]+)" class="plotly-graph-div"', html_contents)):
+        html_contents = html_contents.replace(div_id, "plotly-graph-div")
+    return hashlib.sha256((notes + "\n" + html_contents).encode("utf-8")).hexdigest()
+
+
+# clients shared by every StrudelInterface in the process, keyed by credentials file and base url
+_clients = {}
+_clients_lock = Lock()
+
+
+def get_client(credentials_filepath: str, base_url: str = None) -> StrudelClient:
+    """
+    Def to get the process wide client for a set of credentials, the client is created the first time it is used
+    :param credentials_filepath: str
+            filepath of json file containing credentials for log in
+    :param base_url: str
+            OPTIONAL - url of STRUDEL, see StrudelClient
+    :return: StrudelClient
     """
-    Def to query STRUDEL fixtures endpoint and return fixtures with or without user predictions for specified date range
+    key = (os.path.abspath(credentials_filepath), base_url or default_base_url)
+    with _clients_lock:
+        if key not in _clients:
+            # load in log in credentials
+            with open(credentials_filepath) as json_file:
+                credentials = json.load(json_file)
+            _clients[key] = StrudelClient(credentials = credentials, base_url = base_url)
+        return _clients[key]
+
+
+def prediction_payloads(apple_results: pd.DataFrame, user_id: int = 10) -> list:
+    """
+    Def to build the STRUDEL prediction payload of every fixture in APPLE's predictions in one pass
+    :param apple_results: DataFrame
+            APPLE output DataFrame
+    :param user_id: int
+            OPTIONAL - STRUDEL user id predictions are made as, default is APPLE's id 10
+    :return: list of dict
+            one payload per fixture, in the order of apple_results
+    """
+    # tolist converts to python types so the payloads are json serializable
+    columns = [apple_results[col].tolist() for col in ["FixtureID", "APPLE Prediction", "p(H)", "p(D)", "p(A)"]]
+    return [{"prediction": prediction,
+             "homeWinProbability": home_win,
+             "drawProbability": draw,
+             "awayWinProbability": away_win,
+             "fixture": {"id": fixture},
+             "user": {"id": user_id}}
+            for fixture, prediction, home_win, draw, away_win in zip(*columns)]
+
+
+def query_fixtures_endpoint(start_date: str, end_date: str, include_user_predictions: bool, client: StrudelClient,
+                            include_apple_predictions: bool, include_ftrs: bool, output_loc: str = None) -> pd.DataFrame:
+    """
+    Def to query STRUDEL fixtures endpoint and return fixtures with or without user predictions for specified date range.
+    The csv response is parsed as it is streamed rather than being read into memory first
     :param include_apple_predictions: bool
             whether to include prediction made by APPLE
     :param include_ftrs: bool
             whether to include full time results 
     :param include_user_predictions: bool
             whether to include user predictions
-    :param authentication: dict[str]
-            token to pass in request
-    :param output_loc: str
-            filepath specifying output location for csv
+    :param client: StrudelClient
+            client to send the request with
     :param start_date: str
             Date, format YYYY-MM-DD, for the start date of fixtures window
     :param end_date: str
             Date, format YYYY-MM-DD, for the end date of fixtures window
-    :return: nothing
+    :param output_loc: str
+            OPTIONAL - filepath to also save the fixtures to as csv
+    :return: DataFrame
+            fixtures, one row per fixture
     """
     # catch incorrect date formats
     validate_date(start_date)
     validate_date(end_date)
     # defined endpoint
-    end_point = "https://beatthebot.co.uk/iapi/fixtures/bydate?startDate=" + start_date + "&endDate=" + end_date + "&format=csv"
+    end_point = "/iapi/fixtures/bydate"
     # send GET request
     print(colored("Requesting data for fixtures between {} and {}".format(start_date, end_date), "red"))
-    response = requests.get(end_point, headers = authentication)
-    # check response
-    if response.status_code == 200:
+    with client.request("GET", end_point, params = {"startDate": start_date, "endDate": end_date, "format": "csv"},
+                        stream = True) as response:
+        # check response
+        if response.status_code != 200:
+            raise ValueError("Unsuccessful in obtaining requested data for fixtures between {} and {}".format(
+                start_date, end_date))
         print(colored("Successfully obtained predictions for fixtures between {} and {}".format(start_date, end_date),
                       "green"))
-        response_content = response.content
-        response_raw = pd.read_csv(io.StringIO(response_content.decode('utf-8')))
-        # rename some columns
-        response_raw.rename(
-            {'homeTeamName': 'HomeTeam', 'awayTeamName': 'AwayTeam', "date": "Date", "time": "Time", "fixtureId": "FixtureID", 'week': 'Week'}, axis = 1,
-            inplace = True)
-        all_columns = list(response_raw.columns)
-        base_cols = ["Date", "Time", "Week", "HomeTeam", "AwayTeam", "FixtureID"]
-        if include_ftrs:
-            base_cols = base_cols + ["FTR"]
-        else:
-            if "FTR" in all_columns:
-                # drop FTRs from DF
-                all_columns.remove("FTR")
-                response_raw = response_raw.drop(["FTR"], axis = 1)
-        if include_user_predictions:
-            response_output = response_raw[
-                base_cols + [c for c in response_raw if c not in base_cols]]
-            response_output = response_output.sort_values(by = ["Date", "Time"], axis = 0)
-            # append " Prediction" to header of each user prediction column
-            user_predictions_cols = list(response_output.columns)
-            user_prediction_columns = [col for col in user_predictions_cols if col not in base_cols]
-            if "Ben" in user_prediction_columns:
-                # take out my test predictions
-                user_prediction_columns.remove("Ben")
-                response_output = response_output.drop(["Ben"], axis = 1)
-            if "APPLE" in user_prediction_columns and not include_apple_predictions:
-                # take out APPLE predictions
-                user_prediction_columns.remove("APPLE")
-                response_output = response_output.drop(["APPLE"], axis = 1)
-
-            user_prediction_col_formatting_dict = {}
-            for i in user_prediction_columns :
-                user_prediction_col_formatting_dict[i] = i + " Prediction"
-            response_output.rename(user_prediction_col_formatting_dict, axis = 1, inplace = True)
-        else:
-            response_output = response_raw[base_cols]
+        # let urllib3 undo any gzip content encoding as the body is read
+        response.raw.decode_content = True
+        response_raw = pd.read_csv(response.raw)
+    # rename some columns
+    response_raw.rename(
+        {'homeTeamName': 'HomeTeam', 'awayTeamName': 'AwayTeam', "date": "Date", "time": "Time", "fixtureId": "FixtureID", 'week': 'Week'}, axis = 1,
+        inplace = True)
+    all_columns = list(response_raw.columns)
+    base_cols = ["Date", "Time", "Week", "HomeTeam", "AwayTeam", "FixtureID"]
+    if include_ftrs:
+        base_cols = base_cols + ["FTR"]
+    else:
+        if "FTR" in all_columns:
+            # drop FTRs from DF
+            all_columns.remove("FTR")
+            response_raw = response_raw.drop(["FTR"], axis = 1)
+    if include_user_predictions:
+        response_output = response_raw[
+            base_cols + [c for c in response_raw if c not in base_cols]]
+        response_output = response_output.sort_values(by = ["Date", "Time"], axis = 0)
+        # append " Prediction" to header of each user prediction column
+        user_predictions_cols = list(response_output.columns)
+        user_prediction_columns = [col for col in user_predictions_cols if col not in base_cols]
+        if "Ben" in user_prediction_columns:
+            # take out my test predictions
+            user_prediction_columns.remove("Ben")
+            response_output = response_output.drop(["Ben"], axis = 1)
+        if "APPLE" in user_prediction_columns and not include_apple_predictions:
+            # take out APPLE predictions
+            user_prediction_columns.remove("APPLE")
+            response_output = response_output.drop(["APPLE"], axis = 1)
+
+        user_prediction_col_formatting_dict = {}
+        for i in user_prediction_columns :
+            user_prediction_col_formatting_dict[i] = i + " Prediction"
+        response_output.rename(user_prediction_col_formatting_dict, axis = 1, inplace = True)
+    else:
+        response_output = response_raw[base_cols]
+    if output_loc is not None:
         output_dir = Path(output_loc)
         output_dir = output_dir.parent
         if not output_dir.exists():
             output_dir.mkdir(parents = True)
         response_output.to_csv(output_loc, index_label = False, index = False)
-    else:
-        raise ValueError(
-            "Unsuccessful in obtaining requested data for fixtures between {} and {}".format(start_date, end_date))
+    return response_output
 
 
 class StrudelInterface(object):
 
-    def __init__(self, credentials_filepath: str):
+    def __init__(self, credentials_filepath: str, base_url: str = None):
         """
-        Constructor is used to log in to STRUDEL endpoint
+        Constructor gets the process wide STRUDEL client for the credentials, logging in the first time they are
+        used
         :param credentials_filepath: str
                 filepath of json file containing credentials for log in
+        :param base_url: str
+                OPTIONAL - url of STRUDEL, defaults to the STRUDEL_BASE_URL environment variable or
+                https://beatthebot.co.uk
         """
-        # use the constructor of the class to login
-        print(colored("Attempting to log into STRUDEL....", "red"))
-        # load in log in credentials
-        with open(credentials_filepath) as json_file:
-            credentials = json.load(json_file)
-        _login_url = "https://beatthebot.co.uk/login"
-        # log in
-        login_response = requests.post(_login_url, json = credentials)
-        # check REST response
-        if login_response.status_code == 200:
-            print(colored("Successful log in", "green"))
-            login_response_content_json = login_response.json()
-            self._token_header = {'Authorization': login_response_content_json["token"]}
-        else:
-            raise ValueError("Incorrect Log in details, log in unsuccessful")
+        self._client = get_client(credentials_filepath = credentials_filepath, base_url = base_url)
+        # log in now (if not already logged in) so incorrect credentials are caught straight away
+        self._client.token_header()
 
-    def get_fixtures_and_user_predictions(self, start_date: str, end_date: str, output_loc: str) -> None:
+    def get_fixtures_and_user_predictions(self, start_date: str, end_date: str, output_loc: str = None) -> pd.DataFrame:
         """
         Method to get the fixtures and predictions from the STRUDEL endpoint for specified date range
         :param output_loc: str
-                filepath specifying output location for csv
+                OPTIONAL - filepath to also save the fixtures to as csv
         :param start_date: str
                 Date, format YYYY-MM-DD, for the start date of fixtures window
         :param end_date: str
                 Date, format YYYY-MM-DD, for the end date of fixtures window
-        :return: nothing
+        :return: DataFrame
         """
-        query_fixtures_endpoint_csv(start_date = start_date,
-                                    end_date = end_date,
-                                    output_loc = output_loc,
-                                    include_user_predictions = True,
-                                    include_apple_predictions = False,
-                                    include_ftrs = False,
-                                    authentication = self._token_header)
+        return query_fixtures_endpoint(start_date = start_date,
+                                       end_date = end_date,
+                                       output_loc = output_loc,
+                                       include_user_predictions = True,
+                                       include_apple_predictions = False,
+                                       include_ftrs = False,
+                                       client = self._client)
 
-    def get_fixtures(self, start_date: str, end_date: str, output_loc: str) -> None:
+    def get_fixtures(self, start_date: str, end_date: str, output_loc: str = None) -> pd.DataFrame:
         """
         Method to get the fixtures from the STRUDEL endpoint for specified date range
         :param output_loc: str
-                filepath specifying output location for csv
+                OPTIONAL - filepath to also save the fixtures to as csv
         :param start_date: str
                 Date, format YYYY-MM-DD, for the start date of fixtures window
         :param end_date: str
                 Date, format YYYY-MM-DD, for the end date of fixtures window
-        :return: nothing
+        :return: DataFrame
         """
-        query_fixtures_endpoint_csv(start_date = start_date,
-                                    end_date = end_date,
-                                    output_loc = output_loc,
-                                    include_user_predictions = False,
-                                    include_apple_predictions = False,
-                                    include_ftrs = False,
-                                    authentication = self._token_header)
+        return query_fixtures_endpoint(start_date = start_date,
+                                       end_date = end_date,
+                                       output_loc = output_loc,
+                                       include_user_predictions = False,
+                                       include_apple_predictions = False,
+                                       include_ftrs = False,
+                                       client = self._client)
 
-    def return_predictions(self, prediction_details: dict) -> None:
+    def return_predictions(self, prediction_details: dict) -> bool:
         """
         Def to upload APPLE predictions to STRUDEL
         :param prediction_details: dict
                 Details of each prediction to return
-        :return: nothing
+        :return: bool
+                Returns True if upload is successful, False if not
         """
-        end_point = "https://beatthebot.co.uk/iapi/predictions"
-        response = requests.put(end_point, headers = self._token_header, json = prediction_details)
+        try:
+            response = self._client.request("PUT", "/iapi/predictions", json = prediction_details)
+        except requests.RequestException as e:
+            print(colored("APPLE prediction for fixture with id {} failed to export to Strudel".format(prediction_details["fixture"]), "red"))
+            print(e)
+            return False
         if response.status_code == 200:
             print(colored("APPLE prediction for fixture with id {} exported to Strudel".format(prediction_details["fixture"]), "green"))
+            return True
         else:
-            print(colored("APPLE prediction for fixture with id {} failed to export to Strudel".format(prediction_details["fixture"]), "green"))
+            print(colored("APPLE prediction for fixture with id {} failed to export to Strudel".format(prediction_details["fixture"]), "red"))
             print(response.status_code)
             print(response.content)
+            return False
+
+    def return_predictions_bulk(self, predictions: list, workers: int = 10, attempts: int = 3) -> dict:
+        """
+        Def to upload many APPLE predictions to STRUDEL concurrently, predictions that fail to upload are retried
+        (on top of the retries of each request) until they succeed or attempts run out
+        :param predictions: list of dict
+                Details of each prediction to return, see prediction_payloads
+        :param workers: int
+                OPTIONAL - maximum number of uploads in flight at once, default is 10 (a full gameweek)
+        :param attempts: int
+                OPTIONAL - number of times each prediction is uploaded before it is reported as failed
+        :return: dict
+                fixture id to True if its prediction was uploaded, False if not
+        """
+        results = {}
+        remaining = list(predictions)
+        with ThreadPoolExecutor(max_workers = max(1, min(workers, len(remaining)))) as executor:
+            for attempt in range(attempts):
+                if not remaining:
+                    break
+                uploaded = list(executor.map(self.return_predictions, remaining))
+                results.update((prediction["fixture"]["id"], success)
+                               for prediction, success in zip(remaining, uploaded))
+                # only the failures are sent again
+                remaining = [prediction for prediction, success in zip(remaining, uploaded) if not success]
+        return results
 
-    def return_visualisations(self, html_filepath: str, visualisation_title: str, notes: str, request_id: str) -> bool:
+    def return_visualisations(self, html_filepath: str, visualisation_title: str, notes: str, request_id: str,
+                              compress: bool = False, skip_unchanged: bool = False) -> str:
         """
         Def to upload plotly html visualisations to STRUDEL where they are displayed
         :param request_id: str
@@ -196,13 +448,25 @@ class StrudelInterface(object):
                 title of the visualisation to upload
         :param notes: str
                 comma separated list of notes to display along with the plot on STRUDEL
-        :return: bool
-                Returns True if upload is successful, False if not
+        :param compress: bool
+                OPTIONAL - gzip the upload
+        :param skip_unchanged: bool
+                OPTIONAL - don't upload the visualisation if its plot and notes are the same as the last time a
+                visualisation with this title was uploaded by this process. No new record is created on STRUDEL, the
+                name of the earlier upload displaying it is returned instead
+        :return: str
+                Returns the name of the STRUDEL record displaying the visualisation if upload is successful (or
+                skipped), None if not
         """
-        end_point = "https://beatthebot.co.uk/iapi/analytics"
         # read in html file as a string
-        html_file = codecs.open(html_filepath, 'r')
-        html_contents = html_file.read()
+        with open(html_filepath, 'r', encoding = 'utf-8') as html_file:
+            html_contents = html_file.read()
+        content_hash = visualisation_hash(html_contents = html_contents, notes = notes)
+        last_hash, last_upload = self._client.visualisation_hashes.get(visualisation_title, (None, None))
+        if skip_unchanged and last_hash == content_hash:
+            print(colored("Visualisation with title '{}' is unchanged, displayed by earlier upload '{}'".format(
+                visualisation_title, last_upload), "green"))
+            return last_upload
         today = datetime.today().strftime("%Y_%m_%d")
         visualisation_heading = visualisation_title
         visualisation_title = visualisation_title + "_" + today + "_" + request_id
@@ -212,17 +476,56 @@ class StrudelInterface(object):
             "html": html_contents,
             "tagLineList": notes
         }
-        response = requests.put(end_point, headers = self._token_header, json = body)
+        try:
+            response = self._client.put_json("/iapi/analytics", body = body, compress = compress)
+        except requests.RequestException as e:
+            print(colored("Visualisation with title '{}' failed to upload ".format(visualisation_title), "red"))
+            print(e)
+            return None
         if response.status_code == 200:
             print(colored("Visualisation with title '{}' successfully uploaded ".format(visualisation_title), "green"))
-            return True
+            self._client.visualisation_hashes[visualisation_heading] = (content_hash, visualisation_title)
+            return visualisation_title
         else:
             print(colored("Visualisation with title '{}' failed to upload ".format(visualisation_title), "red"))
             print(response.status_code)
             print(response.content)
-            return False
+            return None
 
-    def get_predictions_and_ftrs(self, start_date: str, end_date: str, output_loc: str) -> None:
+    def return_visualisations_bulk(self, html_filepaths: list, notes: str, request_id: str, workers: int = 6,
+                                   compress: bool = True, skip_unchanged: bool = True) -> dict:
+        """
+        Def to upload many plotly html visualisations to STRUDEL concurrently, each is titled with its filename
+        :param html_filepaths: list of str
+                filepaths for the HTML files to upload
+        :param notes: str
+                comma separated list of notes to display along with the plots on STRUDEL
+        :param request_id: str
+                ID of the request
+        :param workers: int
+                OPTIONAL - maximum number of uploads in flight at once, default is 6 (all visualisations)
+        :param compress: bool
+                OPTIONAL - gzip the uploads, default is True
+        :param skip_unchanged: bool
+                OPTIONAL - skip visualisations that haven't changed since they were last uploaded, default is True
+        :return: dict
+                title to the name of the STRUDEL record displaying the visualisation, which is an earlier upload if it
+                was skipped, or None if it failed to upload
+        """
+        titles = [os.path.splitext(os.path.basename(html_filepath))[0] for html_filepath in html_filepaths]
+        if not titles:
+            return {}
+        with ThreadPoolExecutor(max_workers = max(1, min(workers, len(titles)))) as executor:
+            uploaded = executor.map(lambda upload: self.return_visualisations(html_filepath = upload[0],
+                                                                             visualisation_title = upload[1],
+                                                                             notes = notes,
+                                                                             request_id = request_id,
+                                                                             compress = compress,
+                                                                             skip_unchanged = skip_unchanged),
+                                    zip(html_filepaths, titles))
+            return dict(zip(titles, uploaded))
+
+    def get_predictions_and_ftrs(self, start_date: str, end_date: str, output_loc: str = None) -> pd.DataFrame:
         """
         Def to get predictions and full timne results of completed fixtures
         :param start_date: str
@@ -230,38 +533,42 @@ class StrudelInterface(object):
         :param end_date: str
                 Date, format YYYY-MM-DD, for the end date of fixtures window
         :param output_loc: str
-                output location
-        :return:
+                OPTIONAL - filepath to also save the fixtures to as csv
+        :return: DataFrame
         """
-        query_fixtures_endpoint_csv(start_date = start_date,
-                                    end_date = end_date,
-                                    output_loc = output_loc,
-                                    include_user_predictions = True,
-                                    include_ftrs = True,
-                                    include_apple_predictions = True,
-                                    authentication = self._token_header)
+        return query_fixtures_endpoint(start_date = start_date,
+                                       end_date = end_date,
+                                       output_loc = output_loc,
+                                       include_user_predictions = True,
+                                       include_ftrs = True,
+                                       include_apple_predictions = True,
+                                       client = self._client)
 
-    def get_mined_data(self, mined_data_id: str, output_filepath: str) -> None:
+    def get_mined_data(self, mined_data_id: str, output_filepath: str = None) -> pd.DataFrame:
         """
         def to get mined data from STRUDEL
         :param mined_data_id: str
                 id used to access uploaded mined data
         :param output_filepath: str
-                where to
-        :return: nothing
+                OPTIONAL - filepath to also save the mined data to as json
+        :return: DataFrame
         """
-        end_point = "https://beatthebot.co.uk/iapi/mined-data/" + mined_data_id
-        response = requests.get(end_point, headers = self._token_header)
+        response = self._client.request("GET", "/iapi/mined-data/" + mined_data_id)
         if response.status_code == 200:
             print(colored("Successfully obtained mined data for id: {}".format(mined_data_id), "green"))
             response_json = response.json()
             response_json = response_json["entity"]['json']
-            # then dump out json to filepath
-            with open(output_filepath, 'w') as outfile:
-                json.dump(response_json, outfile)
+            if output_filepath is not None:
+                # then dump out json to filepath
+                with open(output_filepath, 'w') as outfile:
+                    json.dump(response_json, outfile)
+            # converted as the saved json file used to be, so the index and dtypes (e.g. dates) match
+            # load_json_or_csv
+            return frame_from_json(response_json)
         else:
             print(response.status_code)
             print(response)
+            raise ValueError("Unsuccessful in obtaining mined data for id: {}".format(mined_data_id))
 
     def upload_mined_data(self, name: str, mined_data_to_upload: dict) -> str:
         """
@@ -273,13 +580,11 @@ class StrudelInterface(object):
         :return: id - str
                 the id that can be used to access the uploaded data
         """
-        end_point = "https://beatthebot.co.uk/iapi/mined-data"
         body = {
             "name": name,
             "json": mined_data_to_upload
         }
-        response = requests.put(end_point, headers = self._token_header, json = body)
-        # response = requests.get(end_point, headers = self._token_header)
+        response = self._client.request("PUT", "/iapi/mined-data", json = body)
         print(response.status_code)
         if response.status_code == 200:
             response_content = response.json()
@@ -289,7 +594,7 @@ class StrudelInterface(object):
         else:
             print(response.content)
 
-    def get_ftrs(self, start_date: str, end_date: str, output_loc: str) -> None:
+    def get_ftrs(self, start_date: str, end_date: str, output_loc: str = None) -> pd.DataFrame:
         """
         Def to get full-timne results of completed fixtures
         :param start_date: str
@@ -297,13 +602,13 @@ class StrudelInterface(object):
         :param end_date: str
                 Date, format YYYY-MM-DD, for the end date of fixtures window
         :param output_loc: str
-                output location
-        :return:
-        """
-        query_fixtures_endpoint_csv(start_date = start_date,
-                                    end_date = end_date,
-                                    output_loc = output_loc,
-                                    include_user_predictions = False,
-                                    include_apple_predictions = False,
-                                    include_ftrs = True,
-                                    authentication = self._token_header)
+                OPTIONAL - filepath to also save the fixtures to as csv
+        :return: DataFrame
+        """
+        return query_fixtures_endpoint(start_date = start_date,
+                                       end_date = end_date,
+                                       output_loc = output_loc,
+                                       include_user_predictions = False,
+                                       include_apple_predictions = False,
+                                       include_ftrs = True,
+                                       client = self._client)
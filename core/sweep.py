@@ -0,0 +1,242 @@
+"""
+Hyperparameter sweeps over the models trained by core.train, weak configurations are pruned early with successive
+halving on test accuracy or F1 score
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import itertools
+import random
+import os
+import time
+from math import ceil
+import pandas as pd
+from pandas import DataFrame
+from termcolor import colored
+from core.train import Train, save_model, init_worker, fit_model_with_seed
+from core.model_log import ModelLog
+
+
+# hyperparameters that can be swept, and the values Train uses by default
+default_search_space = {"lr": [0.001],
+                        "weight_decay": [0.001],
+                        "train_batch_size": [5],
+                        "hidden_size": [10],
+                        "balancing": ["weighted_sampler"]}
+
+
+def grid_configs(search_space: dict) -> list:
+    """
+    Def to create every combination of the values in the search space
+    :param search_space: dict
+            hyperparameter name to list of values to try
+    :return: list of dict
+    """
+    names = list(search_space)
+    return [dict(zip(names, values)) for values in itertools.product(*[search_space[name] for name in names])]
+
+
+def random_configs(search_space: dict, n_trials: int, seed: int = 42) -> list:
+    """
+    Def to sample distinct configurations from the search space, without replacement
+    :param search_space: dict
+            hyperparameter name to list of values to sample from
+    :param n_trials: int
+            number of configurations to sample, every configuration is returned if there are fewer
+    :param seed: int
+            OPTIONAL - random seed used to sample
+    :return: list of dict
+    """
+    rng = random.Random(seed)
+    names = list(search_space)
+    sizes = [len(search_space[name]) for name in names]
+    n_configs = 1
+    for size in sizes:
+        n_configs *= size
+    configs = []
+    # sample indices of the grid, so the (possibly huge) grid itself is never built
+    for index in rng.sample(range(n_configs), min(n_trials, n_configs)):
+        config = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            index, value_index = divmod(index, size)
+            config[name] = search_space[name][value_index]
+        configs.append({name: config[name] for name in names})
+    return configs
+
+
+# metrics trials can be ranked by, and their index in the history returned by core.nnet.train. Test loss isn't one of
+# them as it can't be compared between configurations trained with different loss functions (e.g. class weights)
+rank_metrics = {"Test Acc": 1, "Test F1": 2}
+
+
+def final_metric(history: tuple, metric: int) -> float:
+    """
+    Def to get a metric of the epoch whose weights a model was saved with
+    :param history: tuple
+            history returned by core.nnet.train
+    :param metric: int
+            index of the metric in history, 1 is test accuracy, 2 is test F1 score and 3 is test loss
+    :return: float
+    """
+    return history[metric][history[4]]
+
+
+class Sweep(object):
+
+    def __init__(self, search_space: dict, mode: str = "grid", n_trials: int = None, min_epochs: int = 1,
+                 max_epochs: int = 9, reduction_factor: int = 3, workers: int = None, seed: int = 42,
+                 trainer: Train = None, rank_by: str = "Test Acc"):
+        """
+        :param search_space: dict
+                hyperparameter name to list of values, any argument of core.train.fit_model can be swept e.g.
+                "lr", "weight_decay", "train_batch_size", "hidden_size", "balancing" and "tensorized"
+        :param mode: str
+                OPTIONAL - "grid" to try every combination (default) or "random" to sample n_trials combinations
+        :param n_trials: int
+                OPTIONAL - number of configurations to sample, required if mode is "random"
+        :param min_epochs: int
+                OPTIONAL - epochs every configuration is trained for in the first rung, default is 1
+        :param max_epochs: int
+                OPTIONAL - most epochs any configuration is trained for, default is 9
+        :param reduction_factor: int
+                OPTIONAL - after each rung only the best 1 / reduction_factor configurations are kept and the epochs
+                are multiplied by reduction_factor, default is 3
+        :param workers: int
+                OPTIONAL - number of processes to train in, defaults to the number of cpus
+        :param seed: int
+                OPTIONAL - random seed used to sample configurations and train models
+        :param trainer: Train
+                OPTIONAL - Train instance whose data is used, created if not passed
+        :param rank_by: str
+                OPTIONAL - metric configurations are ranked by, "Test Acc" (default) or "Test F1"
+        """
+        if mode == "grid":
+            configs = grid_configs(search_space)
+        elif mode == "random":
+            if n_trials is None:
+                raise ValueError("n_trials must be passed when mode is 'random'")
+            configs = random_configs(search_space, n_trials = n_trials, seed = seed)
+        else:
+            raise ValueError("Sweep mode not recognised: " + str(mode))
+        if reduction_factor < 2:
+            raise ValueError("ValueError: reduction factor must be at least 2")
+        if not 1 <= min_epochs <= max_epochs:
+            raise ValueError("ValueError: min_epochs must be at least 1 and no greater than max_epochs")
+        if rank_by not in rank_metrics:
+            raise ValueError("Sweep rank_by not recognised: " + str(rank_by))
+
+        # configs are completed with the default value of any hyperparameter not swept
+        self.configs = [dict({name: values[0] for name, values in default_search_space.items()}, **config)
+                        for config in configs]
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.reduction_factor = reduction_factor
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.rank_by = rank_by
+        self.trainer = trainer if trainer is not None else Train()
+        self.saved_models_dir = self.trainer.path + "/saved_models/"
+        self.results = None
+
+    def rungs(self) -> list:
+        """
+        :return: list of int
+                number of epochs configurations are trained for in each rung
+        """
+        rungs = []
+        epochs = self.min_epochs
+        while epochs < self.max_epochs:
+            rungs.append(epochs)
+            epochs *= self.reduction_factor
+        rungs.append(self.max_epochs)
+        return rungs
+
+    def _log_trial(self, trial: int, fitted: dict, epochs: int, log: ModelLog) -> str:
+        params = dict(self.configs[trial], epochs = epochs, seed = self.seed + trial)
+        log_entry = save_model(saved_models_dir = self.saved_models_dir, fitted = fitted, params = params)
+        log.append([log_entry])
+        return log_entry["Model ID"]
+
+    def run(self, verbose: bool = True, time_budget: float = None) -> DataFrame:
+        """
+        Method to run the sweep. Only the configurations that survive every rung are saved and logged to the model
+        log, each as soon as it has finished training, so pruned (under-trained) trials never compete with them.
+        Each rung trains its configurations from scratch for the rung's epochs rather than resuming the previous
+        rung's weights, as the one cycle learning rate schedule spans a model's whole training and cannot be extended.
+        The earlier rungs of a surviving configuration are therefore repeated work, up to 1 / (reduction_factor - 1)
+        times the epochs of its final rung
+        :param verbose: bool
+                OPTIONAL - print the progress of the sweep
+        :param time_budget: float
+                OPTIONAL - seconds the whole sweep may take. Once it is spent, training stops, trials that haven't
+                started are skipped and the best configurations of the rung reached are logged
+        :return: DataFrame
+                one row per trial with its hyperparameters, the epochs it reached, its final test loss, accuracy and
+                F1 score and the id it was logged with (None if it was pruned), best trial first
+        """
+        surviving = list(range(len(self.configs)))
+        trials = {}
+        model_ids = {}
+        log = ModelLog(saved_models_dir = self.saved_models_dir)
+        metric = rank_metrics[self.rank_by]
+        cpus = os.cpu_count() or 1
+        workers = min(self.workers, len(self.configs))
+        # one deadline shared by every trial, rather than a budget each
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+
+        with ProcessPoolExecutor(max_workers = workers,
+                                 mp_context = multiprocessing.get_context("spawn"),
+                                 initializer = init_worker,
+                                 initargs = (self.trainer.raw_data_combined, max(1, cpus // workers))) as executor:
+            rungs = self.rungs()
+            for rung, epochs in enumerate(rungs):
+                final_rung = rung == len(rungs) - 1
+                if verbose:
+                    print(colored("Sweep rung {}/{}: training {} configuration(s) for {} epoch(s)".format(
+                        rung + 1, len(rungs), len(surviving), epochs), "green"))
+                futures = {executor.submit(fit_model_with_seed, self.seed + trial,
+                                           dict(self.configs[trial], epochs = epochs, verbose = False,
+                                                deadline = deadline)): trial
+                           for trial in surviving}
+                completed = []
+                for future in as_completed(futures):
+                    trial = futures[future]
+                    fitted = future.result()
+                    if fitted is None:
+                        # skipped, the time budget was spent before it started, its previous rung's model is kept
+                        continue
+                    # epochs reached, fewer than the rung's if training was stopped by the deadline
+                    trials[trial] = dict(fitted, epochs = len(fitted["history"][0]))
+                    completed.append(trial)
+                    if final_rung:
+                        model_ids[trial] = self._log_trial(trial, trials[trial], trials[trial]["epochs"], log)
+
+                if final_rung or not completed:
+                    break
+                # successive halving, keep the configurations with the highest test accuracy (or F1 score)
+                ranked = sorted(completed, key = lambda t: final_metric(trials[t]["history"], metric), reverse = True)
+                surviving = ranked[:max(1, ceil(len(ranked) / self.reduction_factor))]
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+
+        # survivors not logged as they finished, because the time budget was spent before their last rung (or a
+        # later rung) trained them, are logged with the model of the last rung they completed
+        unlogged = [trial for trial in surviving if trial in trials and trial not in model_ids]
+        if unlogged and verbose:
+            print(colored("Sweep time budget spent, logging {} configuration(s) trained for fewer epochs".format(
+                len(unlogged)), "red"))
+        for trial in unlogged:
+            model_ids[trial] = self._log_trial(trial, trials[trial], trials[trial]["epochs"], log)
+
+        trained = sorted(trials)
+        results = pd.DataFrame(data = [self.configs[trial] for trial in trained])
+        results.insert(0, "Model ID", [model_ids.get(trial) for trial in trained])
+        results["Epochs"] = [trials[trial]["epochs"] for trial in trained]
+        results["Test Loss"] = [final_metric(trials[trial]["history"], 3) for trial in trained]
+        results["Test Acc"] = [final_metric(trials[trial]["history"], 1) for trial in trained]
+        results["Test F1"] = [final_metric(trials[trial]["history"], 2) for trial in trained]
+        self.results = results.sort_values(by = ["Epochs", self.rank_by], ascending = [False, False]) \
+            .reset_index(drop = True)
+        if verbose:
+            print(colored(self.results, "blue"))
+        return self.results
@@ -0,0 +1,106 @@
+"""
+Registry used to resolve the many spellings of team names (bookmakers, STRUDEL, football-data.co.uk) to the names
+used in the data models are trained on
+"""
+
+from functools import lru_cache
+from pandas import Series
+
+
+# names used by football-data.co.uk, these are the names models are trained on
+standard_teams = ["Arsenal", "Aston Villa", "Bournemouth", "Brighton", "Burnley", "Chelsea", "Crystal Palace",
+                  "Everton", "Leicester", "Liverpool", "Leeds", "Man City", "Man United", "Newcastle", "Norwich",
+                  "Sheffield United", "Southampton", "Tottenham", "Watford", "West Ham", "Wolves", "Fulham",
+                  "West Brom"]
+
+# known alternative spellings of the standard team names
+team_aliases = {
+    "Bournemouth": ["AFC Bournemouth"],
+    "Brighton": ["Brighton & Hove Albion", "Brighton and Hove Albion", "Brighton Hove Albion"],
+    "Leicester": ["Leicester City"],
+    "Leeds": ["Leeds United", "Leeds Utd"],
+    "Man City": ["Manchester City", "Man. City"],
+    "Man United": ["Manchester United", "Man Utd", "Man. Utd", "Manchester Utd"],
+    "Newcastle": ["Newcastle United", "Newcastle Utd"],
+    "Norwich": ["Norwich City"],
+    "Sheffield United": ["Sheffield Utd", "Sheff Utd", "Sheffield U"],
+    "Tottenham": ["Tottenham Hotspur", "Spurs"],
+    "West Ham": ["West Ham United", "West Ham Utd"],
+    "Wolves": ["Wolverhampton", "Wolverhampton Wanderers"],
+    "West Brom": ["West Bromwich Albion", "West Bromwich"],
+}
+
+
+def _alias_key(team: str) -> str:
+    """
+    Def used to normalise a team name before it is looked up in the alias index
+    :param team: str
+            name of a team
+    :return: str
+            lower case name with surrounding and repeated whitespace removed
+    """
+    return " ".join(str(team).lower().split())
+
+
+class TeamRegistry(object):
+
+    def __init__(self, teams: list = None, aliases: dict = None, cache_size: int = 1024):
+        """
+        Constructor builds the exact alias index and the memo cache used for fuzzy fallbacks
+        :param teams: list of str
+                OPTIONAL - standard team names to resolve to, defaults to standard_teams
+        :param aliases: dict
+                OPTIONAL - dict of standard team name to list of known alternative spellings, defaults to team_aliases
+        :param cache_size: int
+                OPTIONAL - maximum number of fuzzy matched names to remember, default is 1024
+        """
+        self.teams = list(standard_teams if teams is None else teams)
+        aliases = team_aliases if aliases is None else aliases
+
+        # exact index, every standard name and alias maps to the standard name
+        self._index = {_alias_key(team): team for team in self.teams}
+        for team, alternatives in aliases.items():
+            for alternative in alternatives:
+                self._index[_alias_key(alternative)] = team
+
+        # bounded memo for names that can only be resolved with fuzzy string matching
+        self._fuzzy_match = lru_cache(maxsize = cache_size)(self._extract_one)
+
+    def _extract_one(self, team: str) -> str:
+        # fuzzywuzzy is only imported the first time a name isn't in the exact index
+        from fuzzywuzzy import process
+        return process.extractOne(team, self.teams)[0]
+
+    def resolve(self, team: str) -> str:
+        """
+        Method to resolve a single team name
+        :param team: str
+                name of a team
+        :return: str
+                standard name of the team
+        """
+        standard_name = self._index.get(_alias_key(team))
+        if standard_name is None:
+            standard_name = self._fuzzy_match(team)
+        return standard_name
+
+    def resolve_series(self, teams: Series) -> Series:
+        """
+        Method to resolve a Series of team names, each distinct name is only resolved once
+        :param teams: Series
+                Series of team names
+        :return: Series
+                Series of standard team names with the same index as teams
+        """
+        lookup = {team: self.resolve(team) for team in teams.dropna().unique()}
+        return teams.map(lookup)
+
+    def cache_info(self):
+        """
+        Method to get hit / miss statistics of the fuzzy match memo
+        :return: functools._CacheInfo
+        """
+        return self._fuzzy_match.cache_info()
+
+
+team_registry = TeamRegistry()
@@ -1,22 +1,30 @@
 """
 Class used to train feed-forward MLP classifiers to make predictions
 """
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import random
+import time
+import numpy as np
+import torch
 from torch import nn, save
 import torch.optim as optim
 
 from core.nnet import NNet, train
 import core.data_processing as dp
+from core.model_log import ModelLog
+from core.raw_data import RawDataCache
+from core.scaler import MinMaxScaler
+from core.export import fuse
+from core.numpy_predict import fused_model_path
 
-import pandas as pd
-import urllib.request
 import os
+import json
 from datetime import date
 import pathlib
-from pathlib import Path
 import uuid
+from pandas import DataFrame
 from termcolor import colored
-from http.client import RemoteDisconnected
-from urllib.error import HTTPError
 
 import warnings
 from sklearn.exceptions import DataConversionWarning
@@ -24,9 +32,176 @@ from sklearn.exceptions import DataConversionWarning
 warnings.filterwarnings(action = "ignore", category = DataConversionWarning)
 
 
+def fit_model(raw_data_combined: DataFrame, epochs: int, verbose: bool, balancing: str = "weighted_sampler",
+              samples_per_epoch: int = None, train_batch_size: int = 5, tensorized: bool = False, lr: float = 0.001,
+              weight_decay: float = 0.001, hidden_size: int = 10, patience: int = None, time_budget: float = None,
+              deadline: float = None, restore_best: bool = True, callbacks: list = None) -> dict:
+    """
+    Def to train a single model in memory, nothing is written to disk
+    :param raw_data_combined: DataFrame
+            preprocessed data to train on, it is not modified
+    :param epochs: int
+            number of epochs to train model for
+    :param verbose: boolean
+            verbose outputs or not
+    :param balancing: str
+            OPTIONAL - how to correct class imbalance, see core.data_processing.processing
+    :param samples_per_epoch: int
+            OPTIONAL - number of training samples per epoch when balancing is "weighted_sampler" or "class_weights"
+    :param train_batch_size: int
+            OPTIONAL - number of samples per training batch, default is 5
+    :param tensorized: bool
+            OPTIONAL - hold the training data in contiguous tensors and batch by slicing them
+    :param lr: float
+            OPTIONAL - max learning rate of the one cycle schedule, default is 0.001
+    :param weight_decay: float
+            OPTIONAL - AdamW weight decay, default is 0.001
+    :param hidden_size: int
+            OPTIONAL - number of units in the hidden layer of the NNet, default is 10
+    :param patience: int
+            OPTIONAL - stop training once test loss hasn't improved for this many epochs
+    :param time_budget: float
+            OPTIONAL - seconds training may take
+    :param deadline: float
+            OPTIONAL - time.monotonic() time by which training must stop
+    :param restore_best: bool
+            OPTIONAL - keep the weights of the epoch with the lowest test loss rather than the last epoch,
+            default is True
+    :param callbacks: list
+            OPTIONAL - per epoch metric callbacks, see core.nnet.train
+    :return: dict
+            the trained "net", the ordered feature columns "ord_cols_df", the scaler "coeffs" and the "history"
+    """
+    # process and split the data, coeffs used to scale the data
+    train_dataloader, test_dataloder, ord_cols_df, coeffs = dp.processing(input_df = raw_data_combined.copy(),
+                                                                          test_size = 0.2,
+                                                                          train_batch_size = train_batch_size,
+                                                                          balancing = balancing,
+                                                                          samples_per_epoch = samples_per_epoch,
+                                                                          tensorized = tensorized)
+    # create a neural net
+    net = NNet(input_size = len(ord_cols_df), hidden_size = hidden_size)
+    # loss function
+    if balancing == "class_weights":
+        criterion = nn.CrossEntropyLoss(weight = dp.class_weights(train_dataloader.dataset.labels))
+    else:
+        criterion = nn.CrossEntropyLoss()
+    # optimiser
+    optimiser = optim.AdamW(net.parameters(), lr = lr, weight_decay = weight_decay)
+    # lr scheduler
+    lr_scheduler = optim.lr_scheduler.OneCycleLR(optimizer = optimiser,
+                                                 max_lr = lr,
+                                                 epochs = epochs,
+                                                 steps_per_epoch = len(train_dataloader))
+    history = train(nn = net,
+                    train_dataloder = train_dataloader,
+                    test_dataloder = test_dataloder,
+                    epochs = epochs,
+                    criterion = criterion,
+                    optimiser = optimiser,
+                    lr_scheduler = lr_scheduler,
+                    verbose = verbose,
+                    patience = patience,
+                    time_budget = time_budget,
+                    deadline = deadline,
+                    restore_best = restore_best,
+                    callbacks = callbacks)
+    return {"net": net.cpu(), "ord_cols_df": ord_cols_df, "coeffs": coeffs, "history": history}
+
+
+def save_model(saved_models_dir: str, fitted: dict, params: dict = None) -> dict:
+    """
+    Def to output a model trained by fit_model to the saved models directory
+    :param saved_models_dir: str
+            directory models are saved in
+    :param fitted: dict
+            as returned by fit_model
+    :param params: dict
+            OPTIONAL - hyperparameters the model was trained with, recorded in the model log
+    :return: dict
+            model log entry for the model
+    """
+    # unique id to label model with
+    model_id = str(uuid.uuid1())
+
+    # directory to output the model to, as well as various other files
+    model_output_dir = saved_models_dir + model_id + "/"
+    if not os.path.exists(model_output_dir):
+        os.makedirs(model_output_dir)
+
+    # output the model, the columns and scaler coeffs
+    save(fitted["net"].state_dict(), model_output_dir + model_id + ".pth")
+    fitted["ord_cols_df"].to_csv(model_output_dir + model_id + ".csv", index_label = False, index = False)
+    fitted["coeffs"].to_csv(model_output_dir + model_id + "_coeffs.csv", index_label = False, index = False)
+    # and the fused NumPy artifact, so the model can be used for prediction without torch
+    exp_cols = fitted["ord_cols_df"]["columns"].to_list()
+    scaler = MinMaxScaler(columns = exp_cols, mins = fitted["coeffs"]["mins"], maxes = fitted["coeffs"]["maxes"])
+    fuse(model_id = model_id, net = fitted["net"], exp_cols = exp_cols,
+         scaler = scaler).save(fused_model_path(saved_models_dir, model_id))
+
+    # metrics of the epoch whose weights were saved
+    history = fitted["history"]
+    final_epoch = history[4]
+    today = date.today().strftime("%Y%m%d")
+    log_entry = {"Model ID": model_id, "Date": today, "Test Acc": history[1][final_epoch],
+                 "Test F1": history[2][final_epoch], "Test Loss": history[3][final_epoch]}
+    if params is not None:
+        log_entry["Params"] = json.dumps(params, sort_keys = True)
+    if "seed" in fitted:
+        # so the model can be reproduced
+        log_entry["Seed"] = fitted["seed"]
+    return log_entry
+
+
+# preprocessed data shared by every model a train_many worker trains, set once per worker by init_worker
+_worker_raw_data = None
+
+
+def init_worker(raw_data_combined: DataFrame, threads: int) -> None:
+    """
+    Def used as the initializer of processes that train models, e.g. by Train.train_many and core.sweep.Sweep
+    :param raw_data_combined: DataFrame
+            preprocessed data every model the process trains is trained on
+    :param threads: int
+            number of torch threads the process may use
+    :return: nothing
+    """
+    global _worker_raw_data
+    _worker_raw_data = raw_data_combined
+    # cap the threads each worker uses so workers don't oversubscribe the cpu
+    torch.set_num_threads(threads)
+
+
+def fit_model_with_seed(seed: int, train_kwargs: dict) -> dict:
+    """
+    Def to train a model with fit_model in a process started with init_worker
+    :param seed: int
+            random seed to train the model with
+    :param train_kwargs: dict
+            arguments of fit_model, other than raw_data_combined
+    :return: dict
+            as returned by fit_model, with the "seed" the model was trained with, or None if the model wasn't
+            trained as its "deadline" had already passed
+    """
+    if train_kwargs.get("deadline") is not None and time.monotonic() >= train_kwargs["deadline"]:
+        return None
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+    fitted = fit_model(raw_data_combined = _worker_raw_data, **train_kwargs)
+    fitted["seed"] = seed
+    return fitted
+
+
 class Train(object):
 
-    def __init__(self):
+    def __init__(self, sources: list = None):
+        """
+        Constructor gets the latest raw data, football-data.co.uk is only queried for seasons that have changed
+        :param sources: list of tuple
+                OPTIONAL - (name, url) of each season of raw data to train on, defaults to
+                core.raw_data.season_sources
+        """
         self.path = str(pathlib.Path().absolute())
 
         data_dir = self.path + "/data/raw/"
@@ -34,86 +209,116 @@ class Train(object):
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
 
-        # grab the latest data
-        try:
-            urllib.request.urlretrieve("http://www.football-data.co.uk/mmz4281/2021/E0.csv", data_dir + "2021.csv")
-            urllib.request.urlretrieve("https://www.football-data.co.uk/mmz4281/1920/E0.csv", data_dir + "1920.csv")
-            urllib.request.urlretrieve("https://www.football-data.co.uk/mmz4281/1819/E0.csv", data_dir + "1819.csv")
-        except RemoteDisconnected:
-            print(colored("Error connecting to remote when sourcing updated data, using data stored locally instead",
-                          "red"))
-        except HTTPError:
-            print(colored("Error connecting to remote when sourcing updated data, using data stored locally instead",
-                          "red"))
-
-        raw_data_18_19 = pd.read_csv(data_dir + "1819.csv")
-        raw_data_19_20 = pd.read_csv(data_dir + "1920.csv")
-        raw_data_20_21 = pd.read_csv(data_dir + "2021.csv")
+        # grab the latest data, preprocessing is only re-run if one of the seasons has changed
+        raw_data_cache = RawDataCache(cache_dir = data_dir)
+        self.raw_data_combined = raw_data_cache.combined(preprocess = dp.preprocessing, sources = sources)
 
-        self.raw_data_combined = dp.preprocessing(raw_data_19_20, raw_data_20_21, raw_data_18_19)
-
-    def train(self, epochs: int, verbose: bool) -> None:
+    def train(self, epochs: int, verbose: bool, balancing: str = "weighted_sampler", samples_per_epoch: int = None,
+              train_batch_size: int = 5, tensorized: bool = False, patience: int = None,
+              time_budget: float = None, callbacks: list = None) -> str:
         """
         Method to train model
         :param epochs: int
                 number of epochs to train model for
         :param verbose: boolean
                 verbose outputs or not
-        :return: nothing
+        :param balancing: str
+                OPTIONAL - how to correct class imbalance, one of "weighted_sampler" (default), "oversample" or
+                "class_weights", see core.data_processing.processing
+        :param samples_per_epoch: int
+                OPTIONAL - number of training samples per epoch when balancing is "weighted_sampler" or
+                "class_weights"
+        :param train_batch_size: int
+                OPTIONAL - number of samples per training batch, default is 5
+        :param tensorized: bool
+                OPTIONAL - hold the training data in contiguous tensors and batch by slicing them, recommended for
+                large batch sizes
+        :param patience: int
+                OPTIONAL - stop training once test loss hasn't improved for this many epochs
+        :param time_budget: float
+                OPTIONAL - seconds training (including processing the data) may take, e.g. the time left before
+                kickoff. The weights of the best epoch seen within the budget are saved
+        :param callbacks: list
+                OPTIONAL - callables called after each epoch with a dict of the epoch's metrics, see
+                core.nnet.train
+        :return: str
+                model id of the trained model
         """
-
-        # unique id to label model with
-        model_id = uuid.uuid1()
-        model_id = str(model_id)
-
-        # directory to output the model to, as well as various other files
-        model_output_dir = self.path + "/saved_models/" + model_id + "/"
-        if not os.path.exists(model_output_dir):
-            os.makedirs(model_output_dir)
-
-        # process and split the data, coeffs used to scale the data
-        train_dataloader, test_dataloder, ord_cols_df, coeffs = dp.processing(input_df = self.raw_data_combined,
-                                                                              test_size = 0.2,
-                                                                              train_batch_size = 5)
-        lr = 0.001
-        # create a neural net
-        net = NNet()
-        # loss function
-        criterion = nn.CrossEntropyLoss()
-        # optimiser
-        optimiser = optim.AdamW(net.parameters(), lr = lr, weight_decay = 0.001)
-        # lr scheduler
-        lr_scheduler = optim.lr_scheduler.OneCycleLR(optimizer = optimiser,
-                                                     max_lr = lr,
-                                                     epochs = epochs,
-                                                     steps_per_epoch = len(train_dataloader))
-        history = train(nn = net,
-                        train_dataloder = train_dataloader,
-                        test_dataloder = test_dataloder,
-                        epochs = epochs,
-                        criterion = criterion,
-                        optimiser = optimiser,
-                        lr_scheduler = lr_scheduler,
-                        verbose = verbose)
-
-        today = date.today().strftime("%Y%m%d")
-
-        # output the model, the columns and scaler coeffs
-        save(net.state_dict(), model_output_dir + model_id + ".pth")
-        ord_cols_df.to_csv(model_output_dir + model_id + ".csv", index_label = False, index = False)
-        coeffs.to_csv(model_output_dir + model_id + "_coeffs.csv", index_label = False, index = False)
-
-        log_output = self.path + "/saved_models/model_log.csv"
-        log_entry = {"Model ID": model_id, "Date": today,
-                     "Test Acc": [history[1][-1]], "Test F1": [history[2][-1]]}
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        fitted = fit_model(raw_data_combined = self.raw_data_combined,
+                           epochs = epochs,
+                           verbose = verbose,
+                           balancing = balancing,
+                           samples_per_epoch = samples_per_epoch,
+                           train_batch_size = train_batch_size,
+                           tensorized = tensorized,
+                           patience = patience,
+                           deadline = deadline,
+                           callbacks = callbacks)
+        saved_models_dir = self.path + "/saved_models/"
+        log_entry = save_model(saved_models_dir = saved_models_dir, fitted = fitted)
 
         # update the log with results of test of model
-        try:
-            log = pd.read_csv(log_output)
-            log_update = pd.DataFrame(data = log_entry)
-            log = pd.concat([log, log_update], ignore_index = True)
-        except FileNotFoundError:
-            Path(log_output).touch()
-            log = pd.DataFrame(data = log_entry)
-
-        log.to_csv(log_output, index = False, index_label = False)
+        ModelLog(saved_models_dir = saved_models_dir).append([log_entry])
+        return log_entry["Model ID"]
+
+    def train_many(self, n_models: int = None, seeds: list = None, workers: int = None, epochs: int = 3,
+                   threads_per_worker: int = None, time_budget: float = None, **train_kwargs) -> list:
+        """
+        Method to train many independent models in parallel, each in its own process
+        :param n_models: int
+                OPTIONAL - number of models to train, required if seeds is not passed
+        :param seeds: list of int
+                OPTIONAL - random seed of each model to train, defaults to n_models fresh random seeds so repeated
+                runs train new models. The seed of each model is recorded in the model log
+        :param workers: int
+                OPTIONAL - number of processes to train in, defaults to the number of cpus
+        :param epochs: int
+                OPTIONAL - number of epochs to train each model for, default is 3
+        :param threads_per_worker: int
+                OPTIONAL - number of torch threads each process may use, defaults to cpus / workers
+        :param time_budget: float
+                OPTIONAL - seconds training all the models may take. Models still training when it is spent stop
+                early and seeds that haven't started training by then are skipped
+        :param train_kwargs:
+                OPTIONAL - any other arguments accepted by train, e.g. balancing or train_batch_size
+        :return: list of str
+                model ids of the trained models, in the order of seeds
+        """
+        if seeds is None:
+            if n_models is None:
+                raise ValueError("Either n_models or seeds must be passed to train_many")
+            seeds = [int(seed) for seed in np.random.SeedSequence().generate_state(n_models)]
+        elif n_models is not None and n_models != len(seeds):
+            raise ValueError("n_models ({}) does not match the number of seeds ({})".format(n_models, len(seeds)))
+        if len(seeds) == 0:
+            return []
+
+        cpus = os.cpu_count() or 1
+        workers = min(workers or cpus, len(seeds))
+        threads_per_worker = threads_per_worker or max(1, cpus // workers)
+        train_kwargs["epochs"] = epochs
+        train_kwargs.setdefault("verbose", False)
+        # one deadline shared by every model, rather than a budget each
+        train_kwargs["deadline"] = None if time_budget is None else time.monotonic() + time_budget
+
+        print(colored("Training {} model(s) in {} process(es)....".format(len(seeds), workers), "green"))
+        # the preprocessed data is sent to each worker once, rather than with every model
+        with ProcessPoolExecutor(max_workers = workers,
+                                 mp_context = multiprocessing.get_context("spawn"),
+                                 initializer = init_worker,
+                                 initargs = (self.raw_data_combined, threads_per_worker)) as executor:
+            futures = [executor.submit(fit_model_with_seed, seed, train_kwargs) for seed in seeds]
+            fitted_models = [future.result() for future in futures]
+        fitted_models = [fitted for fitted in fitted_models if fitted is not None]
+        if len(fitted_models) < len(seeds):
+            print(colored("Time budget spent, {} model(s) not trained".format(len(seeds) - len(fitted_models)),
+                          "red"))
+
+        # output every model, then register all of them with the log in one transaction
+        saved_models_dir = self.path + "/saved_models/"
+        log_entries = [save_model(saved_models_dir = saved_models_dir, fitted = fitted) for fitted in fitted_models]
+        if log_entries:
+            ModelLog(saved_models_dir = saved_models_dir).append(log_entries)
+        print(colored("Training of {} model(s) completed".format(len(fitted_models)), "green"))
+        return [log_entry["Model ID"] for log_entry in log_entries]
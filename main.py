@@ -7,85 +7,60 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_httpauth import HTTPBasicAuth
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
+import hmac
+import hashlib
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+import sqlite3
 import time
 import os
 import json
-from os.path import basename as get_plot_title, splitext
 import uuid
 from pathlib import Path
 import threading
 from pandas import DataFrame
 from datetime import datetime
-from core.strudel_interface import validate_date, StrudelInterface
-from analytics.visulisation import Visualisation
-from core.APPLE import APPLE
+from core.strudel_interface import validate_date, StrudelInterface, prediction_payloads
+from core.fixture_cache import FixtureCache
+from utils.api_utils import TaskQueue, QueueFullError, RequestStore, TTLCache
 from shutil import rmtree
 
 path = str(Path().absolute())
 home_dir_abs = str(Path().absolute().parent.parent)
 
 
-def return_apple_result_to_strudel(apple_results: DataFrame) -> None:
+def return_apple_result_to_strudel(apple_results: DataFrame) -> list:
     """
-    Def to return APPLE produced predictions to STRUDEL
+    Def to return APPLE produced predictions to STRUDEL, all fixtures are uploaded concurrently
     :param apple_results: DataFrame
             APPLE output DataFrame
-    :return: Nothing
+    :return: list
+            FixtureIDs of the predictions that failed to upload
     """
     # crete connection to strudel
     strudel_connection = StrudelInterface(credentials_filepath = path + '/credentials/credentials.json')
-    # get list of FixtureIDs
-    fixture_ids = apple_results["FixtureID"].to_list()
-    for fixture in fixture_ids:
-        filtered_predictions = apple_results.loc[apple_results["FixtureID"] == fixture]
-        fixture_predictions = {
-            "prediction": filtered_predictions["APPLE Prediction"].tolist()[0],
-            "homeWinProbability": filtered_predictions["p(H)"].tolist()[0],
-            "drawProbability": filtered_predictions["p(D)"].tolist()[0],
-            "awayWinProbability": filtered_predictions["p(A)"].tolist()[0],
-            "fixture": {
-                "id": fixture
-            },
-            "user": {
-                "id": 10
-            }
-        }
-        strudel_connection.return_predictions(prediction_details = fixture_predictions)
-
-
-def update_task_status(task_id: str, status_update: str, task_list: list) -> None:
-    """
-    Def to update status of API tasks
-    :param task_id: str
-            Task ID of the task to update
-    :param status_update: str
-            What to update the status to
-    :param task_list: list
-            The list of tasks that could be updated
-    :return: Nothing
-    """
-    for a_task in task_list:
-        if a_task["task_id"] == task_id:
-            a_task["task_status"] = status_update
+    # one prediction per fixture, as APPLE produced it
+    fixture_predictions = prediction_payloads(apple_results.drop_duplicates(subset = ["FixtureID"]))
+    uploaded = strudel_connection.return_predictions_bulk(predictions = fixture_predictions)
+    return [fixture for fixture, success in uploaded.items() if not success]
 
 
-def update_request_status(request_id: str, status_update: str, request_list: list) -> None:
+def update_request_status(request_id: str, status_update: str, request_list: RequestStore) -> None:
     """
     Def to update status of API tasks
     :param request_id: str
             Request ID of the request to update
     :param status_update: str
             What to update the status to
-    :param request_list:
-            The list of requests that could be updated
+    :param request_list: RequestStore
+            The store of requests that could be updated
     :return: Nothing
     """
-    for a_task in request_list:
-        if a_task["request_id"] == request_id:
-            a_task["request_status"] = status_update
+    request_list.update(request_id, {"request_status": status_update})
 
 
-def add_to_request_status(request_id: str, key_to_add: str, value_to_add: str,request_list: list) -> None:
+def add_to_request_status(request_id: str, key_to_add: str, value_to_add: str, request_list: RequestStore) -> None:
     """
     Def to update status of API tasks
     :param value_to_add: str
@@ -94,22 +69,33 @@ def add_to_request_status(request_id: str, key_to_add: str, value_to_add: str,re
             Key to add to the request json
     :param request_id: str
             Request ID of the request to update
-    :param request_list:
-            The list of requests that could be updated
+    :param request_list: RequestStore
+            The store of requests that could be updated
     :return: Nothing
     """
-    for a_task in request_list:
-        if a_task["request_id"] == request_id:
-            a_task[key_to_add] = value_to_add
+    request_list.update(request_id, {key_to_add: value_to_add})
+
+
+def pagination() -> tuple:
+    """
+    Def to read the pagination query parameters of a listing endpoint, ?offset=<int>&limit=<int>
+    :return: tuple
+            offset and limit
+    """
+    offset = request.args.get("offset", default = 0, type = int)
+    limit = request.args.get("limit", default = default_page_size, type = int)
+    if offset < 0 or limit < 1:
+        abort(400)
+    return offset, min(limit, max_page_size)
 
 
-def rest_apple_interface(task: dict, task_list: list) -> None:
+def rest_apple_interface(task: dict, task_queue: TaskQueue) -> None:
     """
-    Def used to run APPLE
+    Def used to run APPLE, called by a task queue worker
     :param task: dict
             Dict that contains task details
-    :param task_list: list
-            List of all task dicts
+    :param task_queue: TaskQueue
+            Queue the task was submitted to, used to update the status of the task
     :return: Nothing
     """
     # create temp dir to store file used when making predictions
@@ -117,33 +103,36 @@ def rest_apple_interface(task: dict, task_list: list) -> None:
     temp_dir = Path(temp_dir)
     if not temp_dir.exists():
         temp_dir.mkdir(parents = True)
+    # APPLE is imported on first use so the app starts (and answers health checks) without importing torch
+    from core.APPLE import APPLE
     apple_object = APPLE(use_strudel = True,
                          start_date = task['start_date'],
                          end_date = task['end_date'],
-                         fixtures_to_predict = "temporary_data/" + task['task_id'] + "/" + task[
-                             'task_id'] + "_fixtures_to_predict.csv",
+                         # fixtures to predict are kept in memory rather than saved
+                         fixtures_to_predict = None,
                          # interface with STRUDEL is required here
                          data_for_predictions = task['data_for_predictions'],
                          job_name = task['task_id'])
     # check if backtesting is requested, if so complete
     if task["backtest"] == "true":
-        update_task_status(task_id = task["task_id"], status_update = "Backtesting saved models", task_list = task_list)
+        task_queue.update_status(task_id = task["task_id"], task_status = "Backtesting saved models")
         if "ftr" in task:
             apple_object.backtest(data_to_backtest_on = task["data_to_backtest_on"], ftrs = task["ftr"])
         else:
             apple_object.backtest(data_to_backtest_on = task["data_to_backtest_on"])
-    update_task_status(task_id = task["task_id"], status_update = "Making predictions", task_list = task_list)
+    task_queue.update_status(task_id = task["task_id"], task_status = "Making predictions")
     apple_predictions = apple_object.run(return_results = True)
-    return_apple_result_to_strudel(apple_predictions)
+    failed_uploads = return_apple_result_to_strudel(apple_predictions)
+    # FixtureIDs of predictions that failed to upload are kept with the task, which finishes as Partially Complete
+    task_queue.add_to_task(task_id = task["task_id"], fields = {"failed_uploads": failed_uploads})
     # use STRUDEL endpoint here to return the above results
     if task['cleanup'] == "true":
-        update_task_status(task_id = task["task_id"], status_update = "Cleaning up saved models directories",
-                           task_list = task_list)
+        task_queue.update_status(task_id = task["task_id"], task_status = "Cleaning up saved models directories")
         apple_object.cleanup()
     rmtree(temp_dir)
     rmtree(temp_dir.parent)
-    update_task_status(task_id = task["task_id"], status_update = "Complete",
-                       task_list = task_list)
+    task_queue.update_status(task_id = task["task_id"],
+                             task_status = "Partially Complete" if failed_uploads else "Complete")
 
 
 # --- API is defined from here to end
@@ -158,12 +147,59 @@ if not os.path.exists("users_db_apple"):
 app.config['SQLALCHEMY_DATABASE_URI'] = db_loc
 app.config['SECRET_KEY'] = str(uuid.uuid4())
 app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] = True
+# reuse a pool of connections rather than opening the users db for every request
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {"poolclass": QueuePool,
+                                          "pool_size": 5,
+                                          "max_overflow": 10,
+                                          "pool_pre_ping": True,
+                                          "connect_args": {"check_same_thread": False, "timeout": 30}}
 db = SQLAlchemy(app)
 auth = HTTPBasicAuth()
 
-# list used to store all task dicts
-tasks = []
-vis_requests = []
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Def to put every new SQLite connection in WAL mode, so reads (e.g. authentication) aren't blocked by writes
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+# verified tokens, user rows and passwords are cached for APPLE_AUTH_CACHE_TTL seconds, default 60, so clients polling
+# the API don't decode a token, query the db and hash a password on every request. Passwords are cached as an HMAC
+# under a key that only exists in this process
+auth_cache_ttl = float(os.environ.get("APPLE_AUTH_CACHE_TTL", 60))
+auth_cache_key = os.urandom(32)
+token_cache = TTLCache(ttl = auth_cache_ttl)
+user_cache = TTLCache(ttl = auth_cache_ttl)
+password_cache = TTLCache(ttl = auth_cache_ttl)
+
+# completed tasks and visualisation requests are forgotten after APPLE_COMPLETED_TTL seconds, default 1 day
+completed_ttl = float(os.environ.get("APPLE_COMPLETED_TTL", 86400))
+# listing endpoints return at most this many entries per page
+default_page_size = 100
+max_page_size = 1000
+
+# APPLE tasks are persisted in SQLite and run by a fixed number of workers, so a burst of requests queues rather
+# than training many models at once, and tasks survive a restart. Concurrency and queue size can be configured with
+# the APPLE_TASK_WORKERS and APPLE_TASK_QUEUE_SIZE environment variables. The workers are started by the first request
+# served, not on import, so importing main (or the reloader's parent process) never runs tasks
+tasks_db_loc = 'tasks_db_apple/tasks.db'
+task_queue = TaskQueue(db_loc = tasks_db_loc,
+                       handler = rest_apple_interface,
+                       workers = int(os.environ.get("APPLE_TASK_WORKERS", 1)),
+                       max_queued = int(os.environ.get("APPLE_TASK_QUEUE_SIZE", 100)),
+                       done_ttl = completed_ttl)
+
+# store of all visualisation request dicts, indexed by request id
+vis_requests = RequestStore(id_key = "request_id",
+                            status_key = "request_status",
+                            completed_statuses = ("Complete", "Partially Complete", "Error"),
+                            ttl = completed_ttl)
 
 accepting_new_users = True
 
@@ -214,30 +250,76 @@ class User(db.Model):
                 auth token to verify
         :return: nothing
         """
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'],
-                              algorithms = ['HS256'])
-        except:
-            return
-        return User.query.get(data['id'])
+        user_id = token_cache.get(token)
+        if user_id is None:
+            try:
+                data = jwt.decode(token, app.config['SECRET_KEY'],
+                                  algorithms = ['HS256'])
+            except:
+                return
+            user_id = data.get('id')
+            if user_id is None:
+                return
+            # never cache a token beyond its expiry, tokens without one are cached for the cache's default ttl
+            expiry = data.get('exp')
+            token_cache.set(token, user_id, ttl = None if expiry is None else expiry - time.time())
+        return cached_user(user_id)
 
     def __repr__(self):
         return "<User %r>" % self.username
 
 
+def cached_user(user_id: int):
+    """
+    Def to get a user, user rows are cached as detached copies so they can be shared across requests
+    :param user_id: int
+            id of the user
+    :return: User
+            the user, or None if there is no user with the id
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        row = User.query.get(user_id)
+        if row is None:
+            return
+        user = User(id = row.id, username = row.username, password_hash = row.password_hash)
+        user_cache.set(user_id, user)
+    return user
+
+
+def password_digest(password: str) -> bytes:
+    return hmac.new(auth_cache_key, (password or "").encode("utf-8"), hashlib.sha256).digest()
+
+
 @auth.verify_password
 def verify_password(username_or_token: str, password: str) -> bool:
     # first try to authenticate by token
     user = User.verify_auth_token(username_or_token)
     if not user:
-        # try to authenticate with username/password
-        user = User.query.filter_by(username=username_or_token).first()
-        if not user or not user.verify_password(password):
+        # try to authenticate with username/password, skipping the slow hash check if the password was verified
+        # recently
+        digest = password_digest(password)
+        cached = password_cache.get(username_or_token)
+        if cached is not None and hmac.compare_digest(cached[0], digest):
+            user = cached_user(cached[1])
+        else:
+            user = User.query.filter_by(username=username_or_token).first()
+            if not user or not user.verify_password(password):
+                return False
+            password_cache.set(username_or_token, (digest, user.id))
+            user = cached_user(user.id)
+        if not user:
             return False
     g.user = user
     return True
 
 
+@app.before_request
+def start_task_queue() -> None:
+    # does nothing once the workers are running
+    task_queue.start()
+
+
 # @application.route('/', methods=['GET'])
 @app.route('/')
 def health() -> json:
@@ -283,9 +365,11 @@ def get_auth_token():
 
 
 @app.errorhandler(404)
-def not_found():
+def not_found(error):
     """
     Return error message
+    :param error:
+            the 404 raised, e.g. by abort(404)
     :return: json
     """
     return make_response(jsonify({'error': 'Not found'}), 404)
@@ -295,10 +379,12 @@ def not_found():
 @auth.login_required
 def get_tasks():
     """
-    Endpoint to return all tasks
+    Endpoint to return all tasks, paginated with ?offset=<int>&limit=<int>
     :return: json
     """
-    return make_response(jsonify({'tasks': tasks}))
+    offset, limit = pagination()
+    page, total = task_queue.page(offset = offset, limit = limit)
+    return make_response(jsonify({'tasks': page, 'total': total, 'offset': offset, 'limit': limit}))
 
 
 @app.route('/apple/api/v1.0/tasks', methods = ['POST'])
@@ -318,22 +404,25 @@ def create_task():
         'start_date': request.json['start_date'],
         'end_date': request.json['end_date'],
         'data_for_predictions': request.json['data_for_predictions'],
-        'task_status': "Submitted",
         "backtest": request.json['backtest'],
         "cleanup": request.json['cleanup']
     }
-    tasks.append(task)
+    # backtesting details are optional
+    for key in ("data_to_backtest_on", "ftr"):
+        if key in request.json:
+            task[key] = request.json[key]
     # validate date formats
     validate_date(date = task["start_date"])
     validate_date(date = task["end_date"])
-    update_task_status(task_id = task_id, status_update = "Running", task_list = tasks)
-    # set up a thread for APPLE to run in background
-    apple_thread = threading.Thread(target = rest_apple_interface, args = (task, tasks,))
-    apple_thread.start()
+    # queue the task, it is run in the background once a worker is free
+    try:
+        task = task_queue.submit(task)
+    except QueueFullError:
+        return make_response(jsonify({'error': 'Too many tasks queued, please try again later'}), 503)
     return jsonify({'task': task}), 201
 
 
-@app.route('/apple/api/v1.0/tasks/<int:task_id>', methods = ['GET'])
+@app.route('/apple/api/v1.0/tasks/<task_id>', methods = ['GET'])
 @auth.login_required
 def get_task(task_id: str):
     """
@@ -342,11 +431,10 @@ def get_task(task_id: str):
             Task ID of the task details to return
     :return: JSON
     """
-    task = [task for task in tasks if task['id'] == task_id]
-    if len(task) == 0:
+    task = task_queue.get(task_id)
+    if task is None:
         abort(404)
-        return jsonify({'task': task[0]})
-    return jsonify({'task': task[0]})
+    return jsonify({'task': task})
 
 
 # --- Visualisation endpoints
@@ -354,6 +442,10 @@ def get_task(task_id: str):
 supported_vis_types = ["volatility", "time_series", "stratified_performance"]
 # this will need to be ported to a request to get data from STRUDEL
 # aggregated_data_filepath = "data/aggregated_results/20_21/predictions_and_results_log.csv"
+# fixtures, predictions and results from STRUDEL are cached locally so each request only fetches the days since the
+# last one, the last APPLE_FIXTURE_REFRESH_DAYS days (default 3) are fetched again to pick up late result changes
+fixture_cache = FixtureCache(cache_dir = path + "/data/strudel_cache/",
+                             refresh_days = int(os.environ.get("APPLE_FIXTURE_REFRESH_DAYS", 3)))
 
 
 @app.route('/analytics/api/v1.0/visualisations', methods = ['POST'])
@@ -376,7 +468,7 @@ def create_visualisations():
         "type": request.json["type"],
         "request_status": "Submitted"
     }
-    vis_requests.append(vis_request)
+    vis_requests.add(vis_request)
     # creat a vis object here
     if vis_request["type"] == "volatility":
         update_request_status(request_id = request_id, status_update = "Generating", request_list = vis_requests)
@@ -396,8 +488,8 @@ def create_visualisations():
         add_to_request_status(request_id = request_id, key_to_add = "Error message",
                               value_to_add = "Error in implementation of visualisation for visualisation type {}. Please see terminal for more information".format(vis_request["type"]),
                               request_list = vis_requests)
-        return jsonify({'request': vis_request}), 201
-    return jsonify({'request': vis_request}), 201
+        return jsonify({'request': vis_requests.get(request_id)}), 201
+    return jsonify({'request': vis_requests.get(request_id)}), 201
 
 
 @app.route('/analytics/api/v1.0/visualisations/all', methods = ['POST'])
@@ -415,23 +507,40 @@ def create_all_visualisations():
     }
     if "date" in request.json:
         vis_request["date"] = request.json["date"]
-    vis_requests.append(vis_request)
+    vis_requests.add(vis_request)
     # create vis object
     update_request_status(request_id = request_id, status_update = "Generating", request_list = vis_requests)
     visualisation_thread = threading.Thread(target = generate_and_return_visualisation,
                                             args = ("all", request_id, vis_request,))
     visualisation_thread.start()
-    return jsonify({'request': vis_request}), 201
+    return jsonify({'request': vis_requests.get(request_id)}), 201
 
 
 @app.route('/analytics/api/v1.0/visualisations', methods = ['GET'])
 @auth.login_required
 def get_all_requests():
     """
-    Return all vis requests as json
+    Return all vis requests as json, paginated with ?offset=<int>&limit=<int>
     :return:
     """
-    return jsonify({'tasks': vis_requests})
+    offset, limit = pagination()
+    page, total = vis_requests.page(offset = offset, limit = limit)
+    return jsonify({'tasks': page, 'total': total, 'offset': offset, 'limit': limit})
+
+
+@app.route('/analytics/api/v1.0/visualisations/<request_id>', methods = ['GET'])
+@auth.login_required
+def get_request(request_id: str):
+    """
+    Endpoint to return details of specified vis request
+    :param request_id: str
+            Request ID of the request details to return
+    :return: json
+    """
+    vis_request = vis_requests.get(request_id)
+    if vis_request is None:
+        abort(404)
+    return jsonify({'request': vis_request})
 
 
 @app.route('/apple/api/v1.0/temporarydata', methods = ['DELETE'])
@@ -470,11 +579,11 @@ def generate_and_return_visualisation(vis_type: str, request_id: str, full_reque
         end_date = full_request["date"]
     else:
         end_date = datetime.today().strftime("%Y-%m-%d")
-    historical_data_loc = "temporary_data/" + request_id + "/historical_data.csv"
-    strudel_connection.get_predictions_and_ftrs(start_date= start_date,
-                                                end_date = end_date,
-                                                output_loc = historical_data_loc)
-    visualizer = Visualisation(aggregated_data_filepath = historical_data_loc, show_visualisations = False)
+    historical_data = fixture_cache.sync(strudel_interface = strudel_connection,
+                                         start_date = start_date,
+                                         end_date = end_date)
+    from analytics.visulisation import Visualisation
+    visualizer = Visualisation(aggregated_data = historical_data, show_visualisations = False)
     if vis_type == "all":
         plots_to_return_to_strudel = [temp_dir_str + "/weekly_winner.html",
                                       temp_dir_str + "/overall_winner.html",
@@ -508,7 +617,14 @@ def generate_and_return_visualisation(vis_type: str, request_id: str, full_reque
         raise Exception("Unexpected Type")
     update_request_status(request_id = request_id, status_update = "Uploading", request_list = vis_requests)
     # make list of failures if any
-    failures = [splitext(get_plot_title(plot))[0] for plot in plots_to_return_to_strudel if not strudel_connection.return_visualisations(html_filepath = plot, visualisation_title = splitext(get_plot_title(plot))[0], notes = "dummy1, dummy2", request_id = request_id)]
+    # plots are uploaded concurrently, plots that haven't changed since they were last uploaded are skipped
+    uploaded = strudel_connection.return_visualisations_bulk(html_filepaths = plots_to_return_to_strudel,
+                                                             notes = "dummy1, dummy2", request_id = request_id)
+    failures = [title for title, upload in uploaded.items() if upload is None]
+    # unchanged plots aren't uploaded again, record which STRUDEL upload displays each plot of the request
+    add_to_request_status(request_id = request_id, key_to_add = "Uploads",
+                          value_to_add = {title: upload for title, upload in uploaded.items() if upload is not None},
+                          request_list = vis_requests)
     if len(failures) >= 1:
         update_request_status(request_id = request_id, status_update = "Partially Complete", request_list = vis_requests)
         add_to_request_status(request_id = request_id, key_to_add = "Plot(s) failed to load", value_to_add = ",".join(failures), request_list = vis_requests)
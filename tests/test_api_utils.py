@@ -0,0 +1,55 @@
+"""
+Tests of the REST API utilities, run with python -m pytest tests from the repository root
+"""
+
+import time
+from utils.api_utils import TaskQueue
+
+
+def noop(task: dict, task_queue: TaskQueue) -> None:
+    pass
+
+
+def test_only_tasks_with_expired_leases_are_run_again(tmp_path):
+    db_loc = str(tmp_path / "tasks.db")
+    crashed = TaskQueue(db_loc = db_loc, handler = noop, lease = 60)
+    for task_id in ["t1", "t2"]:
+        crashed.submit({"task_id": task_id})
+    assert crashed._claim()["task_id"] == "t1"
+
+    # another process sharing the database, t1 is still leased so it isn't run twice
+    other = TaskQueue(db_loc = db_loc, handler = noop, lease = 60)
+    assert other.get("t1")["state"] == "running"
+    assert other._claim()["task_id"] == "t2"
+    assert other._claim() is None
+
+    # once the lease expires (the process running it died) the task is run again
+    crashed.lease = -1
+    crashed.renew_leases()
+    assert other._claim()["task_id"] == "t1"
+    assert other.renew_leases() == 2
+
+
+def test_workers_run_tasks_to_done(tmp_path):
+    task_queue = TaskQueue(db_loc = str(tmp_path / "tasks.db"), handler = noop, workers = 2)
+    task_queue.submit({"task_id": "t1"})
+    task_queue.start()
+    task_queue.start()
+    for _ in range(50):
+        if task_queue.get("t1")["state"] == "done":
+            break
+        time.sleep(0.1)
+    task_queue.stop(timeout = 10)
+    assert task_queue.get("t1")["state"] == "done"
+    assert task_queue._threads == []
+
+
+def test_fields_added_to_task(tmp_path):
+    task_queue = TaskQueue(db_loc = str(tmp_path / "tasks.db"), handler = noop)
+    task_queue.submit({"task_id": "t1", "job_name": "job"})
+    task_queue.add_to_task("t1", {"failed_uploads": [3, 4], "task_status": "ignored"})
+    task_queue.update_status("t1", "Partially Complete")
+    task = task_queue.get("t1")
+    assert task["failed_uploads"] == [3, 4]
+    assert task["job_name"] == "job"
+    assert task["task_status"] == "Partially Complete"
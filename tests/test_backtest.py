@@ -0,0 +1,43 @@
+"""
+Tests of backtesting saved models, run with python -m pytest tests from the repository root
+"""
+
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from core.backtest import backtesting_frame, evaluate_models
+from core.nnet import NNet
+from core.registry import LoadedModel
+from core.scaler import MinMaxScaler
+
+
+def loaded_model(model_id: str, exp_cols: list) -> LoadedModel:
+    return LoadedModel(model_id = model_id, net = NNet(input_size = len(exp_cols)).eval(), exp_cols = exp_cols,
+                       scaler = MinMaxScaler(columns = exp_cols, mins = [0] * len(exp_cols),
+                                             maxes = [10] * len(exp_cols)))
+
+
+@pytest.fixture
+def models(monkeypatch):
+    models = {"teams": loaded_model("teams", ["B365H", "ht_Arsenal", "ht_Fulham", "at_Fulham"]),
+              "odds": loaded_model("odds", ["B365H"]),
+              "unknown": loaded_model("unknown", ["B365H", "PSH"])}
+    monkeypatch.setattr("core.backtest.model_registry.get",
+                        lambda model_id, saved_models_dir = None: models[model_id])
+    return models
+
+
+def test_missing_team_columns_are_filled(models):
+    # Fulham have no home fixture this week, so there is no ht_Fulham column
+    backtesting_data = backtesting_frame(pd.DataFrame({"HomeTeam": ["Arsenal", "Arsenal"],
+                                                       "AwayTeam": ["Fulham", "Fulham"],
+                                                       "B365H": [1.5, 2.0],
+                                                       "FTR": ["H", "A"]}))
+    assert "ht_Fulham" not in backtesting_data.columns
+    results = evaluate_models(model_ids = ["teams", "odds", "unknown"], backtesting_data = backtesting_data,
+                              saved_models_dir = "saved_models/")
+    # models missing features that aren't team columns are skipped
+    assert results["Model ID"].to_list() == ["teams", "odds"]
+    assert results["Test Loss"].notna().all()
@@ -0,0 +1,47 @@
+"""
+Tests of the local STRUDEL fixture cache, run with python -m pytest tests from the repository root
+"""
+
+import pandas as pd
+from core.fixture_cache import FixtureCache
+
+
+class FakeStrudel(object):
+
+    def __init__(self, fixtures: pd.DataFrame):
+        self.fixtures = fixtures
+        self.fetches = []
+
+    def get_predictions_and_ftrs(self, start_date: str, end_date: str) -> pd.DataFrame:
+        self.fetches.append((start_date, end_date))
+        dates = self.fixtures["Date"].str[:10]
+        return self.fixtures[(dates >= start_date) & (dates <= end_date)].reset_index(drop = True)
+
+
+def fixtures(dates: list) -> pd.DataFrame:
+    return pd.DataFrame({"FixtureID": list(range(len(dates))), "Date": dates, "Time": ["15:00"] * len(dates)})
+
+
+def test_cache_is_shared_between_processes(tmp_path):
+    strudel = FakeStrudel(fixtures(["2020-09-12", "2020-09-19", "2020-09-26"]))
+    first = FixtureCache(cache_dir = str(tmp_path), refresh_days = 3)
+    # nothing is read or written until the first sync
+    assert first.fixtures is None
+    assert len(first.sync(strudel, "2020-09-12", "2020-09-20")) == 2
+    # e.g. another worker process of the API, it picks up the cache the first saved and only fetches what is new
+    second = FixtureCache(cache_dir = str(tmp_path), refresh_days = 3)
+    assert len(second.sync(strudel, "2020-09-12", "2020-09-30")) == 3
+    assert strudel.fetches[-1] == ("2020-09-17", "2020-09-30")
+    # and the first reloads the cache the second saved
+    assert len(first.sync(strudel, "2020-09-12", "2020-09-30")) == 3
+    assert strudel.fetches[-1][0] == "2020-09-27"
+
+
+def test_rescheduled_fixture_replaces_cached_row(tmp_path):
+    strudel = FakeStrudel(fixtures(["2020-09-12", "2020-09-19"]))
+    cache = FixtureCache(cache_dir = str(tmp_path), refresh_days = 3)
+    cache.sync(strudel, "2020-09-12", "2020-09-20")
+    # fixture 1 is postponed until after the end of the next window
+    strudel.fixtures.loc[1, "Date"] = "2020-10-20"
+    assert cache.sync(strudel, "2020-09-12", "2020-09-30")["FixtureID"].to_list() == [0]
+    assert cache.sync(strudel, "2020-09-12", "2020-10-31")["FixtureID"].to_list() == [0, 1]
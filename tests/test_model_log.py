@@ -0,0 +1,36 @@
+"""
+Tests of the SQLite model log, run with python -m pytest tests from the repository root
+"""
+
+import pytest
+from core.model_log import ModelLog
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = ModelLog(saved_models_dir = str(tmp_path) + "/")
+    log.append({"Model ID": ["m" + str(i) for i in range(50)],
+                "Date": ["20201001"] * 50,
+                "Model type": [i % 2 for i in range(50)],
+                "Test Acc": [None if i % 10 == 0 else i / 50 for i in range(50)],
+                "Test F1": [i / 100 for i in range(50)],
+                "Test Loss": [1 - i / 50 for i in range(50)]})
+    return log
+
+
+@pytest.mark.parametrize("by", ["Test Acc", "Test F1", "Test Loss", "Date"])
+@pytest.mark.parametrize("model_type", [None, 1])
+@pytest.mark.parametrize("ascending", [False, True])
+def test_top_uses_index(log, by, model_type, ascending):
+    sql, params = log._top_sql(k = 5, by = by, ascending = ascending, model_type = model_type)
+    plan = " ".join(log.query_plan(sql, params))
+    assert "USING INDEX" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_top_ranks_and_skips_missing_values(log):
+    top = log.top(3, by = "Test Acc")
+    assert top["Model ID"].to_list() == ["m49", "m48", "m47"]
+    bottom = log.top(3, by = "Test Acc", ascending = True)
+    assert bottom["Model ID"].to_list() == ["m1", "m2", "m3"]
+    assert log.top(3, by = "Test Acc", model_type = 0)["Model ID"].to_list() == ["m48", "m46", "m44"]
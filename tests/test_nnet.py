@@ -0,0 +1,28 @@
+"""
+Tests of the training loop, run with python -m pytest tests from the repository root
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from core.nnet import NNet, train
+
+
+@pytest.mark.parametrize("class_weights", [None, [1.0, 3.0, 0.5]])
+def test_epoch_loss_is_mean_over_samples(class_weights):
+    torch.manual_seed(0)
+    features = torch.rand(30, 4)
+    labels = torch.randint(0, 3, (30,))
+    weight = None if class_weights is None else torch.tensor(class_weights)
+    net = NNet(input_size = 4, hidden_size = 3)
+    criterion = torch.nn.CrossEntropyLoss(weight = weight)
+    # batches of different sizes, the epoch loss must equal the loss of the whole set in one batch
+    test_batches = [(features[:7], labels[:7]), (features[7:], labels[7:])]
+    optimiser = torch.optim.SGD(net.parameters(), lr = 0.0)
+    history = train(nn = net, train_dataloder = test_batches, test_dataloder = test_batches, epochs = 1,
+                    criterion = criterion, optimiser = optimiser,
+                    lr_scheduler = torch.optim.lr_scheduler.LambdaLR(optimiser, lambda step: 1.0), verbose = False)
+    with torch.no_grad():
+        expected = criterion(net(features), labels).item()
+    assert history[3][0] == pytest.approx(expected, rel = 1e-5)
@@ -0,0 +1,47 @@
+"""
+Tests of the raw data cache, run with python -m pytest tests from the repository root
+"""
+
+import os
+import pandas as pd
+from core.raw_data import RawDataCache
+from utils.file_utils import write_atomic
+
+
+def first_season(df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
+    return df1
+
+
+def both_seasons(df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
+    return pd.concat([df1, df2], ignore_index = True)
+
+
+def sources(tmp_path) -> list:
+    for name in ["1920", "2021"]:
+        pd.DataFrame({"HomeTeam": ["Arsenal"], "Season": [name]}).to_csv(str(tmp_path / (name + ".csv")), index = False)
+    return [(name, (tmp_path / (name + ".csv")).as_uri()) for name in ["1920", "2021"]]
+
+
+def test_snapshot_key_includes_preprocessing(tmp_path, monkeypatch):
+    cache = RawDataCache(cache_dir = str(tmp_path / "cache"))
+    raw_sources = sources(tmp_path)
+    assert len(cache.combined(first_season, sources = raw_sources)) == 1
+    # same raw data, different preprocessing code, must not be served the first snapshot
+    monkeypatch.setattr("core.raw_data._code_hash", lambda preprocess: preprocess.__name__)
+    assert len(cache.combined(first_season, sources = raw_sources)) == 1
+    assert len(cache.combined(both_seasons, sources = raw_sources)) == 2
+
+
+def test_prune_keeps_recent_snapshots(tmp_path):
+    cache = RawDataCache(cache_dir = str(tmp_path / "cache"))
+    raw_sources = sources(tmp_path)
+    other_snapshot = os.path.join(cache.snapshots_dir, "other.pkl")
+    write_atomic(other_snapshot, b"")
+    cache.combined(first_season, sources = raw_sources)
+    # another process may be about to read it
+    assert os.path.exists(other_snapshot)
+    cache.prune_grace = -1
+    cache.combined(both_seasons, sources = raw_sources)
+    assert not os.path.exists(other_snapshot)
+    # no temporary files left behind
+    assert not [f for f in os.listdir(cache.snapshots_dir) + os.listdir(cache.objects_dir) if f.endswith(".tmp")]
@@ -0,0 +1,30 @@
+"""
+Tests of the loaded model registry, run with python -m pytest tests from the repository root
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from core.registry import ModelRegistry, LoadedModel
+
+
+def test_cold_load_does_not_block_other_models(monkeypatch):
+    registry = ModelRegistry(max_size = 4)
+    release = threading.Event()
+    loads = []
+
+    def load(model_id: str, saved_models_dir: str) -> LoadedModel:
+        loads.append(model_id)
+        if model_id == "slow":
+            assert release.wait(timeout = 10)
+        return LoadedModel(model_id = model_id, net = None, exp_cols = [], scaler = None)
+
+    monkeypatch.setattr(registry, "_load", load)
+    registry.get("cached", saved_models_dir = "dir/")
+    with ThreadPoolExecutor(max_workers = 3) as executor:
+        slow = [executor.submit(registry.get, "slow", "dir/") for _ in range(2)]
+        # served while "slow" is still loading
+        assert executor.submit(registry.get, "cached", "dir/").result(timeout = 5).model_id == "cached"
+        release.set()
+        assert slow[0].result(timeout = 5) is slow[1].result(timeout = 5)
+    # each model is only loaded once
+    assert loads == ["cached", "slow"]
@@ -0,0 +1,139 @@
+"""
+Tests of the STRUDEL client against a local stand-in server, run with python -m pytest tests from the repository root
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import pandas as pd
+import pytest
+from core.loaders import load_json_or_csv
+from core.strudel_interface import StrudelClient, StrudelInterface
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    Stand-in for STRUDEL. Each login issues a new token and only the latest is accepted, queued status codes are
+    returned (once each) before a request is handled and gzip encoded bodies are rejected with gzip_response if set
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status_code: int, body: dict = None):
+        contents = json.dumps(body or {}).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(contents)))
+        self.end_headers()
+        self.wfile.write(contents)
+
+    def handle_request(self):
+        state = self.server.state
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        state["requests"].append((self.command, self.path))
+        if self.path == "/login":
+            state["logins"] += 1
+            state["token"] = "token-{}".format(state["logins"])
+            return self.send(200, {"token": state["token"]})
+        if self.headers.get("Authorization") != state["token"]:
+            return self.send(401)
+        if state["statuses"]:
+            return self.send(state["statuses"].pop(0))
+        if self.headers.get("Content-Encoding") == "gzip" and state["gzip_response"]:
+            return self.send(*state["gzip_response"])
+        self.send(200, {"entity": {"id": "1", "json": {"FixtureID": {"10": 3, "2": 1}, "B365H": {"10": "2.1", "2": "1.5"},
+                                                      "Date": {"10": "2020-09-19", "2": "2020-09-12"},
+                                                      "HomeTeam": {"10": "Arsenal", "2": "Fulham"},
+                                                      "BWH": {"10": None, "2": 1.5}}}})
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+
+
+@pytest.fixture
+def strudel():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    server.state = {"logins": 0, "token": None, "statuses": [], "requests": [],
+                    "gzip_response": None}
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    client = StrudelClient(credentials = {"username": "apple", "password": "apple"},
+                           base_url = "http://127.0.0.1:{}".format(server.server_address[1]), backoff_factor = 0)
+    yield client, server.state
+    client.session.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_is_retried_after_503(strudel):
+    client, state = strudel
+    state["statuses"] = [503, 503]
+    assert client.request("GET", "/iapi/mined-data/1").status_code == 200
+    assert state["requests"].count(("GET", "/iapi/mined-data/1")) == 3
+
+
+def test_only_idempotent_puts_are_retried(strudel):
+    client, state = strudel
+    state["statuses"] = [503]
+    assert client.request("PUT", "/iapi/predictions", json = {}).status_code == 200
+    assert state["requests"].count(("PUT", "/iapi/predictions")) == 2
+    # a second mined data upload would create a second record
+    state["statuses"] = [503]
+    assert client.request("PUT", "/iapi/mined-data", json = {}).status_code == 503
+    assert state["requests"].count(("PUT", "/iapi/mined-data")) == 1
+
+
+def test_logs_in_once_after_token_rotates(strudel):
+    client, state = strudel
+    assert client.request("GET", "/iapi/mined-data/1").status_code == 200
+    assert state["logins"] == 1
+    # STRUDEL rotates the token, e.g. it expired
+    state["token"] = "rotated"
+    responses = [client.request("GET", "/iapi/mined-data/1") for _ in range(3)]
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert state["logins"] == 2
+
+
+@pytest.mark.parametrize("gzip_response, falls_back", [((415,), True),
+                                                       ((400, {"error": "Unsupported Content-Encoding"}), True),
+                                                       ((400, {"error": "name is required"}), False)])
+def test_gzip_fallback_only_when_encoding_unsupported(strudel, gzip_response, falls_back):
+    client, state = strudel
+    state["gzip_response"] = gzip_response
+    response = client.put_json("/iapi/analytics", body = {"name": "plot"}, compress = True)
+    assert (response.status_code == 200) == falls_back
+    assert client.accepts_gzip != falls_back
+    assert state["requests"].count(("PUT", "/iapi/analytics")) == (2 if falls_back else 1)
+
+
+def test_unchanged_visualisation_points_to_earlier_upload(strudel, tmp_path):
+    plotly = pytest.importorskip("plotly.graph_objects")
+    client, state = strudel
+    credentials_filepath = str(tmp_path / "credentials.json")
+    with open(credentials_filepath, "w") as credentials_file:
+        json.dump(client.credentials, credentials_file)
+    strudel_interface = StrudelInterface(credentials_filepath = credentials_filepath, base_url = client.base_url)
+    html_filepath = str(tmp_path / "weekly_winner.html")
+    figure = plotly.Figure(plotly.Bar(x = ["AB", "APPLE"], y = [3, 4]))
+    uploads = []
+    for request_id in ["r1", "r2"]:
+        # plotly gives the plot a new div id each time it is written
+        figure.write_html(html_filepath, include_plotlyjs = "cdn", full_html = False)
+        uploads.append(strudel_interface.return_visualisations_bulk(html_filepaths = [html_filepath], notes = "notes",
+                                                                    request_id = request_id))
+    assert uploads[0] == uploads[1]
+    assert uploads[0]["weekly_winner"].endswith("_r1")
+    assert state["requests"].count(("PUT", "/iapi/analytics")) == 1
+
+
+def test_mined_data_matches_saved_json(strudel, tmp_path):
+    client, state = strudel
+    credentials_filepath = str(tmp_path / "credentials.json")
+    with open(credentials_filepath, "w") as credentials_file:
+        json.dump(client.credentials, credentials_file)
+    strudel_interface = StrudelInterface(credentials_filepath = credentials_filepath, base_url = client.base_url)
+    output_filepath = str(tmp_path / "mined_data.json")
+    mined_data = strudel_interface.get_mined_data("1", output_filepath = output_filepath)
+    pd.testing.assert_frame_equal(mined_data, load_json_or_csv(output_filepath))
@@ -0,0 +1,49 @@
+"""
+Tests of hyperparameter sweeps, run with python -m pytest tests from the repository root
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+pytest.importorskip("torch")
+
+from core.sweep import Sweep, random_configs, grid_configs
+from core.train import Train
+
+
+def test_random_configs_are_distinct():
+    search_space = {"lr": [0.1, 0.01], "hidden_size": [5, 10, 20]}
+    configs = random_configs(search_space, n_trials = 6, seed = 1)
+    assert sorted(configs, key = str) == sorted(grid_configs(search_space), key = str)
+    assert len(random_configs(search_space, n_trials = 50)) == 6
+
+
+def fitted(lr: float, epochs: int) -> dict:
+    return {"history": (list(range(1, epochs + 1)), [100 * lr] * epochs, [lr] * epochs, [1 - lr] * epochs, epochs - 1)}
+
+
+def test_survivors_are_logged_when_budget_expires_between_rungs(tmp_path, monkeypatch):
+    def fit_model_with_seed(seed: int, train_kwargs: dict) -> dict:
+        # the time budget runs out once the first rung has finished, so no trial of the final rung starts
+        if train_kwargs["epochs"] > 1:
+            return None
+        return fitted(train_kwargs["lr"], train_kwargs["epochs"])
+
+    # trials are run in threads of this process so the training can be faked
+    monkeypatch.setattr("core.sweep.ProcessPoolExecutor",
+                        lambda max_workers, mp_context, initializer, initargs: ThreadPoolExecutor(max_workers))
+    monkeypatch.setattr("core.sweep.fit_model_with_seed", fit_model_with_seed)
+    logged = []
+    monkeypatch.setattr(Sweep, "_log_trial",
+                        lambda self, trial, fitted, epochs, log: logged.append((trial, epochs)) or "m" + str(trial))
+
+    trainer = Train.__new__(Train)
+    trainer.path = str(tmp_path)
+    trainer.raw_data_combined = None
+    sweep = Sweep(search_space = {"lr": [0.1, 0.2, 0.3]}, min_epochs = 1, max_epochs = 3, reduction_factor = 3,
+                  workers = 2, trainer = trainer)
+    results = sweep.run(verbose = False, time_budget = 3600)
+    # the best configuration of the first rung survived it, it is logged with its first rung model
+    assert logged == [(2, 1)]
+    assert results["Model ID"].iloc[0] == "m2"
+    assert results["Model ID"].iloc[1:].isna().all()
@@ -0,0 +1,494 @@
+"""
+Utilities used by the REST API (main.py)
+"""
+
+from collections import OrderedDict
+from contextlib import closing
+from itertools import islice
+from threading import Condition, Event, Lock, RLock, Thread
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+# states a task moves through. A running task is leased by the worker running it, if the lease isn't renewed (e.g. the
+# process running it died) the task is run again by the next worker to claim a task
+task_states = ("queued", "running", "done")
+
+_task_schema = """
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT UNIQUE NOT NULL,
+    state TEXT NOT NULL,
+    task_status TEXT,
+    payload TEXT NOT NULL,
+    submitted REAL,
+    updated REAL,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, seq);
+CREATE INDEX IF NOT EXISTS tasks_state_updated ON tasks (state, updated);
+"""
+
+# columns added since the tasks table was first created, added to existing databases when a queue is created
+_task_lease_columns = {"owner": "TEXT", "lease_expires": "REAL"}
+
+
+class TTLCache(object):
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        """
+        Thread safe LRU cache whose entries expire ttl seconds after they are set
+        :param ttl: float
+                seconds entries are valid for
+        :param max_size: int
+                OPTIONAL - maximum number of entries, once exceeded the least recently used entry is evicted
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        # key to (expiry, value), in least recently used order
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default = None):
+        """
+        :param key:
+                key of the entry
+        :param default:
+                OPTIONAL - returned if there is no valid entry for key
+        :return:
+                value of the entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None) -> None:
+        """
+        Method to set an entry, entries with a ttl of 0 or less are not cached
+        :param key:
+                key of the entry
+        :param value:
+                value of the entry
+        :param ttl: float
+                OPTIONAL - seconds this entry is valid for if less than the cache's ttl, e.g. until a token expires
+        :return: nothing
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            if ttl <= 0:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last = False)
+
+    def invalidate(self, key) -> None:
+        """
+        Method to remove an entry
+        :param key:
+                key of the entry
+        :return: nothing
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Method to remove all entries
+        :return: nothing
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class RequestStore(object):
+
+    def __init__(self, id_key: str, status_key: str, completed_statuses: tuple, ttl: float = 86400.0):
+        """
+        Thread safe in memory store of API requests indexed by their ID. Completed requests are evicted once they
+        have been complete for ttl seconds
+        :param id_key: str
+                key of the ID in each request dict, e.g. "request_id"
+        :param status_key: str
+                key of the status in each request dict, e.g. "request_status"
+        :param completed_statuses: tuple of str
+                statuses a request is complete in, e.g. ("Complete", "Error")
+        :param ttl: float
+                OPTIONAL - seconds completed requests are kept for, default is 1 day
+        """
+        self.id_key = id_key
+        self.status_key = status_key
+        self.completed_statuses = tuple(completed_statuses)
+        self.ttl = ttl
+        # requests in the order they were added, and completed request IDs in the order they were completed
+        self._requests = OrderedDict()
+        self._completed = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        with self._lock:
+            self._evict_expired()
+            return len(self._requests)
+
+    def __contains__(self, request_id: str):
+        with self._lock:
+            self._evict_expired()
+            return request_id in self._requests
+
+    def _evict_expired(self) -> None:
+        # completed requests are in completion order so only the expired ones are visited
+        expiry = time.monotonic() - self.ttl
+        while self._completed:
+            request_id, completed = next(iter(self._completed.items()))
+            if completed > expiry:
+                break
+            del self._completed[request_id]
+            del self._requests[request_id]
+
+    def add(self, request: dict) -> dict:
+        """
+        Method to add a request to the store
+        :param request: dict
+                request details, must contain the id key
+        :return: dict
+                copy of the stored request
+        """
+        with self._lock:
+            self._evict_expired()
+            self._requests[request[self.id_key]] = dict(request)
+            self._completed.pop(request[self.id_key], None)
+            return dict(request)
+
+    def get(self, request_id: str) -> dict:
+        """
+        :param request_id: str
+                ID of the request to return
+        :return: dict
+                copy of the request, or None if there is no request with the ID
+        """
+        with self._lock:
+            self._evict_expired()
+            request = self._requests.get(request_id)
+            return None if request is None else dict(request)
+
+    def update(self, request_id: str, fields: dict) -> None:
+        """
+        Method to update a request, does nothing if there is no request with the ID (e.g. it has been evicted)
+        :param request_id: str
+                ID of the request to update
+        :param fields: dict
+                keys and values to set on the request
+        :return: nothing
+        """
+        with self._lock:
+            request = self._requests.get(request_id)
+            if request is None:
+                return
+            request.update(fields)
+            if self.status_key in fields:
+                self._completed.pop(request_id, None)
+                if request[self.status_key] in self.completed_statuses:
+                    self._completed[request_id] = time.monotonic()
+
+    def page(self, offset: int = 0, limit: int = None) -> tuple:
+        """
+        Method to list requests in the order they were added
+        :param offset: int
+                OPTIONAL - number of requests to skip
+        :param limit: int
+                OPTIONAL - maximum number of requests to return, all are returned if not passed
+        :return: tuple
+                list of copies of the requests and the total number of requests in the store
+        """
+        with self._lock:
+            self._evict_expired()
+            stop = None if limit is None else offset + limit
+            return [dict(request) for request in islice(self._requests.values(), offset, stop)], len(self._requests)
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a task is submitted to a task queue that already holds its maximum number of queued tasks
+    """
+    pass
+
+
+class TaskQueue(object):
+
+    def __init__(self, db_loc: str, handler, workers: int = 1, max_queued: int = 100, done_ttl: float = 86400.0,
+                 timeout: float = 30.0, lease: float = 60.0):
+        """
+        Task queue persisted in SQLite, tasks are run by a fixed pool of worker threads in the order they were
+        submitted
+        :param db_loc: str
+                filepath of the SQLite database the queue is persisted in, created if required
+        :param handler: callable
+                called by a worker with the task dict and the queue, handler(task, task_queue), to run a task
+        :param workers: int
+                OPTIONAL - number of tasks run at once, default is 1
+        :param max_queued: int
+                OPTIONAL - maximum number of tasks waiting to run, further submissions raise QueueFullError
+        :param done_ttl: float
+                OPTIONAL - seconds done tasks are kept for, default is 1 day
+        :param timeout: float
+                OPTIONAL - seconds to wait for other connections writing to the queue
+        :param lease: float
+                OPTIONAL - seconds a running task is leased to the worker running it, renewed while it runs. Tasks
+                whose lease has expired are run again, by this or any other process sharing the database
+        """
+        if workers < 1:
+            raise ValueError("ValueError: task queue requires at least 1 worker")
+        db_dir = os.path.dirname(db_loc)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.db_loc = db_loc
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.done_ttl = done_ttl
+        self.timeout = timeout
+        self.lease = lease
+        # unique to this queue, so leases held by other processes sharing the database are left alone
+        self.owner = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._threads = []
+        self._start_lock = Lock()
+        self._stop = Event()
+        self._task_available = Condition()
+
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_task_schema)
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(tasks)")]
+            for column, column_type in _task_lease_columns.items():
+                if column not in columns:
+                    connection.execute("ALTER TABLE tasks ADD COLUMN {} {}".format(column, column_type))
+        self.evict_done()
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode, transactions are opened explicitly so writes are atomic
+        return sqlite3.connect(self.db_loc, timeout = self.timeout, isolation_level = None)
+
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rowcount = connection.execute(sql, params).rowcount
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return rowcount
+
+    @staticmethod
+    def _to_task(row: tuple) -> dict:
+        task_id, state, task_status, payload = row
+        return dict(json.loads(payload), task_id = task_id, state = state, task_status = task_status)
+
+    def submit(self, task: dict) -> dict:
+        """
+        Method to add a task to the end of the queue
+        :param task: dict
+                task details, must contain a unique "task_id" and be json serializable
+        :return: dict
+                the queued task
+        """
+        payload = {k: v for k, v in task.items() if k not in ("task_id", "state", "task_status")}
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                queued = connection.execute("SELECT COUNT(*) FROM tasks WHERE state = 'queued'").fetchone()[0]
+                if self.max_queued is not None and queued >= self.max_queued:
+                    raise QueueFullError("Task queue is full, {} tasks are waiting to run".format(queued))
+                now = time.time()
+                connection.execute("INSERT INTO tasks (task_id, state, task_status, payload, submitted, updated) "
+                                   "VALUES (?, 'queued', 'Queued', ?, ?, ?)",
+                                   (task["task_id"], json.dumps(payload), now, now))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        with self._task_available:
+            self._task_available.notify()
+        return self.get(task["task_id"])
+
+    def update_status(self, task_id: str, task_status: str) -> None:
+        """
+        Method to update the human readable status of a task, e.g. "Making predictions"
+        :param task_id: str
+                Task ID of the task to update
+        :param task_status: str
+                What to update the status to
+        :return: nothing
+        """
+        self._write("UPDATE tasks SET task_status = ?, updated = ? WHERE task_id = ?",
+                    (task_status, time.time(), task_id))
+
+    def add_to_task(self, task_id: str, fields: dict) -> None:
+        """
+        Method to add fields to the details of a task, e.g. the results of running it
+        :param task_id: str
+                Task ID of the task to update
+        :param fields: dict
+                fields to add, must be json serializable
+        :return: nothing
+        """
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT payload FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+                if row is not None:
+                    fields = {k: v for k, v in fields.items() if k not in ("task_id", "state", "task_status")}
+                    connection.execute("UPDATE tasks SET payload = ?, updated = ? WHERE task_id = ?",
+                                       (json.dumps(dict(json.loads(row[0]), **fields)), time.time(), task_id))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def get(self, task_id: str) -> dict:
+        """
+        :param task_id: str
+                Task ID of the task to return
+        :return: dict
+                the task, or None if there is no task with the id
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT task_id, state, task_status, payload FROM tasks WHERE task_id = ?",
+                                     (task_id,)).fetchone()
+        return None if row is None else self._to_task(row)
+
+    def page(self, offset: int = 0, limit: int = None) -> tuple:
+        """
+        Method to list tasks in the order they were submitted
+        :param offset: int
+                OPTIONAL - number of tasks to skip
+        :param limit: int
+                OPTIONAL - maximum number of tasks to return, all are returned if not passed
+        :return: tuple
+                list of tasks and the total number of tasks
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT task_id, state, task_status, payload FROM tasks ORDER BY seq "
+                                      "LIMIT ? OFFSET ?", (-1 if limit is None else limit, offset)).fetchall()
+            total = connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        return [self._to_task(row) for row in rows], total
+
+    def all(self) -> list:
+        """
+        :return: list of dict
+                every task, in the order they were submitted
+        """
+        return self.page()[0]
+
+    def evict_done(self) -> int:
+        """
+        Method to remove tasks that have been done for longer than done_ttl
+        :return: int
+                number of tasks removed
+        """
+        return self._write("DELETE FROM tasks WHERE state = 'done' AND updated < ?", (time.time() - self.done_ttl,))
+
+    def counts(self) -> dict:
+        """
+        :return: dict
+                number of tasks in each state
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+        return dict({state: 0 for state in task_states}, **dict(rows))
+
+    def _claim(self) -> dict:
+        # atomically lease the oldest queued task, or running task whose lease has expired, so each task is only run
+        # by one worker at a time
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = connection.execute("SELECT task_id, state, task_status, payload FROM tasks "
+                                         "WHERE state = 'queued' OR (state = 'running' AND "
+                                         "(lease_expires IS NULL OR lease_expires < ?)) ORDER BY seq LIMIT 1",
+                                         (now,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE tasks SET state = 'running', task_status = 'Running', updated = ?, "
+                                       "owner = ?, lease_expires = ? WHERE task_id = ?",
+                                       (now, self.owner, now + self.lease, row[0]))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return None if row is None else dict(self._to_task(row), state = "running", task_status = "Running")
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            task = self._claim()
+            if task is None:
+                # sleep until a task is submitted, polling in case it was submitted by another process
+                with self._task_available:
+                    self._task_available.wait(timeout = 5)
+                continue
+            try:
+                self.handler(task, self)
+            except Exception as e:
+                self.update_status(task["task_id"], "Failed: " + str(e))
+            finally:
+                # unless the lease was lost and the task claimed by another worker
+                self._write("UPDATE tasks SET state = 'done', updated = ?, lease_expires = NULL "
+                            "WHERE task_id = ? AND owner = ?", (time.time(), task["task_id"], self.owner))
+                self.evict_done()
+
+    def renew_leases(self) -> int:
+        """
+        Method to renew the leases of the tasks this queue is running
+        :return: int
+                number of leases renewed
+        """
+        return self._write("UPDATE tasks SET lease_expires = ? WHERE state = 'running' AND owner = ?",
+                           (time.time() + self.lease, self.owner))
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(timeout = self.lease / 3):
+            self.renew_leases()
+
+    def start(self) -> None:
+        """
+        Method to start the worker threads, does nothing if they are already running
+        :return: nothing
+        """
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [Thread(target = self._work, name = "task-worker-{}".format(i), daemon = True)
+                             for i in range(self.workers)]
+            self._threads.append(Thread(target = self._heartbeat, name = "task-heartbeat", daemon = True))
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Method to stop the worker threads once they have finished their current task
+        :param timeout: float
+                OPTIONAL - seconds to wait for each worker to finish
+        :return: nothing
+        """
+        self._stop.set()
+        with self._task_available:
+            self._task_available.notify_all()
+        with self._start_lock:
+            for thread in self._threads:
+                thread.join(timeout = timeout)
+            self._threads = []
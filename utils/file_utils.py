@@ -0,0 +1,67 @@
+"""
+Utilities for writing files that other threads or processes may be reading or writing at the same time
+"""
+
+from contextlib import contextmanager
+import os
+import tempfile
+try:
+    import fcntl
+except ImportError:
+    # not available on windows, file_lock then only locks within the process
+    fcntl = None
+
+
+@contextmanager
+def atomic_path(filepath: str):
+    """
+    Context manager giving a unique temporary filepath next to filepath, which replaces filepath once the block
+    completes. Readers see either the old or the new file, and concurrent writers never share a temporary file
+    :param filepath: str
+            filepath to write
+    :return: str
+            temporary filepath to write to
+    """
+    directory, filename = os.path.split(os.path.abspath(filepath))
+    fd, tmp_filepath = tempfile.mkstemp(dir = directory, prefix = "." + filename + ".", suffix = ".tmp")
+    os.close(fd)
+    try:
+        yield tmp_filepath
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+def write_atomic(filepath: str, contents: bytes) -> None:
+    """
+    Def to write a file atomically, see atomic_path
+    :param filepath: str
+            filepath to write
+    :param contents: bytes
+            contents of the file
+    :return: nothing
+    """
+    with atomic_path(filepath) as tmp_filepath:
+        with open(tmp_filepath, "wb") as tmp_file:
+            tmp_file.write(contents)
+
+
+@contextmanager
+def file_lock(lock_filepath: str):
+    """
+    Context manager holding an exclusive lock on lock_filepath (created if required) for the duration of the block,
+    so only one process at a time runs it
+    :param lock_filepath: str
+            filepath of the lock file
+    :return: nothing
+    """
+    with open(lock_filepath, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)